@@ -1,8 +1,15 @@
 """Module for code analysis functionality
 """
 from .llvm_passes import LLVMAnalyzer
-from .clang_analyzer import (ClangAnalyzer, FlagListFilter, analyze_main,
-                             interpret_plist_reports,
+from .clang_analyzer import (ANALYZER_OPTIONS_ENV, ClangAnalyzer,
+                             FlagListFilter, analyze_main,
+                             analysis_configuration, interpret_plist_reports,
                              interpret_plist_report)
+from .deduplication import IssueIndex, deduplicate_vulnerabilities
+from .results import RESULT_STORE_ENV, ResultStore
+from .sharding import merge_llvm_reports, merge_main, merge_reports
 __all__ = ['LLVMAnalyzer', 'ClangAnalyzer', 'FlagListFilter', 'analyze_main',
-           'interpret_plist_reports', 'interpret_plist_report']
+           'interpret_plist_reports', 'interpret_plist_report', 'IssueIndex',
+           'deduplicate_vulnerabilities', 'merge_main', 'merge_reports',
+           'merge_llvm_reports', 'ResultStore', 'RESULT_STORE_ENV',
+           'analysis_configuration', 'ANALYZER_OPTIONS_ENV']
@@ -0,0 +1,141 @@
+"""Module restricting ci-vulnscan to the translation units and findings
+affected by a change (e.g. of a merge request)
+
+"""
+import logging
+import os
+import re
+import subprocess
+
+LOGGER = logging.getLogger(name=__name__)
+
+HUNK_REGEX = re.compile(r"^@@ -[0-9,]+ \+([0-9]+)(?:,([0-9]+))? @@")
+
+__all__ = ['ChangeSet', 'affected_compilations', 'filter_vulnerabilities']
+
+
+class ChangeSet(object):
+    """Changed files and, if known, their changed lines"""
+
+    def __init__(self, changes=None):
+        """Initialization.
+
+        :param changes: dict of absolute path -> list of (first, last) line
+            ranges, None if the whole file is considered changed
+        """
+        self.changes = changes or {}
+
+    @classmethod
+    def from_list(cls, file):
+        """Reads a list of changed files (one per line), the whole files are
+        considered changed"""
+        with open(file, "r") as handle:
+            return cls({os.path.abspath(line.strip()): None
+                        for line in handle if line.strip()})
+
+    @classmethod
+    def from_git(cls, revisions, cwd=None):
+        """Reads the changed lines of a git revision range (e.g. master..HEAD)
+
+        Deleted lines are a change of the lines around them, deleted files
+        are changed as a whole (the TUs including them are affected).
+        """
+        top = subprocess.check_output(
+            ["git", "rev-parse", "--show-toplevel"],
+            cwd=cwd).decode("utf-8").strip()
+        diff = subprocess.check_output(
+            ["git", "diff", "--unified=0", "--no-color", "--no-renames",
+             revisions], cwd=cwd).decode("utf-8", errors="replace")
+
+        def path(name, prefix):
+            """Returns the path of a file of the diff"""
+            return os.path.join(top, name[2:] if name.startswith(prefix)
+                                else name)
+
+        changes = {}
+        current = deleted = None
+        for line in diff.splitlines():
+            if line.startswith("--- "):
+                deleted = line[4:]
+            elif line.startswith("+++ "):
+                name = line[4:]
+                current = None
+                if name != "/dev/null":
+                    current = path(name, "b/")
+                    changes.setdefault(current, [])
+                elif deleted != "/dev/null":
+                    changes[path(deleted, "a/")] = None
+            elif line.startswith("@@") and current is not None:
+                match = HUNK_REGEX.match(line)
+                if match:
+                    first = int(match.group(1))
+                    count = int(match.group(2) or 1)
+                    if count:
+                        changes[current].append((first, first + count - 1))
+                    else:
+                        # lines were deleted after line first
+                        changes[current].append((max(first, 1), first + 1))
+        return cls(changes)
+
+    @classmethod
+    def parse(cls, value):
+        """Creates a ChangeSet from a file listing changed files or from a git
+        revision range"""
+        if os.path.isfile(value):
+            return cls.from_list(value)
+        return cls.from_git(value)
+
+    @property
+    def files(self):
+        """All changed files"""
+        return set(self.changes)
+
+    def __contains__(self, location):
+        """Returns True if a location (dict with file and line) changed"""
+        file = os.path.abspath(location.get("file", ""))
+        if file not in self.changes:
+            return False
+        ranges = self.changes[file]
+        if ranges is None:
+            return True
+        line = location.get("line", 0)
+        return any(first <= line <= last for first, last in ranges)
+
+
+def affected_compilations(compilations, changes, index=None):
+    """Returns the compilations affected by the changes
+
+    Changed headers are resolved with the dependency index written by
+    ci-build. Without index every compilation is considered affected by a
+    changed header.
+    """
+    compilations = list(compilations)
+    sources = {entry.source for entry in compilations}
+    if index is None:
+        # compile imports analysis, hence the deferred import
+        from compile import DependencyIndex  # pylint: disable=cyclic-import
+        index = DependencyIndex()
+    if not index.units and changes.files - sources:
+        LOGGER.warning("No dependency index found, analyzing everything")
+        return compilations
+    affected = index.affected(changes.files) | (changes.files & sources)
+    return [entry for entry in compilations if entry.source in affected]
+
+
+def _path_locations(vulnerability):
+    """Yields all locations on the path of a vulnerability"""
+    for item in vulnerability.get("path", []):
+        if "location" in item:
+            yield item["location"]
+        for edge in item.get("edges", []):
+            for pos in ["start", "end"]:
+                yield from edge[pos]
+
+
+def filter_vulnerabilities(vulnerabilities, changes):
+    """Returns the vulnerabilities located in changed lines or with a path
+    through changed lines"""
+    return [vulnerability for vulnerability in vulnerabilities
+            if vulnerability.get("location", {}) in changes or
+            any(location in changes
+                for location in _path_locations(vulnerability))]
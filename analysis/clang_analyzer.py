@@ -1,7 +1,8 @@
 """Module providing functionality on clang static code analyzer
 
 """
-import argparse  # noqa: ignore=F401 pylint: disable=unused-import
+import argparse
+import functools
 import glob
 import json
 import logging
@@ -11,22 +12,44 @@ import os
 import re
 import sys
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from shutil import which
 from typing import Any, Dict  # noqa: ignore=F401 pylint: disable=unused-import
+from xml.parsers.expat import ExpatError
 
 import jsonschema
 
 from libscanbuild import analyze, arguments, compilation, reconfigure_logging
 
-from settings import (SA_VULNERABILITY_SCHEMA, CI_REPORT_FILE, CLANG, ROOT_DIR,
+from settings import (SA_VULNERABILITY_SCHEMA, CI_REPORT_FILE,
+                      CI_REPORT_STATUS_FILE, CHECKER_PROFILE_FILE, CLANG,
+                      LLVM_REPORT_FILE, ROOT_DIR,
                       REQUIRED_CLANG_VERSION, CHECKER_PATH, command_entry_point,
                       CLANG_VERSION)
 
+from storage import JsonStore, file_digest
+
+from .changes import ChangeSet, affected_compilations, filter_vulnerabilities
+from .ctu import CtuIndex, ctu_error
+from .deduplication import IssueIndex
+from .llvm_passes import LLVMAnalyzer
+from .profiling import CheckerProfile
+from .results import ResultStore
+from .scheduling import run_analyzer_parallel
+from .sharding import parse_shard, select_shard, shard_file_name
+from .tiers import run_tiered
+
 LOGGER = logging.getLogger(name=__name__)
 
 with open(SA_VULNERABILITY_SCHEMA, 'r') as schema:
     VULNERABILITY_SCHEMA = json.load(schema)
 
 OPTION_FLAG_REGEX = re.compile(r"^--?(\w[\w|-]*)=(\w[\w|-]*)$")
+WARNING_FLAG_REGEX = re.compile(r"^-W.+")
+NO_WARNING_FLAG_REGEX = re.compile(r"^-Wno-.+")
+# number of distinct flag lists whose filter results are kept (per process)
+FLAG_CACHE_SIZE = 1024
 ACTIVATED_CHECKERS = [
     'alpha.core',
     'alpha.unix',
@@ -39,10 +62,19 @@ ACTIVATED_CHECKERS = [
 DISABLED_CHECKERS = [
     'deadcode'
 ]
+# options of ci-vulnscan changing the findings of the analysis of a TU, the
+# build-time analysis runs with the same ones
+ANALYZER_OPTIONS = ('store_model', 'constraints_model', 'analyze_headers',
+                    'maxloop', 'analyzer_config', 'plugins', 'enable_checker',
+                    'disable_checker', 'ctu')
+# passes the analyzer options of ci-build --analyze to ci-cc
+ANALYZER_OPTIONS_ENV = "CI_ANALYZER_OPTIONS"
 
 
-__all__ = ['analyze_main', 'ClangAnalyzer', 'FlagListFilter',
-           'interpret_plist_report', 'interpret_plist_reports']
+__all__ = ['analyze_main', 'analysis_configuration', 'analyzer_options',
+           'ANALYZER_OPTIONS_ENV', 'ClangAnalyzer', 'FlagListFilter',
+           'interpret_plist', 'interpret_plist_report',
+           'interpret_plist_reports']
 
 
 @analyze.require(['flags'])
@@ -50,8 +82,10 @@ def classify_parameters(opts, continuation=analyze.arch_check):
     # type: (...) -> Dict[str, Any]
     """ Prepare compiler flags (filters some and add others) and take out
     language (-x) and architecture (-arch) flags for future processing. """
-    flag_filter = FlagListFilter(opts['flags'])
-    opts.update(flag_filter.results)
+    results = filter_flags(tuple(opts['flags']))
+    # the cached results are shared, the continuations must not modify them
+    opts.update({key: list(value) if isinstance(value, list) else value
+                 for key, value in results.items()})
     return continuation(opts)
 
 
@@ -84,7 +118,50 @@ def run(opts):
     command = [opts['compiler'], '-c'] + opts['flags'] + [opts['source']]
     logging.info("Analyzing '%s'", opts['source'])
     logging.debug("Command '%s'", " ".join(command))
-    return analyze.exclude(opts)
+    if not opts['output_format'].startswith('plist'):
+        return analyze.exclude(opts)
+    # clang reports the files by the paths of the compilation, hence the
+    # reports of a TU are written to a directory of their own and resolved
+    output_dir = tempfile.mkdtemp(prefix='tu-', dir=opts['output_dir'])
+    try:
+        return analyze.exclude(dict(opts, output_dir=output_dir))
+    finally:
+        _collect_reports(output_dir, opts['output_dir'], opts['directory'])
+        os.rmdir(output_dir)
+
+
+def _absolute_files(report, directory):
+    """Resolves the relative file paths of a loaded plist report against the
+    directory of its compilation, returns True if any was relative"""
+    files = [os.path.normpath(os.path.join(directory, name))
+             for name in report.get('files', [])]
+    changed = files != report.get('files', [])
+    report['files'] = files
+    return changed
+
+
+def _collect_reports(source, target, directory):
+    """Moves the reports of a TU to the report directory, the file paths of
+    the plist reports are resolved against the directory of the compilation
+    (None for subdirectories, e.g. the failure reports)"""
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isdir(path):
+            os.makedirs(os.path.join(target, name), exist_ok=True)
+            _collect_reports(path, os.path.join(target, name), None)
+            os.rmdir(path)
+            continue
+        if directory is not None and name.endswith('.plist'):
+            try:
+                with open(path, 'rb') as handle:
+                    report = plistlib.load(handle)
+                if _absolute_files(report, directory):
+                    with open(path, 'wb') as handle:
+                        plistlib.dump(report, handle)
+            except (OSError, ValueError, ExpatError):
+                # interpret_plist_reports reports the invalid ones
+                pass
+        os.replace(path, os.path.join(target, name))
 
 
 # Monkey patch run to get info
@@ -98,45 +175,98 @@ analyze.exclude.__globals__['classify_parameters'] = classify_parameters
 analyze.exclude.__dict__['__wrapped__'].__defaults__ = (classify_parameters,)
 
 
+def analyzer_options(args):
+    """Returns the options of parsed ci-vulnscan arguments which change the
+    findings of an analysis (JSON compatible)"""
+    options = {name: getattr(args, name, None) for name in ANALYZER_OPTIONS}
+    options['plugins'] = [os.path.abspath(plugin)
+                          for plugin in options['plugins'] or []]
+    return options
+
+
+def analyzer_arguments(options):
+    """Returns the clang arguments analyzing with the options of ci-vulnscan
+
+    :param options: see analyzer_options
+    """
+    arguments = []
+    if options.get('store_model'):
+        arguments.append('-analyzer-store=' + options['store_model'])
+    if options.get('constraints_model'):
+        arguments.append('-analyzer-constraints=' +
+                         options['constraints_model'])
+    if options.get('analyze_headers'):
+        arguments.append('-analyzer-opt-analyze-headers')
+    if options.get('maxloop'):
+        arguments.extend(['-analyzer-max-loop', str(options['maxloop'])])
+    if options.get('analyzer_config'):
+        arguments.extend(['-analyzer-config', options['analyzer_config']])
+    for plugin in options.get('plugins') or []:
+        arguments.extend(['-load', plugin])
+    if options.get('enable_checker'):
+        arguments.extend(['-analyzer-checker',
+                          ','.join(options['enable_checker'])])
+    if options.get('disable_checker'):
+        arguments.extend(['-analyzer-disable-checker',
+                          ','.join(options['disable_checker'])])
+    return [item for argument in arguments for item in ['-Xclang', argument]]
+
+
+def analysis_configuration(options):
+    """Returns the configuration of the build-time analysis: the clang
+    binary, the digests of the checker plugins and the analyzer arguments
+
+    :param options: see analyzer_options
+    """
+    return {
+        'clang': clang_identity(),
+        'plugins': {plugin: file_digest(plugin)
+                    for plugin in options.get('plugins') or []},
+        'arguments': analyzer_arguments(options),
+        'ctu': bool(options.get('ctu'))
+    }
+
+
 class ClangAnalyzer(object):
     """Clang static analyzer wrapper
     """
 
-    def __init__(self, cmd):
-        self.cmd = cmd + ["-c", "-o-", "--analyze", "--analyze-auto"]
+    def __init__(self, cmd, options=None):
+        """Initialization.
+
+        :param cmd: compiler command
+        :param options: analyzer options (see analyzer_options), defaults to
+            the ones of ci-vulnscan without arguments
+        """
+        self.options = self.parse_analyzer_options([]) if options is None \
+            else options
+        self.cmd = cmd + ["-c", "-o-", "--analyze", "--analyze-auto"] + \
+            analyzer_arguments(self.options)
         self._vulnerabilities = []
 
+    @property
+    def vulnerabilities(self):
+        """All vulnerabilities found by this analyzer so far"""
+        return self._vulnerabilities
+
     def run(self, src):
         """Analyzes a source code file with the clang static code analyzer
 
-        "/usr/share/clang/scan-build-5.0/libexec/ccc-analyzer"
+        :param src: source file
+        :return: vulnerabilities found in src in the format of the ci-report,
+            None if the analysis failed
         """
-
-        cmd = self.cmd
-        cmd.append(src)
-
         proc = subprocess.run(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.cmd + [src], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         if proc.returncode != 0:
-            LOGGER.warning(proc.stderr)
-            return proc.returncode
-
-        obj = plistlib.loads(proc.stdout)
-        if obj["files"]:
-            for diag in obj['diagnostics']:
-                vuln = {
-                    "name": diag["description"],
-                    "category": diag["category"],
-                    "file": obj["files"][diag["location"]["file"]],
-                    "steps": []
-                }
-                for path in diag["path"]:
-                    path = {
-                        "type": path["kind"],
-                    }
-                    vuln["steps"].append(path)
-
-        return proc
+            LOGGER.warning(proc.stderr.decode('utf-8', errors='replace'))
+            return None
+
+        report = plistlib.loads(proc.stdout)
+        _absolute_files(report, os.getcwd())
+        vulnerabilities = interpret_plist(report)
+        self._vulnerabilities.extend(vulnerabilities)
+        return vulnerabilities
 
     @staticmethod
     def create_analyze_parser():
@@ -282,6 +412,82 @@ class ClangAnalyzer(object):
             Switch the page naming to:
             report-<filename>-<function/method name>-<id>.html
             instead of report-XXXXXX.html""")
+        advanced.add_argument(
+            '--shard',
+            metavar='<i/N>',
+            type=parse_shard,
+            help="""Only analyze the i-th of N size-balanced shards of the
+            compilation database and write the report to
+            ci-report-i-of-N.json. Use ci-vulnscan-merge to combine the shard
+            reports.""")
+        advanced.add_argument(
+            '--deadline',
+            metavar='<seconds>',
+            type=float,
+            help="""Stop the analysis after the given number of seconds. TUs
+            not analyzed in time are listed in the status report.""")
+        advanced.add_argument(
+            '--tu-budget',
+            metavar='<seconds>',
+            type=float,
+            help="""Expected maximum analysis time of a single TU. TUs which
+            took longer in previous runs are analyzed with a lower loop count,
+            TUs taking much longer are killed.""")
+        advanced.add_argument(
+            '--changed-files',
+            metavar='<list|git range>',
+            help="""Only analyze the TUs affected by a change, given either as
+            file listing the changed files or as git revision range (e.g.
+            origin/master..HEAD). Changed headers are resolved with the
+            dependency index written by ci-build. Only findings located in or
+            with a path through changed lines are reported.""")
+        advanced.add_argument(
+            '--tiered',
+            action='store_true',
+            help="""Run the cheap checkers against all TUs and the expensive
+            alpha and taint checkers only against TUs with findings of the
+            cheap checkers, recently changed TUs and allowlisted ones.""")
+        advanced.add_argument(
+            '--expensive-allowlist',
+            metavar='<file>',
+            help="""File with source patterns (one per line) always analyzed
+            by the expensive checkers in tiered mode.""")
+        advanced.add_argument(
+            '--profile-checkers',
+            action='store_true',
+            help="""Collect the analyzer statistics of every TU, analyze the
+            slowest TUs again without each of the enabled checkers and write
+            the time attributed to every checker to
+            ci-checker-profile.json.""")
+        advanced.add_argument(
+            '--ctu',
+            action='store_true',
+            help="""Cross translation unit analysis: function definitions of
+            other TUs are inlined into the analysis. The AST dumps of the TUs
+            are cached between runs. Requires clang >= 7.0 and
+            clang-func-mapping.""")
+        advanced.add_argument(
+            '--from-build',
+            action='store_true',
+            help="""Reuse the findings of the build-time analysis (ci-build
+            --analyze) for TUs whose source and headers did not change since,
+            only the remaining TUs are analyzed.""")
+        advanced.add_argument(
+            '--llvm-passes',
+            action='store_true',
+            help="""Additionally run the LLVM passes against the bitcode of
+            every TU built by ci-build and write their findings to
+            ci-llvm-report.json.""")
+        advanced.add_argument(
+            '--whole-program',
+            action='store_true',
+            help="""Run the LLVM passes once per binary against its linked
+            bitcode instead of once per TU (requires --llvm-passes).""")
+        advanced.add_argument(
+            '--recheck-compatibility',
+            action='store_true',
+            help="""Ignore the cached checker compatibility results and load
+            every checker plugin into clang again.""")
         advanced.add_argument(
             '--force-analyze-debug-code',
             dest='force_debug',
@@ -301,7 +507,7 @@ class ClangAnalyzer(object):
             '--enable-checker',
             '-enable-checker',
             metavar='<checker name>',
-            default=ACTIVATED_CHECKERS,
+            default=list(ACTIVATED_CHECKERS),
             action=arguments.AppendCommaSeparated,
             help="""Enable specific checker.""")
         plugins.add_argument(
@@ -309,7 +515,7 @@ class ClangAnalyzer(object):
             '-disable-checker',
             metavar='<checker name>',
             action=arguments.AppendCommaSeparated,
-            default=DISABLED_CHECKERS,
+            default=list(DISABLED_CHECKERS),
             help="""Disable specific checker.""")
         plugins.add_argument(
             '--help-checkers',
@@ -340,39 +546,130 @@ class ClangAnalyzer(object):
             help="""used path where the analyzer tools are invoked """)
         args = parser.parse_args(args=args)
         os.chdir(args.cwd)
+        args.changes = None
+        if args.profile_checkers:
+            args.internal_stats = True
+        if args.ctu and ctu_error():
+            parser.error(ctu_error())
+        if args.whole_program and not args.llvm_passes:
+            parser.error("--whole-program requires --llvm-passes")
+        if args.ctu and args.from_build:
+            parser.error("--from-build cannot be combined with --ctu, the "
+                         "build-time analysis is limited to single TUs")
+        if args.changed_files:
+            try:
+                args.changes = ChangeSet.parse(args.changed_files)
+            except (OSError, subprocess.CalledProcessError) as err:
+                parser.error("cannot determine changed files of '{}': {}"
+                             .format(args.changed_files, err))
 
         reconfigure_logging(args.verbose)
         logging.debug('Raw arguments %s', sys.argv)
 
         from_build_command = False
         arguments.normalize_args_for_analyze(args, from_build_command)
-        libs = list(glob.iglob(os.path.join(CHECKER_PATH, "*.so")))
-        args.plugins.extend(libs)
-        args.enable_checker.extend(['ci.NetworkTaint'])
-        LOGGER.error(args.enable_checker)
+        cls.add_checkers(args)
         arguments.validate_args_for_analyze(parser, args, from_build_command)
         logging.debug('Parsed arguments: %s', args)
         return args
 
+    @staticmethod
+    def add_checkers(args):
+        """Loads the checker plugins into the analysis of parsed arguments
+        and enables the checkers of the plugins"""
+        args.plugins.extend(
+            sorted(glob.iglob(os.path.join(CHECKER_PATH, "*.so"))))
+        args.enable_checker.append('ci.NetworkTaint')
+
+    @classmethod
+    def parse_analyzer_options(cls, args=None):
+        """Parses ci-vulnscan arguments into the analyzer options of the
+        build-time analysis (see analyzer_options)"""
+        args = cls.create_analyze_parser().parse_args(args=args)
+        arguments.normalize_args_for_analyze(args, False)
+        cls.add_checkers(args)
+        return analyzer_options(args)
+
     @classmethod
     def analyze_build(cls, args):
         # type: () -> str
         """ Entry point for analyze-build command. """
 
-        args = cls.parse_args_for_analyze_build(args=args)
+        if not isinstance(args, argparse.Namespace):
+            args = cls.parse_args_for_analyze_build(args=args)
+        deadline = None
+        if args.deadline is not None:
+            deadline = time.monotonic() + args.deadline
         # Overwrite arguments with our custom settings
-        args.output = os.getcwd()
+        args.output = project = os.getcwd()
         args.output_format = 'plist-multi-file'
+        history = JsonStore('scan-history')
+        started = time.time()
 
         # will re-assign the report directory as new output
         with analyze.report_directory(args.output,
                                       args.keep_empty) as args.output:
             # run the analyzer against a compilation db
-            compilations = compilation.CompilationDatabase.load(args.cdb)
-            analyze.run_analyzer_parallel(compilations, args)
+            compilations = list(
+                compilation.CompilationDatabase.load(args.cdb))
+            # definitions may be in any TU, hence the whole database is indexed
+            ctu = cls.prepare_ctu(args, compilations) if args.ctu else None
+            if args.shard:
+                compilations = select_shard(compilations, args.shard)
+            if args.changes is not None:
+                compilations = affected_compilations(compilations,
+                                                     args.changes)
+            reused = ResultStore(configuration=analysis_configuration(
+                analyzer_options(args))).collect(
+                    compilations) if args.from_build else {}
+            compilations = [entry for entry in compilations
+                            if entry.source not in reused]
+            args.reused = [vulnerability for source in sorted(reused)
+                           for vulnerability in reused[source]]
+            profile = CheckerProfile() if args.profile_checkers else None
+            run = run_tiered if args.tiered else run_analyzer_parallel
+            try:
+                scheduler = run(compilations, args, deadline=deadline,
+                                changed_since=history.get(project),
+                                profile=profile)
+                if profile is not None:
+                    profile.ablate(compilations, args, deadline=deadline)
+                    profile.log()
+                    with open(shard_file_name(CHECKER_PROFILE_FILE,
+                                              args.shard),
+                              "w") as profile_file:
+                        json.dump(profile.report, profile_file, indent=1)
+            finally:
+                if ctu is not None:
+                    ctu.cleanup()
+            # partial scans must not hide changes from the next run
+            if scheduler.complete and args.changes is None:
+                history[project] = started
+                history.save()
+            status = scheduler.status
+            if ctu is not None:
+                status['ctu'] = ctu.statistics
+            if args.from_build:
+                status['reused'] = len(reused)
+            with open(shard_file_name(CI_REPORT_STATUS_FILE, args.shard),
+                      "w") as status_file:
+                json.dump(status, status_file, indent=1)
             # set exit status as it was requested
             return args.output
 
+    @staticmethod
+    def prepare_ctu(args, compilations):
+        """Builds the CTU index of the compilations and enables the CTU
+        analysis in args
+
+        :return: the CtuIndex, to be cleaned up after the analysis
+        """
+        ctu = CtuIndex(clang_identity(), clang=args.clang).build(compilations)
+        args.analyzer_config = ",".join(
+            config for config in [args.analyzer_config, ctu.analyzer_config]
+            if config)
+        return ctu
+
 
 class FlagListFilter(object):
     """Filters arguments to clang SA
@@ -415,18 +712,16 @@ class FlagListFilter(object):
                     next(args)
             # we don't care about extra warnings, but we should suppress ones
             # that we don't want to see.
-            elif re.match(r'^-W.+', arg) and not re.match(r'^-Wno-.+', arg):
+            elif WARNING_FLAG_REGEX.match(arg) and \
+                    not NO_WARNING_FLAG_REGEX.match(arg):
                 pass
-            elif OPTION_FLAG_REGEX.match(arg):
+            else:
                 match = OPTION_FLAG_REGEX.match(arg)
-                if match.group(1) in self._ignore_flags_patterns:
+                if match and match.group(1) in self._ignore_flags_patterns:
                     self._ignore_flags_patterns[match.group(1)](match.group(2))
+                # and consider everything else as compilation flag.
                 else:
                     self.result['flags'].append(arg)
-                logging.warning("ARG: %s", arg)
-            # and consider everything else as compilation flag.
-            else:
-                self.result['flags'].append(arg)
 
     def march_filter(self, cpu):
         """Sets the CPU type """
@@ -438,6 +733,53 @@ class FlagListFilter(object):
         return self.result
 
 
+@functools.lru_cache(maxsize=FLAG_CACHE_SIZE)
+def filter_flags(flags):
+    """Returns the FlagListFilter results of flags (a tuple). Most entries of
+    a compilation database share their flags, hence the results are cached.
+    """
+    return FlagListFilter(flags).results
+
+
+def interpret_plist(report, vulnerabilities=None):
+    """Interprets the content of a plist report generated by clang SA
+
+    :param report: loaded plist report
+    :param vulnerabilities: vulnerability list for incremental reports
+    :return: vulnerability list
+    """
+    if vulnerabilities is None:
+        vulnerabilities = []
+
+    def reindex_location(location, used):
+        """clang SA reports files based on index, we need the file paths"""
+        used_file = location['file']
+        location['file'] = report['files'][used_file]
+        used[location['file']] = 1
+
+    for diag in report['diagnostics']:
+        used_files = {}
+        reindex_location(diag['location'], used_files)
+        for item in diag['path']:
+            if item['kind'] == 'event':
+                reindex_location(item['location'], used_files)
+                if 'ranges' not in item:
+                    continue
+                for rng in item['ranges']:
+                    reindex_location(rng[0], used_files)
+                    reindex_location(rng[1], used_files)
+            elif item['kind'] == 'control':
+                for edge in item['edges']:
+                    for pos in ['start', 'end']:
+                        pos = edge[pos]
+                        reindex_location(pos[0], used_files)
+                        reindex_location(pos[1], used_files)
+        diag['files'] = list(used_files.keys())
+        diag['clang_version'] = report['clang_version']
+        vulnerabilities.append(diag)
+    return vulnerabilities
+
+
 def interpret_plist_report(file, vulnerabilities=None, validate=False):
     """Interprets the plist files generated by clang SA (unvalidated per default)
 
@@ -446,68 +788,87 @@ def interpret_plist_report(file, vulnerabilities=None, validate=False):
     :param validate: whether schema validation is applied (False per default)
     :return:
     """
-    if vulnerabilities is None:
-        vulnerabilities = []
     with open(file, 'rb') as report_file:
-        report = plistlib.load(report_file)
-
-        def reindex_location(location, used):
-            """clang SA reports files based on index, we need the file paths"""
-            used_file = location['file']
-            location['file'] = report['files'][used_file]
-            used[location['file']] = 1
-
-        for diag in report['diagnostics']:
-            used_files = {}
-            reindex_location(diag['location'], used_files)
-            for item in diag['path']:
-                if item['kind'] == 'event':
-                    reindex_location(item['location'], used_files)
-                    if 'ranges' not in item:
-                        continue
-                    for rng in item['ranges']:
-                        reindex_location(rng[0], used_files)
-                        reindex_location(rng[1], used_files)
-                elif item['kind'] == 'control':
-                    for edge in item['edges']:
-                        for pos in ['start', 'end']:
-                            pos = edge[pos]
-                            reindex_location(pos[0], used_files)
-                            reindex_location(pos[1], used_files)
-            diag['files'] = list(used_files.keys())
-            diag['clang_version'] = report['clang_version']
-            vulnerabilities.append(diag)
+        vulnerabilities = interpret_plist(plistlib.load(report_file),
+                                          vulnerabilities)
     if validate:
         jsonschema.validate(vulnerabilities, VULNERABILITY_SCHEMA)
 
     return vulnerabilities
 
 
-def interpret_plist_reports(files, vulnerabilities=None, validate=True):
+def interpret_plist_reports(files, vulnerabilities=None, validate=True,
+                            deduplicate=True):
     """Returns the validated vulnerability list (validated per default)
 
     :param files: file url
     :param vulnerabilities: vulnerability list for incremental reports
     :param validate: whether schema validation is applied (True per default)
+    :param deduplicate: whether diagnostics reported by several translation
+        units are merged (True per default)
     :return:
     """
     if vulnerabilities is None:
         vulnerabilities = []
+    index = IssueIndex(vulnerabilities) if deduplicate else None
     for file in files:
         try:
-            interpret_plist_report(file, vulnerabilities)
+            if index is None:
+                interpret_plist_report(file, vulnerabilities)
+                continue
+            for vulnerability in interpret_plist_report(file):
+                index.add(vulnerability)
         except plistlib.InvalidFileException as ex:
             logging.error("Invalid clang SA report found: %s\n,"
                           "THIS!!! should never happen", file)
             logging.error(ex)
 
+    if index is not None:
+        LOGGER.info("Removed %d duplicated diagnostics", index.duplicates)
+        vulnerabilities[:] = index.vulnerabilities
+
     if validate:
         jsonschema.validate(vulnerabilities, VULNERABILITY_SCHEMA)
     return vulnerabilities
 
 
-def report_compatibility():
-    """Tests system for compatibility and generates a report on errors found"""
+def clang_identity():
+    """Returns a string identifying the clang binary used for the analysis.
+    Cached compatibility results are only valid for the very same binary."""
+    clang_path = os.path.realpath(which(CLANG) or CLANG)
+    try:
+        stat = os.stat(clang_path)
+    except OSError:
+        return "{}:{}".format(clang_path, CLANG_VERSION)
+    return "{}:{}:{}:{}".format(clang_path, CLANG_VERSION, stat.st_size,
+                                int(stat.st_mtime))
+
+
+def check_plugin(plugin):
+    """Loads plugin into clang and analyzes a simple test file
+
+    :param plugin: path to the checker library
+    :return: error report or an empty string if the plugin is compatible
+    """
+    command = [CLANG, '--analyze', '-Xclang', '-load', '-Xclang', plugin,
+               '--output=/dev/null', ROOT_DIR + '/tests/hello.c']
+    try:
+        subprocess.run(command,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                       check=True)
+    except subprocess.CalledProcessError as err:
+        return create_error_report(os.path.basename(plugin), err)
+    return ""
+
+
+def report_compatibility(recheck=False):
+    """Tests system for compatibility and generates a report on errors found
+
+    The results are cached per clang binary and plugin content, only plugins
+    without a cached result are checked (in parallel).
+
+    :param recheck: ignore the cached results and check all plugins again
+    """
     error_reports = []
 
     if not compatible_version():
@@ -515,20 +876,27 @@ def report_compatibility():
                              "Version required: " + REQUIRED_CLANG_VERSION)
         return error_reports
 
-    checkers = [f for f in os.listdir(CHECKER_PATH) if f.endswith('.so')]
-    cmd = [CLANG, '--analyze', '-Xclang', '-load', '-Xclang']
-    no_output = ['--output=/dev/null']
-    test_file = [ROOT_DIR + '/tests/hello.c']
-
-    for check in checkers:
-        try:
-            command = cmd + [os.path.join(CHECKER_PATH, check)] + no_output + test_file
-            subprocess.run(command,
-                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                           check=True)
-        except subprocess.CalledProcessError as err:
-            error_reports.append(create_error_report(check, err))
-
+    checkers = sorted(os.path.join(CHECKER_PATH, f)
+                      for f in os.listdir(CHECKER_PATH) if f.endswith('.so'))
+    store = JsonStore('compatibility')
+    identity = clang_identity()
+    cached = {} if recheck else store.get(identity, {})
+    digests = {check: file_digest(check) for check in checkers}
+
+    unchecked = [check for check in checkers if digests[check] not in cached]
+    if unchecked:
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = executor.map(check_plugin, unchecked)
+            for check, result in zip(unchecked, results):
+                cached[digests[check]] = result
+        # only keep the results of the current binary and plugins
+        store.clear()
+        store[identity] = {digest: cached[digest]
+                           for digest in digests.values()}
+        store.save()
+
+    error_reports.extend(cached[digests[check]] for check in checkers
+                         if cached[digests[check]])
     return error_reports
 
 
@@ -555,7 +923,8 @@ def create_error_report(check, err):
 @command_entry_point
 def analyze_main(args=None):
     """Main function"""
-    report = report_compatibility()
+    args = ClangAnalyzer.parse_args_for_analyze_build(args=args)
+    report = report_compatibility(recheck=args.recheck_compatibility)
     if report:
         for message in report:
             LOGGER.error(message)
@@ -564,10 +933,24 @@ def analyze_main(args=None):
     directory = ClangAnalyzer.analyze_build(args)
 
     files = list(glob.iglob(os.path.join(directory, "report-*.plist")))
-    vulnerabilities = interpret_plist_reports(files)
+    vulnerabilities = interpret_plist_reports(files, list(args.reused))
+    if args.changes is not None:
+        vulnerabilities = filter_vulnerabilities(vulnerabilities,
+                                                 args.changes)
 
-    with open(CI_REPORT_FILE, "w") as report_file:
+    with open(shard_file_name(CI_REPORT_FILE, args.shard),
+              "w") as report_file:
         json.dump(vulnerabilities, report_file)
         for file in files:
             os.remove(file)
         os.rmdir(directory)
+
+    if args.llvm_passes:
+        llvm = LLVMAnalyzer()
+        if args.whole_program:
+            llvm.run_whole_program(os.getcwd(), shard=args.shard)
+        else:
+            llvm.run_project(os.getcwd(), shard=args.shard)
+        with open(shard_file_name(LLVM_REPORT_FILE, args.shard),
+                  "w") as report_file:
+            json.dump(llvm.vulnerabilities, report_file)
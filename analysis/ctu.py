@@ -0,0 +1,236 @@
+"""Module preparing the cross translation unit (CTU) analysis of clang SA
+
+The AST dump and the defined functions of every TU are generated in
+parallel and cached between runs, keyed on a hash of the TU (compiler, flags
+and the content of the source and its headers). Before the analysis the
+function definitions of all TUs are merged into the index clang looks up
+external definitions in.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from shutil import which
+
+from libscanbuild import analyze
+
+from settings import CACHE_DIR, CLANG, CLANG_VERSION
+from storage import file_digest
+
+LOGGER = logging.getLogger(name=__name__)
+
+# naive CTU analysis and clang-func-mapping are available since clang 7
+CTU_MIN_VERSION = (7, 0)
+FUNC_MAPPING = "clang-func-mapping"
+FUNC_MAP_FILE = "externalFnMap.txt"
+CTU_CACHE_DIR = os.path.join(CACHE_DIR, "ctu")
+
+__all__ = ['ctu_error', 'CtuIndex']
+
+
+def _version(version):
+    return tuple(int(part) for part in re.findall(r"[0-9]+", version)[:2])
+
+
+def func_mapping_tool(clang=CLANG):
+    """Returns the clang-func-mapping matching clang (None if missing)"""
+    name = os.path.basename(clang)
+    versioned = FUNC_MAPPING + name[len("clang"):] \
+        if name.startswith("clang-") else None
+    for name in [versioned, FUNC_MAPPING]:
+        if name and which(name):
+            return name
+    return None
+
+
+def ctu_error(version=CLANG_VERSION, clang=CLANG):
+    """Returns why CTU analysis is unavailable (None if it is available)"""
+    if _version(version) < CTU_MIN_VERSION:
+        return "CTU analysis requires clang >= {}, found clang {}".format(
+            ".".join(str(part) for part in CTU_MIN_VERSION), version)
+    if func_mapping_tool(clang) is None:
+        return "CTU analysis requires {} (not found in PATH)".format(
+            FUNC_MAPPING)
+    return None
+
+
+def _compile_arguments(opts):
+    """Returns the language and the filtered flags of a compilation entry"""
+    opts = analyze.classify_parameters(dict(opts),
+                                       continuation=lambda opts: opts)
+    language = opts['language'] or \
+        ('c++' if opts['compiler'] == 'c++' else 'c')
+    return ['-x', language] + opts['flags']
+
+
+def generate_unit(opts):
+    """Generates the AST dump and the function definitions of a TU
+
+    :param opts: compilation entry with clang, mapping tool and cache paths
+    :return: (source, seconds, error message or None)
+    """
+    start = time.monotonic()
+    arguments = _compile_arguments(opts)
+    ast_file, defs_file = opts['ast_file'], opts['defs_file']
+    try:
+        subprocess.check_output(
+            [opts['clang'], '-emit-ast', '-w'] + arguments +
+            [opts['source'], '-o', ast_file + ".tmp"],
+            cwd=opts['directory'], stderr=subprocess.STDOUT)
+        mapping = subprocess.check_output(
+            [opts['mapping_tool'], opts['source'], '--'] + arguments,
+            cwd=opts['directory'], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError) as err:
+        return opts['source'], time.monotonic() - start, str(err)
+    functions = [line.split(" ", 1)[0] for line in
+                 mapping.decode("utf-8", errors="replace").splitlines()
+                 if line.strip()]
+    with open(defs_file + ".tmp", "w") as handle:
+        handle.write("\n".join(functions))
+    # the AST is published last, it marks a complete cache entry
+    os.replace(defs_file + ".tmp", defs_file)
+    os.replace(ast_file + ".tmp", ast_file)
+    return opts['source'], time.monotonic() - start, None
+
+
+class CtuIndex(object):
+    """AST dumps and function map of a compilation database"""
+
+    def __init__(self, identity, clang=CLANG, cache_dir=CTU_CACHE_DIR,
+                 index=None):
+        """Initialization.
+
+        :param identity: identity of the clang installation (part of the key)
+        :param cache_dir: where AST dumps are kept between runs
+        :param index: DependencyIndex providing the headers of the TUs
+        """
+        self.identity = identity
+        self.clang = clang
+        self.cache_dir = cache_dir
+        if index is None:
+            # compile imports analysis, hence the deferred import
+            from compile import DependencyIndex  # pylint: disable=cyclic-import
+            index = DependencyIndex()
+        self.index = index
+        self.directory = None
+        # cache key -> source of the indexed TUs, one per configuration
+        self.keys = {}
+        self.statistics = {'generated': 0, 'cached': 0, 'failed': 0,
+                           'seconds': 0.0, 'ast_bytes': 0}
+
+    def _preprocessed_digest(self, compilation):
+        """Digest of the preprocessed TU, used for TUs unknown to the
+        dependency index"""
+        opts = dict(compilation.as_dict())
+        output = subprocess.check_output(
+            [self.clang, '-E', '-w'] + _compile_arguments(opts) +
+            [compilation.source], cwd=compilation.directory,
+            stderr=subprocess.DEVNULL)
+        return hashlib.sha256(output).hexdigest()
+
+    def key(self, compilation):
+        """Returns the cache key of a TU"""
+        if compilation.source in self.index.units:
+            contents = [file_digest(path) for path in
+                        [compilation.source] +
+                        self.index.dependencies(compilation.source)
+                        if os.path.exists(path)]
+        else:
+            contents = [self._preprocessed_digest(compilation)]
+        content = json.dumps([self.identity, compilation.compiler,
+                              compilation.flags, compilation.source,
+                              contents])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _cache_file(self, key, extension):
+        return os.path.join(self.cache_dir, key + extension)
+
+    def build(self, compilations, jobs=None):
+        """Generates the missing AST dumps in parallel and writes the function
+        map of all TUs to a new CTU directory"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        start = time.monotonic()
+        missing = []
+        for compilation in compilations:
+            try:
+                key = self.key(compilation)
+            except (OSError, subprocess.CalledProcessError) as err:
+                LOGGER.warning("Not part of the CTU index: %s (%s)",
+                               compilation.source, err)
+                self.statistics['failed'] += 1
+                continue
+            if key in self.keys:
+                continue  # the same compilation is listed again
+            self.keys[key] = compilation.source
+            if os.path.exists(self._cache_file(key, ".ast")):
+                self.statistics['cached'] += 1
+                continue
+            missing.append(dict(compilation.as_dict(), key=key,
+                                clang=self.clang,
+                                mapping_tool=func_mapping_tool(self.clang),
+                                ast_file=self._cache_file(key, ".ast"),
+                                defs_file=self._cache_file(key, ".defs")))
+
+        pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+        try:
+            for opts, (source, _, error) in zip(
+                    missing, pool.imap(generate_unit, missing)):
+                if error:
+                    LOGGER.warning("Cannot generate the AST of %s: %s",
+                                   source, error)
+                    self.statistics['failed'] += 1
+                    del self.keys[opts['key']]
+                else:
+                    self.statistics['generated'] += 1
+        finally:
+            pool.close()
+            pool.join()
+        self._write_function_map()
+        self.statistics['seconds'] = time.monotonic() - start
+        self.statistics['ast_bytes'] = sum(
+            os.path.getsize(self._cache_file(key, ".ast"))
+            for key in self.keys)
+        LOGGER.warning("CTU index: %d ASTs generated, %d cached, %d failed "
+                       "in %.1fs, %.1f MiB of ASTs",
+                       self.statistics['generated'],
+                       self.statistics['cached'], self.statistics['failed'],
+                       self.statistics['seconds'],
+                       self.statistics['ast_bytes'] / (1024 * 1024))
+        return self
+
+    def _write_function_map(self):
+        """Writes the function map, functions defined by several TUs are
+        left out since clang cannot tell which definition is meant"""
+        definitions = {}
+        for key in sorted(self.keys):
+            with open(self._cache_file(key, ".defs"), "r") as handle:
+                for function in handle.read().split():
+                    definitions.setdefault(function, set()).add(key)
+        self.directory = tempfile.mkdtemp(prefix="ci-ctu-")
+        os.mkdir(os.path.join(self.directory, "ast"))
+        with open(os.path.join(self.directory, FUNC_MAP_FILE), "w") as fn_map:
+            for key in sorted(self.keys):
+                os.symlink(self._cache_file(key, ".ast"),
+                           os.path.join(self.directory, "ast", key + ".ast"))
+            for function, keys in sorted(definitions.items()):
+                if len(keys) == 1:
+                    fn_map.write("{} ast/{}.ast\n".format(function,
+                                                          keys.pop()))
+
+    @property
+    def analyzer_config(self):
+        """Returns the -analyzer-config enabling CTU analysis"""
+        return "experimental-enable-naive-ctu-analysis=true,ctu-dir={}," \
+            "ctu-index-name={}".format(self.directory, FUNC_MAP_FILE)
+
+    def cleanup(self):
+        """Removes the CTU directory (the cached ASTs are kept)"""
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
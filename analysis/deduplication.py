@@ -0,0 +1,105 @@
+"""Module deduplicating clang SA diagnostics reported by several translation
+units
+
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+__all__ = ['IssueIndex', 'deduplicate_vulnerabilities']
+
+
+def _location_key(location):
+    """Returns a hashable representation of a (reindexed) location"""
+    return location.get('file'), location.get('line'), location.get('col')
+
+
+def path_fingerprint(path):
+    """Creates a stable fingerprint of a diagnostic path
+
+    :param path: path of a diagnostic as found in the clang SA report
+    :return: hex digest over the locations visited by the path
+    """
+    steps = []
+    for item in path:
+        if item.get('kind') == 'event':
+            steps.append(('event',) + _location_key(item['location']))
+        elif item.get('kind') == 'control':
+            for edge in item['edges']:
+                steps.append(('control',) +
+                             _location_key(edge['start'][0]) +
+                             _location_key(edge['end'][0]))
+    return hashlib.sha1(json.dumps(steps).encode('utf-8')).hexdigest()
+
+
+class IssueIndex(object):
+    """Index of unique diagnostics keyed on their issue signature
+
+    Diagnostics found in headers (or inline functions) are reported once per
+    including translation unit. The index keeps the first occurrence and
+    merges the `files` lists of all further occurrences into it.
+    """
+
+    def __init__(self, vulnerabilities=None):
+        self._index = OrderedDict()
+        self.duplicates = 0
+        for vulnerability in vulnerabilities or []:
+            self.add(vulnerability)
+
+    @staticmethod
+    def signature(vulnerability):
+        """Returns the stable issue signature of a diagnostic
+
+        clang's issue hash does not contain the file name, hence the location
+        file is always part of the signature. If the hash is missing, the
+        signature falls back to the location and a fingerprint of the path.
+        """
+        checker = vulnerability.get('check_name', vulnerability.get('type'))
+        location = vulnerability.get('location', {})
+        issue_hash = vulnerability.get('issue_hash_content_of_line_in_context')
+        if issue_hash:
+            return checker, location.get('file'), issue_hash
+        return (checker, vulnerability.get('category')) + \
+            _location_key(location) + \
+            (path_fingerprint(vulnerability.get('path', [])),)
+
+    def add(self, vulnerability):
+        """Adds a diagnostic to the index
+
+        :param vulnerability: diagnostic with reindexed locations
+        :return: True if the diagnostic was not known yet, False otherwise
+        """
+        key = self.signature(vulnerability)
+        known = self._index.get(key)
+        if known is None:
+            self._index[key] = vulnerability
+            return True
+
+        self.duplicates += 1
+        if 'files' in vulnerability:
+            files = known.setdefault('files', [])
+            files.extend(f for f in vulnerability['files'] if f not in files)
+        return False
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index.values())
+
+    def __contains__(self, vulnerability):
+        return self.signature(vulnerability) in self._index
+
+    @property
+    def vulnerabilities(self):
+        """Returns the list of unique diagnostics in insertion order"""
+        return list(self._index.values())
+
+
+def deduplicate_vulnerabilities(vulnerabilities):
+    """Returns vulnerabilities without duplicates reported by several TUs
+
+    :param vulnerabilities: list of diagnostics (reindexed locations)
+    :return: deduplicated list of diagnostics
+    """
+    return IssueIndex(vulnerabilities).vulnerabilities
@@ -1,35 +1,168 @@
 """
 Module dealing with Code Intelligence LLVM passes
 """
+import glob
+import hashlib
 import logging
 import json
+import multiprocessing
+import os
+import re
 import subprocess
 import sys
 
 import jsonschema
 import yaml
 
-from settings import ROOT_DIR, SPECS_DIR
+from settings import CACHE_DIR, ROOT_DIR, SPECS_DIR
+from storage import JsonStore, file_digest
 
 VULN_SCHEMA = SPECS_DIR + "/vulnerability_schema.json"
+YAML_DOCUMENT_START = "---"
+YAML_DOCUMENT_END = "..."
+LINKED_CACHE_DIR = os.path.join(CACHE_DIR, "llvm-linked")
+ARCHIVE_NAME_REGEX = re.compile(r"^\((.*)\)$")
 
 
 # Internal logger
 LOGGER = logging.getLogger(name=__name__)
 
 
+def parse_yaml_stream(lines):
+    """Parses a stream of YAML documents one document at a time, hence the
+    output of opt never has to be kept in memory as a whole
+
+    :param lines: iterable of text lines
+    :return: generator of the parsed documents
+    """
+    document = []
+    for line in lines:
+        stripped = line.rstrip("\n")
+        if stripped.startswith(YAML_DOCUMENT_START) or \
+                stripped == YAML_DOCUMENT_END:
+            if document:
+                yield yaml.load("".join(document), Loader=yaml.CBaseLoader)
+            document = []
+            rest = stripped[len(YAML_DOCUMENT_START):].strip() \
+                if stripped.startswith(YAML_DOCUMENT_START) else ""
+            if rest:
+                document.append(rest + "\n")
+        else:
+            document.append(line)
+    if "".join(document).strip():
+        yield yaml.load("".join(document), Loader=yaml.CBaseLoader)
+
+
+def run_passes(file):
+    """Runs the passes against a bitcode file (executed in worker processes)
+
+    :return: (file, returncode, vulnerabilities)
+    """
+    analyzer = LLVMAnalyzer()
+    returncode = analyzer.run(file)
+    return file, returncode, analyzer.vulnerabilities
+
+
+def find_link_info(root):
+    """Finds the link information (.yml) written by ci-cc below root
+
+    :return: dict of bitcode file -> objects linked into it
+    """
+    link_info = {}
+    for yml_file in glob.iglob(os.path.join(root, "**", "*.yml"),
+                               recursive=True):
+        bitcode = yml_file[:-len(".yml")] + ".bc"
+        if not os.path.isfile(bitcode):
+            continue
+        try:
+            with open(yml_file, "r") as handle:
+                content = yaml.load(handle, Loader=yaml.CBaseLoader)
+        except (OSError, yaml.YAMLError):
+            continue
+        if isinstance(content, dict) and len(content) == 1:
+            link_info[os.path.abspath(bitcode)] = \
+                next(iter(content.values())) or {}
+    return link_info
+
+
+def is_linked(objects):
+    """Returns True if the bitcode belongs to a linking step"""
+    return bool(objects.get("object_files") or objects.get("archive_files"))
+
+
+def link_inputs(bitcode, objects, units):
+    """Returns the TU bitcode files linked into bitcode
+
+    The paths in the link information are relative to the directory the
+    linker ran in, which is assumed to be the directory of the output. Archive
+    members are looked up by name, preferring the archive's directory.
+
+    :param bitcode: bitcode of the linking step
+    :param objects: link information of the linking step
+    :param units: bitcode files of all TUs
+    :return: sorted list of the bitcode files of the linked objects
+    """
+    directory = os.path.dirname(bitcode)
+    by_name = {}
+    for unit in units:
+        by_name.setdefault(os.path.basename(unit), []).append(unit)
+
+    def lookup(name, preferred):
+        candidate = os.path.normpath(os.path.join(preferred, name + ".bc"))
+        if candidate in units:
+            return candidate
+        candidates = by_name.get(os.path.basename(name) + ".bc", [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    inputs = [lookup(name, directory)
+              for name in objects.get("object_files") or []]
+    for archive, members in (objects.get("archive_files") or {}).items():
+        match = ARCHIVE_NAME_REGEX.match(archive)
+        archive_dir = os.path.dirname(os.path.join(
+            directory, match.group(1) if match else archive))
+        inputs.extend(lookup(member, archive_dir) for member in members or [])
+    missing = inputs.count(None)
+    if missing:
+        LOGGER.warning("No bitcode for %d objects linked into %s", missing,
+                       bitcode)
+    return sorted({bc for bc in inputs if bc is not None})
+
+
+def link_bitcode(job):
+    """Links bitcode files into a module (executed in worker processes)
+
+    :param job: (llvm-link command, inputs, output)
+    :return: (output, returncode, error output)
+    """
+    command, inputs, output = job
+    proc = subprocess.run([command, "-o", output + ".tmp"] + inputs,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode == 0:
+        os.replace(output + ".tmp", output)
+    return output, proc.returncode, proc.stderr.decode("utf-8", "replace")
+
+
 class LLVMAnalyzer(object):
     """
     Dealing with vulnerabilities coming from Code Intelligence LLVM passes
     """
     LLVM_PASSES_PATH = ROOT_DIR + "/libs/llvm-passes"
     PASSES_LIB = LLVM_PASSES_PATH + "/ci.so"
+    PASSES = ["-ci-zero-alloc", "-ci-hardcoded-passwords",
+              "-ci-unsafe-function", "-ci-unsanitized-inputs"]
+    OPT = "opt-5.0"
+    LINK = "llvm-link-5.0"
 
     def __init__(self):
         self._vulnerabilities = []
         with open(VULN_SCHEMA, "r") as file:
             self.vulnerability_schema = json.load(file)
 
+    def command(self, file):
+        """Returns the opt command running the passes against file"""
+        return [self.OPT, "-load=" + self.PASSES_LIB, "-print-report",
+                "-yaml"] + self.PASSES + ["-o", "/dev/null", file]
+
     def run(self, file):
         """
         Runs required passes in a specific order (this can be done via vfinder
@@ -37,24 +170,151 @@ class LLVMAnalyzer(object):
         :param file: bitcode file which needs to be analyzed
         :return: returncode coming from vfinder
         """
-        cmd = ["opt-5.0", "-load=" + self.PASSES_LIB, "-print-report", "-yaml",
-               "-ci-zero-alloc", "-ci-hardcoded-passwords",
-               "-ci-unsafe-function", "-ci-unsanitized-inputs",
-               "-o", "/dev/null", file]
+        cmd = self.command(file)
         logging.debug("Command: %s", " ".join(cmd))
-        proc = subprocess.run(
-            cmd, stdout=subprocess.PIPE, stderr=sys.stderr)
+        vulnerabilities = []
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=sys.stderr,
+                              universal_newlines=True) as proc:
+            try:
+                for vuln in parse_yaml_stream(proc.stdout):
+                    if vuln and isinstance(vuln, list):
+                        vulnerabilities.extend(vuln)
+            except yaml.YAMLError as ex:
+                LOGGER.warning("Invalid report of %s: %s", file, ex)
+                proc.kill()
         if proc.returncode != 0:
             return proc.returncode
 
-        string = proc.stdout.decode('utf-8')
-        results = yaml.load_all(string, Loader=yaml.CBaseLoader)
-        for vuln in results:
-            if vuln and isinstance(vuln, list):
-                self._vulnerabilities.extend(vuln)
-
+        self._vulnerabilities.extend(vulnerabilities)
         return proc.returncode
 
+    def cache_key(self, file):
+        """Returns the key of the results of file: its content hash and the
+        identity of the passes"""
+        identity = [file_digest(file), self.OPT] + self.PASSES
+        if os.path.isfile(self.PASSES_LIB):
+            identity.append(file_digest(self.PASSES_LIB))
+        return hashlib.sha256(
+            json.dumps(identity).encode("utf-8")).hexdigest()
+
+    def run_all(self, files, jobs=None, cache=None):
+        """Runs the passes against bitcode files in a process pool, the
+        results of unchanged files are taken from the cache
+
+        :param files: bitcode files
+        :param jobs: number of parallel opt processes
+        :param cache: JsonStore of results per cache key
+        :return: list of the files the passes failed for
+        """
+        cache = JsonStore('llvm-results') if cache is None else cache
+        keys = {file: self.cache_key(file) for file in files}
+        pending = []
+        for file in files:
+            if keys[file] in cache:
+                self._vulnerabilities.extend(cache[keys[file]])
+            else:
+                pending.append(file)
+        LOGGER.info("Running LLVM passes against %d of %d bitcode files",
+                    len(pending), len(files))
+
+        failed = []
+        pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+        try:
+            for file, returncode, vulnerabilities in pool.imap_unordered(
+                    run_passes, pending):
+                if returncode != 0:
+                    LOGGER.warning("LLVM passes failed for %s (%d)", file,
+                                   returncode)
+                    failed.append(file)
+                    continue
+                cache[keys[file]] = vulnerabilities
+                self._vulnerabilities.extend(vulnerabilities)
+        finally:
+            pool.close()
+            pool.join()
+        cache.save()
+        return failed
+
+    def run_project(self, root, jobs=None, cache=None, shard=None):
+        """Runs the passes against the bitcode of every TU compiled by ci-cc
+        below root (found by the link information next to the bitcode)
+
+        :param shard: (i, N) to only analyze every N-th file starting at i
+        """
+        files = sorted(bitcode for bitcode, objects in
+                       find_link_info(root).items() if not is_linked(objects))
+        if shard is not None:
+            files = files[shard[0] - 1::shard[1]]
+        return self.run_all(files, jobs=jobs, cache=cache)
+
+    def link_modules(self, binaries, jobs=None, cache_dir=LINKED_CACHE_DIR):
+        """Links the bitcode of every binary once, modules whose inputs did
+        not change are taken from the cache
+
+        :param binaries: dict of binary bitcode -> list of input bitcode
+        :return: dict of binary bitcode -> linked module
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        modules, pending = {}, []
+        for binary, inputs in binaries.items():
+            if not inputs:
+                continue
+            key = hashlib.sha256(json.dumps(
+                [self.LINK] + [[bc, file_digest(bc)] for bc in inputs]
+            ).encode("utf-8")).hexdigest()
+            modules[binary] = os.path.join(cache_dir, key + ".bc")
+            if not os.path.isfile(modules[binary]):
+                pending.append((self.LINK, inputs, modules[binary]))
+        LOGGER.info("Linking %d of %d whole-program modules", len(pending),
+                    len(modules))
+
+        pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+        try:
+            for output, returncode, error in pool.imap_unordered(
+                    link_bitcode, pending):
+                if returncode != 0:
+                    LOGGER.warning("Linking %s failed: %s", output, error)
+                    for binary in [b for b, m in modules.items()
+                                   if m == output]:
+                        del modules[binary]
+        finally:
+            pool.close()
+            pool.join()
+        return modules
+
+    def run_whole_program(self, root, jobs=None, cache=None,  # pylint: disable=too-many-arguments
+                          cache_dir=LINKED_CACHE_DIR, shard=None):
+        """Runs the passes once per binary built below root, against the
+        module linked from the bitcode of its objects. TUs not linked into
+        any binary are analyzed on their own.
+
+        :param shard: (i, N) to only analyze every N-th file starting at i
+        :return: list of the files the passes failed for
+        """
+        link_info = find_link_info(root)
+        units = {bc for bc, objects in link_info.items()
+                 if not is_linked(objects)}
+        binaries = {bc: link_inputs(bc, objects, units)
+                    for bc, objects in link_info.items() if is_linked(objects)}
+        linked = {bc for inputs in binaries.values() for bc in inputs}
+        targets = sorted(bc for bc in binaries if binaries[bc]) + \
+            sorted(units - linked)
+        if shard is not None:
+            targets = targets[shard[0] - 1::shard[1]]
+        modules = self.link_modules(
+            {bc: binaries[bc] for bc in targets if bc in binaries},
+            jobs=jobs, cache_dir=cache_dir)
+        files = set()
+        for target in targets:
+            if target in modules:
+                files.add(modules[target])
+            elif target in binaries:
+                # linking failed, at least its TUs are analyzed
+                files.update(binaries[target])
+            else:
+                files.add(target)
+        return self.run_all(sorted(files), jobs=jobs, cache=cache)
+
     @property
     def vulnerabilities(self):
         """returns the vulnerability list"""
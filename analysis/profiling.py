@@ -0,0 +1,189 @@
+"""Module attributing the cost of clang SA runs to the enabled checkers
+
+Every TU is analyzed with -analyzer-stats, the statistics printed by the
+analyzer are collected per TU. clang does not time single checkers, hence
+the slowest TUs are analyzed again with one checker disabled at a time. The
+difference in wall time and in exploded graph steps to the run with all
+checkers enabled is attributed to the disabled checker. The runs are bound
+by the deadline and the per-TU budget of the scan, the profile is partial if
+the deadline is reached.
+"""
+import logging
+import re
+import shutil
+import tempfile
+import time
+
+from libscanbuild import analyze
+
+from .scheduling import BUDGET_TIMEOUT_FACTOR, timed_run
+
+LOGGER = logging.getLogger(name=__name__)
+
+STATISTIC_REGEX = re.compile(r"^\s*([0-9]+) (\S+)\s+- (.+)$")
+# statistic counting the nodes added to the exploded graph
+STEPS_STATISTIC = ("CoreEngine", "The # of steps executed.")
+# number of slowest TUs analyzed again for every checker
+PROFILE_UNITS = 5
+
+__all__ = ['parse_statistics', 'CheckerProfile']
+
+
+def parse_statistics(lines):
+    """Parses the statistics printed by clang -analyzer-stats
+
+    :param lines: output of the analyzer
+    :return: dict of component -> dict of description -> count
+    """
+    statistics = {}
+    for line in lines or []:
+        match = STATISTIC_REGEX.match(line)
+        if match:
+            count, component, description = match.groups()
+            component_stats = statistics.setdefault(component, {})
+            component_stats[description] = \
+                component_stats.get(description, 0) + int(count)
+    return statistics
+
+
+def analyzer_steps(statistics):
+    """Returns the number of exploded graph steps of a run"""
+    component, description = STEPS_STATISTIC
+    return statistics.get(component, {}).get(description, 0)
+
+
+class CheckerProfile(object):
+    """Statistics of the analyzer runs and the costs attributed to checkers"""
+
+    def __init__(self, count=PROFILE_UNITS):
+        """Initialization.
+
+        :param count: number of slowest TUs analyzed again for every checker
+        """
+        self.count = count
+        self.units = {}
+        self.checkers = {}
+        self.complete = True
+
+    def add(self, source, elapsed, result):
+        """Records the statistics of an analyzer run"""
+        self.units[source] = {
+            'seconds': elapsed,
+            'statistics': parse_statistics(result.get('error_output'))
+        }
+
+    def slowest(self):
+        """Returns the slowest TUs, slowest first"""
+        return sorted(self.units, key=lambda source:
+                      self.units[source]['seconds'], reverse=True)[:self.count]
+
+    @staticmethod
+    def _measure(opts, direct_args, timeout):
+        """Runs the analyzer once and returns (seconds, steps), None if it
+        was killed after timeout seconds"""
+        opts = dict(opts, direct_args=opts['direct_args'] + direct_args,
+                    timeout=timeout)
+        _, elapsed, usage, result = timed_run(opts)
+        if usage.get('timed_out'):
+            LOGGER.warning("Profiling run timed out for %s", opts['source'])
+            return None
+        return elapsed, analyzer_steps(parse_statistics(
+            result.get('error_output') if result else None))
+
+    def _ablate_unit(self, opts, checkers, limit):
+        """Analyzes a TU with all checkers and without each of checkers
+
+        :param limit: returns the timeout of the next run, None without
+            limit, 0 or less once the deadline passed
+        """
+        def measure(direct_args):
+            """Measures a run unless the deadline passed"""
+            timeout = limit()
+            if timeout is not None and timeout <= 0:
+                self.complete = False
+                return None
+            return self._measure(opts, direct_args, timeout)
+
+        # sequential runs, the runs of the scan competed for the CPUs
+        measured = measure([])
+        if measured is None:
+            return
+        baseline, steps = measured
+        unit = self.units[opts['source']]
+        unit['checkers'] = {}
+        for checker in checkers:
+            measured = measure([
+                '-Xclang', '-analyzer-disable-checker', '-Xclang', checker])
+            if measured is None:
+                if not self.complete:
+                    return
+                continue
+            cost = self.checkers.setdefault(
+                checker, {'seconds': 0.0, 'steps': 0, 'units': 0})
+            seconds = max(0.0, baseline - measured[0])
+            cost['seconds'] += seconds
+            cost['steps'] += max(0, steps - measured[1])
+            cost['units'] += 1
+            unit['checkers'][checker] = seconds
+
+    def ablate(self, compilations, args, deadline=None):
+        """Analyzes the slowest TUs again, once with every checker and once
+        without each of the enabled checkers, and attributes the difference
+        to the disabled checker
+
+        :param deadline: time.monotonic() value the ablation stops at, the
+            runs are killed after the per-TU budget of args
+        """
+        slowest = set(self.slowest())
+        budget = getattr(args, 'tu_budget', None)
+
+        def limit():
+            """Returns the timeout of the next run"""
+            timeouts = []
+            if deadline is not None:
+                timeouts.append(deadline - time.monotonic())
+            if budget is not None:
+                timeouts.append(budget * BUDGET_TIMEOUT_FACTOR)
+            return min(timeouts) if timeouts else None
+
+        consts = analyze.analyze_parameters(args)
+        output_dir = tempfile.mkdtemp(prefix="ci-profile-")
+        consts.update(output_dir=output_dir, output_failures=False)
+        try:
+            for compilation in compilations:
+                if compilation.source in slowest and self.complete:
+                    self._ablate_unit(dict(compilation.as_dict(), **consts),
+                                      args.enable_checker, limit)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        if not self.complete:
+            LOGGER.warning("Deadline reached, the checker profile is partial")
+
+    @property
+    def report(self):
+        """Project-level report: checkers ranked by attributed time, the
+        statistics summed over all TUs, the slowest TUs and whether the
+        ablation completed before the deadline"""
+        statistics = {}
+        for unit in self.units.values():
+            for component, values in unit['statistics'].items():
+                total = statistics.setdefault(component, {})
+                for description, count in values.items():
+                    total[description] = total.get(description, 0) + count
+        checkers = [dict(cost, checker=checker) for checker, cost in
+                    self.checkers.items()]
+        return {
+            'complete': self.complete,
+            'checkers': sorted(checkers, key=lambda cost: (
+                cost['seconds'], cost['steps']), reverse=True),
+            'statistics': statistics,
+            'slowest_units': [dict(self.units[source], source=source)
+                              for source in self.slowest()]
+        }
+
+    def log(self):
+        """Logs the checkers ranked by their attributed time"""
+        for cost in self.report['checkers']:
+            LOGGER.warning("Checker %s: %.1fs, %d steps in %d TUs",
+                           cost['checker'], cost['seconds'], cost['steps'],
+                           cost['units'])
@@ -0,0 +1,113 @@
+"""Module keeping the findings of the build-time analysis
+
+ci-cc analyzes every compiled TU when ci-build runs with --analyze and
+writes the findings of each TU to its own file in the result store. The
+files are written atomically, hence concurrent compiler processes never
+expose partial results. ci-vulnscan --from-build reuses the findings of TUs
+whose source and headers did not change since, provided they were analyzed
+with the same configuration (clang binary, checker plugins and analyzer
+arguments) and the same compile flags.
+"""
+import hashlib
+import json
+import logging
+import os
+from os import environ as env
+
+from settings import RESULT_STORE_DIR
+from storage import atomic_write, file_digest
+
+LOGGER = logging.getLogger(name=__name__)
+
+RESULT_STORE_ENV = "CI_RESULT_STORE"
+
+__all__ = ['ResultStore', 'RESULT_STORE_ENV']
+
+
+def _digests(paths):
+    """Returns the digests of the existing files in paths"""
+    digests = {}
+    for path in paths:
+        try:
+            digests[path] = file_digest(path)
+        except OSError:
+            continue
+    return digests
+
+
+class ResultStore(object):
+    """Findings of the build-time analysis, one file per TU"""
+
+    def __init__(self, directory=None, configuration=None):
+        """Initialization.
+
+        :param directory: directory of the store, defaults to
+            $CI_RESULT_STORE or RESULT_STORE_DIR in the current working
+            directory
+        :param configuration: JSON compatible description of the analysis
+            (see analysis_configuration), entries recorded with another one
+            are not fresh
+        """
+        if directory is None:
+            directory = env.get(RESULT_STORE_ENV, RESULT_STORE_DIR)
+        self.directory = os.path.abspath(directory)
+        # normalized as it is read back from the entries
+        self.configuration = json.loads(json.dumps(configuration))
+
+    def _file(self, source):
+        name = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + ".json")
+
+    def record(self, source, vulnerabilities, dependencies=(), flags=None):
+        """Stores the findings of a TU
+
+        :param source: absolute path of the source file
+        :param vulnerabilities: findings in the format of the ci-report
+        :param dependencies: headers included by the source file
+        :param flags: compile flags of the source file, as in the
+            compilation database
+        """
+        atomic_write(self._file(source), json.dumps({
+            'source': source,
+            'configuration': self.configuration,
+            'flags': flags,
+            'digests': _digests([source] + list(dependencies)),
+            'vulnerabilities': vulnerabilities
+        }))
+
+    def load(self, source):
+        """Returns the stored entry of a TU (None if there is none)"""
+        try:
+            with open(self._file(source), "r") as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('source') == source else None
+
+    def fresh(self, source, flags=None):
+        """Returns the stored findings of a TU, None if there are none, if
+        they were recorded with another configuration or other compile flags
+        or if the source or one of its headers changed since"""
+        entry = self.load(source)
+        if entry is None or source not in entry['digests'] or \
+                entry.get('configuration') != self.configuration or \
+                entry.get('flags') != flags or \
+                _digests(entry['digests']) != entry['digests']:
+            return None
+        return entry['vulnerabilities']
+
+    def collect(self, compilations):
+        """Returns the fresh findings of compilations
+
+        :param compilations: entries of the compilation database
+        :return: dict of source -> findings, for the sources with fresh
+            results only
+        """
+        results = {}
+        for entry in compilations:
+            source = entry.source
+            vulnerabilities = self.fresh(source, entry.flags)
+            if vulnerabilities is not None:
+                results[source] = vulnerabilities
+        LOGGER.info("Reusing the build-time analysis of %d TUs", len(results))
+        return results
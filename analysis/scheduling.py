@@ -0,0 +1,449 @@
+"""Module scheduling the clang SA runs of a compilation database
+
+Translation units are handed out longest first based on the analyzer wall
+times of previous runs, so a single slow TU does not end up at the tail of
+the schedule while all other cores are idle. New runs are only admitted if
+the memory they are expected to take (learned from previous runs) is
+available, TUs killed by the OOM killer are retried with lower concurrency.
+Runs which have not reached their expected peak yet keep the rest of it
+reserved, so a burst of admissions does not overcommit the memory.
+
+A scan can be bounded by a global deadline and a per-TU budget: TUs which
+exceeded their budget in previous runs are analyzed with less effort,
+recently changed TUs are analyzed first and everything not finished in time
+is reported as skipped or timed out.
+"""
+import heapq
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+from libscanbuild import analyze
+
+from storage import JsonStore
+
+LOGGER = logging.getLogger(name=__name__)
+
+CRITICAL_PATH_LENGTH = 5
+# memory kept free for the rest of the system when admitting new runs
+MEMORY_RESERVE = 512 * 1024 * 1024
+POLL_INTERVAL = 0.5
+# loop count used for TUs exceeding their budget (clang's default is 4)
+REDUCED_MAXLOOP = 2
+# a TU is killed when it takes this many times its budget
+BUDGET_TIMEOUT_FACTOR = 4
+
+__all__ = ['TimingDatabase', 'MemoryDatabase', 'AnalyzerScheduler',
+           'critical_path', 'run_analyzer_parallel']
+
+# resource usage of the last command executed by this (worker) process
+_USAGE = {'peak_rss': 0, 'timed_out': False}
+# limits of the commands executed by this (worker) process
+_LIMITS = {'timeout': None}
+# queue the process groups of the started commands are reported to, and the
+# source analyzed by this (worker) process
+_WORKER = {'started': None, 'source': None}
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def run_command(command, cwd=None):
+    """ Same as libscanbuild.run_command, but additionally records the peak
+    resident set size of the executed command and kills it after the
+    timeout of the current analyzer run. """
+    directory = os.path.abspath(cwd) if cwd else os.getcwd()
+    logging.debug('exec command %s in %s', command, directory)
+    # the command runs in its own process group, the clang driver spawns the
+    # actual analyzer as child process
+    proc = subprocess.Popen(command, cwd=directory, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, start_new_session=True)
+    if _WORKER['started'] is not None:
+        _WORKER['started'].put((_WORKER['source'], proc.pid))
+
+    def kill():
+        """Kills the command once its time is up"""
+        _USAGE['timed_out'] = True
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    timer = None
+    if _LIMITS['timeout'] is not None:
+        timer = threading.Timer(max(_LIMITS['timeout'], 0), kill)
+        timer.start()
+    output = proc.stdout.read().decode('utf-8', errors='replace')
+    proc.stdout.close()
+    _, status, usage = os.wait4(proc.pid, 0)
+    if timer is not None:
+        timer.cancel()
+    # ru_maxrss is given in kilobytes, the peak of the analyzer is kept when
+    # libscanbuild runs the preprocessor after a failure
+    _USAGE['peak_rss'] = max(_USAGE['peak_rss'], usage.ru_maxrss * 1024)
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, command,
+                                            output=output.splitlines())
+    return output.splitlines()
+
+
+# Monkey patch the command execution of the analyzer to get resource usage
+analyze.run_command = run_command
+
+
+def available_memory():
+    """Returns the memory available for new processes in bytes"""
+    try:
+        with open('/proc/meminfo', 'r') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def process_group_rss():
+    """Returns the resident set size of every process group in bytes"""
+    groups = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(name), 'r') as stat:
+                fields = stat.read().rpartition(')')[2].split()
+        except OSError:
+            continue
+        # the fields following the command are state, ppid, pgrp, ... rss
+        group = int(fields[2])
+        groups[group] = groups.get(group, 0) + int(fields[21]) * PAGE_SIZE
+    return groups
+
+
+def _init_worker(started):
+    """Initializes a worker process of the scheduler"""
+    _WORKER['started'] = started
+
+
+class TranslationUnitStore(JsonStore):
+    """Persistent measurements per translation unit. Values of TUs which have
+    not been measured yet are estimated by their file size."""
+    DEFAULT_PER_BYTE = 0.0
+    MINIMUM = 0.0
+
+    def __init__(self, name, directory=None):
+        super().__init__(name, directory=directory)
+        self._per_byte = None
+
+    @staticmethod
+    def _size(source):
+        try:
+            return os.path.getsize(source)
+        except OSError:
+            return 0
+
+    def per_byte(self):
+        """Returns the ratio of measured value per byte of source code"""
+        if self._per_byte is None:
+            total, size = 0.0, 0
+            for source, value in self.items():
+                source_size = self._size(source)
+                if source_size:
+                    total += value
+                    size += source_size
+            self._per_byte = total / size if size and total \
+                else self.DEFAULT_PER_BYTE
+        return self._per_byte
+
+    def estimate(self, source):
+        """Returns the measured value of source or an estimation"""
+        if source in self:
+            return self[source]
+        return max(self.MINIMUM, self._size(source) * self.per_byte())
+
+    def record(self, source, value):
+        """Records a measurement"""
+        self[source] = value
+
+    def order(self, parameters):
+        """Sorts the analyzer parameters by their value, highest first"""
+        return sorted(parameters, key=lambda opts: self.estimate(opts['source']),
+                      reverse=True)
+
+
+class TimingDatabase(TranslationUnitStore):
+    """Persistent analyzer wall times per translation unit (in seconds)"""
+    DEFAULT_PER_BYTE = 1e-5
+
+    def __init__(self, name='analyzer-timings', directory=None):
+        super().__init__(name, directory=directory)
+
+
+class MemoryDatabase(TranslationUnitStore):
+    """Persistent analyzer memory peaks per translation unit (in bytes)"""
+    DEFAULT_PER_BYTE = 4096
+    MINIMUM = 256 * 1024 * 1024
+
+    def __init__(self, name='analyzer-memory', directory=None):
+        super().__init__(name, directory=directory)
+
+
+def critical_path(timings, jobs, count=CRITICAL_PATH_LENGTH):
+    """Returns the TUs on the critical path of a longest first schedule
+
+    The schedule is simulated on jobs workers, the critical path is the chain
+    of TUs of the worker finishing last.
+
+    :param timings: dict of source -> wall time
+    :param jobs: number of parallel analyzer runs
+    :param count: maximum number of TUs returned
+    :return: list of (source, wall time) pairs, longest first
+    """
+    workers = [(0.0, index, []) for index in range(max(jobs, 1))]
+    for source, elapsed in sorted(timings.items(), key=lambda item: item[1],
+                                  reverse=True):
+        finished, index, sources = heapq.heappop(workers)
+        sources.append((source, elapsed))
+        heapq.heappush(workers, (finished + elapsed, index, sources))
+    _, _, sources = max(workers)
+    return sources[:count]
+
+
+def timed_run(opts):
+    """Runs the analyzer against a single entry and measures its wall time
+    and memory peak. The analyzer is killed after opts['timeout'] seconds."""
+    _USAGE.update(peak_rss=0, timed_out=False)
+    _LIMITS['timeout'] = opts.pop('timeout', None)
+    _WORKER['source'] = opts['source']
+    start = time.monotonic()
+    result = analyze.run(opts)
+    return opts['source'], time.monotonic() - start, dict(_USAGE), result
+
+
+def is_killed(result):
+    """Returns True if the analyzer was killed (by the OOM killer or because
+    its time was up)"""
+    return bool(result) and result.get('exit_code') == -signal.SIGKILL
+
+
+def recently_changed(source, since):
+    """Returns True if source was modified after since (a timestamp)"""
+    try:
+        return since is None or os.path.getmtime(source) > since
+    except OSError:
+        return False
+
+
+class AnalyzerScheduler(object):  # pylint: disable=too-many-instance-attributes
+    """Runs the analyzer against compilation entries in a process pool
+
+    Recently changed entries are started first, then longest first. A new
+    entry is only admitted if its expected memory peak fits into the
+    available memory minus the memory reserved for the running entries,
+    unless nothing is running at all. No entry is started
+    after the deadline and running ones are killed when it is reached.
+    """
+
+    def __init__(self, jobs=None, timings=None, memory=None,  # pylint: disable=too-many-arguments
+                 poll_interval=POLL_INTERVAL, deadline=None, budget=None,
+                 changed_since=None, profile=None):
+        """Initialization.
+
+        :param deadline: time.monotonic() value after which nothing runs
+        :param budget: seconds a single TU is expected to take at most
+        :param changed_since: timestamp, TUs modified afterwards go first
+        :param profile: CheckerProfile collecting the analyzer statistics
+        """
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.timings = TimingDatabase() if timings is None else timings
+        self.memory = MemoryDatabase() if memory is None else memory
+        self.poll_interval = poll_interval
+        self.deadline = deadline
+        self.budget = budget
+        self.changed_since = changed_since
+        self.profile = profile
+        self.elapsed = {}
+        self.skipped = []
+        self.timed_out = []
+        self.reduced_effort = []
+        # process groups of the running analyzers, reported by the workers
+        self._groups = {}
+        self._started = None
+
+    @property
+    def complete(self):
+        """True if every TU was analyzed completely"""
+        return not (self.skipped or self.timed_out or self.reduced_effort)
+
+    @property
+    def status(self):
+        """Summary of the scan, marking the TUs with partial results"""
+        return {
+            'complete': self.complete,
+            'skipped': sorted(self.skipped),
+            'timed_out': sorted(self.timed_out),
+            'reduced_effort': sorted(self.reduced_effort)
+        }
+
+    def order(self, parameters):
+        """Sorts the parameters, recently changed and longest first"""
+        return sorted(parameters, key=lambda opts: (
+            recently_changed(opts['source'], self.changed_since),
+            self.timings.estimate(opts['source'])), reverse=True)
+
+    def _remaining(self):
+        """Seconds left until the deadline (None without deadline)"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def _limit(self, opts):
+        """Applies the per-TU budget and the deadline to opts"""
+        opts = dict(opts)
+        timeout = self._remaining()
+        if self.budget is not None:
+            if self.timings.estimate(opts['source']) > self.budget:
+                if opts['source'] not in self.reduced_effort:
+                    self.reduced_effort.append(opts['source'])
+                opts['direct_args'] = opts['direct_args'] + [
+                    '-Xclang', '-analyzer-max-loop',
+                    '-Xclang', str(REDUCED_MAXLOOP)]
+            budget_timeout = self.budget * BUDGET_TIMEOUT_FACTOR
+            timeout = budget_timeout if timeout is None \
+                else min(timeout, budget_timeout)
+        opts['timeout'] = timeout
+        return opts
+
+    def reserved(self, running):
+        """Returns the memory the running entries are expected to take in
+        addition to their current resident set size (in bytes)"""
+        while self._started is not None and not self._started.empty():
+            source, group = self._started.get()
+            self._groups[source] = group
+        sizes = process_group_rss() if any(
+            opts['source'] in self._groups for opts, _ in running) else {}
+        return sum(max(0, self.memory.estimate(opts['source']) -
+                       sizes.get(self._groups.get(opts['source']), 0))
+                   for opts, _ in running)
+
+    def _admit(self, opts, running):
+        """Returns True if opts may be started next"""
+        if not running:
+            return True
+        available = available_memory()
+        if available is None:
+            return True
+        return self.memory.estimate(opts['source']) <= \
+            available - self.reserved(running) - MEMORY_RESERVE
+
+    def _finish(self, run_result):
+        """Handles the result of a finished analyzer run, returns True if
+        the analyzer was killed"""
+        source, elapsed, usage, result = run_result
+        self._groups.pop(source, None)
+        analyze.logging_analyzer_output(result)
+        if usage['timed_out']:
+            LOGGER.warning("Analyzer timed out for %s", source)
+            self.timed_out.append(source)
+            self.timings.record(source, max(elapsed,
+                                            self.timings.get(source, 0)))
+            return False
+        if usage['peak_rss']:
+            self.memory.record(source, max(usage['peak_rss'],
+                                           self.memory.get(source, 0)))
+        if is_killed(result):
+            return True
+        if result:
+            self.elapsed[source] = elapsed
+            self.timings.record(source, elapsed)
+            if self.profile is not None:
+                self.profile.add(source, elapsed, result)
+        return False
+
+    def _run_pass(self, parameters, jobs):
+        """Runs the analyzer against parameters with at most jobs parallel
+        runs and returns the parameters of the killed runs"""
+        pending = deque(parameters)
+        running = []
+        killed = []
+        self._started = multiprocessing.Queue()
+        pool = multiprocessing.Pool(jobs, initializer=_init_worker,
+                                    initargs=(self._started,))
+        try:
+            while pending or running:
+                remaining = self._remaining()
+                if remaining is not None and remaining <= 0:
+                    self.skipped.extend(opts['source'] for opts in pending)
+                    pending.clear()
+                while pending and len(running) < jobs and \
+                        self._admit(pending[0], running):
+                    opts = pending.popleft()
+                    running.append((opts, pool.apply_async(
+                        timed_run, (self._limit(opts),))))
+
+                if not running:
+                    continue
+                running[0][1].wait(self.poll_interval)
+                for item in [item for item in running if item[1].ready()]:
+                    running.remove(item)
+                    if self._finish(item[1].get()):
+                        killed.append(item[0])
+        finally:
+            pool.close()
+            pool.join()
+            self._started = None
+            self._groups.clear()
+        return killed
+
+    def run(self, parameters):
+        """Runs the analyzer against all parameters
+
+        :param parameters: analyzer parameters of the compilation entries
+        :return: dict of source -> wall time of this run
+        """
+        jobs = self.jobs
+        pending = self.order(parameters)
+        while pending:
+            killed = self._run_pass(pending, jobs)
+            if not killed or jobs == 1:
+                for opts in killed:
+                    LOGGER.error("Analyzer killed for %s", opts['source'])
+                    self.skipped.append(opts['source'])
+                break
+            jobs = max(1, jobs // 2)
+            LOGGER.warning("Retrying %d killed analyzer runs with %d jobs",
+                           len(killed), jobs)
+            pending = killed
+
+        self.timings.save()
+        self.memory.save()
+        for source, elapsed in critical_path(self.elapsed, self.jobs):
+            LOGGER.warning("Critical path: %s (%.1fs)", source, elapsed)
+        return self.elapsed
+
+
+def run_analyzer_parallel(compilations, args, **kwargs):
+    """Runs the analyzer against the given compilations, longest first
+
+    :param compilations: entries of the compilation database
+    :param args: parsed arguments of ci-vulnscan
+    :param kwargs: passed to the AnalyzerScheduler (timings, memory,
+        deadline, changed_since, profile)
+    :return: the AnalyzerScheduler, holding the timings and the scan status
+    """
+    consts = analyze.analyze_parameters(args)
+    parameters = [dict(compilation.as_dict(), **consts)
+                  for compilation in compilations]
+    jobs = 1 if args.verbose > 2 else multiprocessing.cpu_count()
+    kwargs.setdefault('budget', getattr(args, 'tu_budget', None))
+    scheduler = AnalyzerScheduler(jobs, **kwargs)
+    scheduler.run(parameters)
+    return scheduler
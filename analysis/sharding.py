@@ -0,0 +1,205 @@
+"""Module splitting a ci-vulnscan run into shards running on several machines
+and merging the shard reports afterwards
+
+"""
+import argparse
+import glob
+import heapq
+import json
+import logging
+import os
+import re
+
+import jsonschema
+
+from settings import (CI_REPORT_FILE, CI_REPORT_STATUS_FILE, LLVM_REPORT_FILE,
+                      SA_VULNERABILITY_SCHEMA, command_entry_point)
+
+from .deduplication import IssueIndex
+
+LOGGER = logging.getLogger(name=__name__)
+
+SHARD_REGEX = re.compile(r"^([0-9]+)/([0-9]+)$")
+SHARD_FILE_REGEX = re.compile(r"-([0-9]+)-of-([0-9]+)\.json$")
+
+with open(SA_VULNERABILITY_SCHEMA, 'r') as schema:
+    VULNERABILITY_SCHEMA = json.load(schema)
+
+__all__ = ['parse_shard', 'split_shards', 'select_shard', 'shard_file_name',
+           'merge_reports', 'merge_llvm_reports', 'merge_main']
+
+
+def parse_shard(value):
+    """Parses a shard given as i/N (1 <= i <= N) into (i, N)"""
+    match = SHARD_REGEX.match(value)
+    if match:
+        index, count = int(match.group(1)), int(match.group(2))
+        if 1 <= index <= count:
+            return index, count
+    raise argparse.ArgumentTypeError(
+        "invalid shard '{}', expected i/N with 1 <= i <= N".format(value))
+
+
+def _source_size(compilation):
+    try:
+        return os.path.getsize(compilation.source)
+    except OSError:
+        return 0
+
+
+def split_shards(compilations, count):
+    """Splits compilations into count size-balanced shards
+
+    The split only depends on the compilation database and the sizes of the
+    source files, hence every machine computes the same shards.
+
+    :param compilations: entries of the compilation database
+    :param count: number of shards
+    :return: list of count lists of compilations
+    """
+    entries = sorted(((_source_size(entry), entry.source, index, entry)
+                      for index, entry in enumerate(compilations)),
+                     key=lambda item: (-item[0], item[1], item[2]))
+    shards = [(0, index, []) for index in range(count)]
+    for size, _, _, entry in entries:
+        total, index, shard = heapq.heappop(shards)
+        shard.append(entry)
+        heapq.heappush(shards, (total + size, index, shard))
+    return [shard for _, _, shard in sorted(shards, key=lambda s: s[1])]
+
+
+def select_shard(compilations, shard):
+    """Returns the compilations of shard (i, N)"""
+    index, count = shard
+    return split_shards(compilations, count)[index - 1]
+
+
+def shard_file_name(file_name, shard):
+    """Returns the name of a report file written by shard (i, N)"""
+    if shard is None:
+        return file_name
+    base, extension = os.path.splitext(file_name)
+    return "{}-{}-of-{}{}".format(base, shard[0], shard[1], extension)
+
+
+def find_shard_files(paths, file_name=CI_REPORT_FILE):
+    """Collects the shard files of file_name in paths
+
+    :param paths: shard files or directories containing them
+    :return: sorted list of ((i, N), path)
+    """
+    base, extension = os.path.splitext(file_name)
+    file_name = os.path.basename(file_name)
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = glob.iglob(os.path.join(
+                path, "{}-*-of-*{}".format(base, extension)))
+        else:
+            candidates = [path]
+        for candidate in candidates:
+            match = SHARD_FILE_REGEX.search(candidate)
+            if not match:
+                continue
+            shard = int(match.group(1)), int(match.group(2))
+            if os.path.basename(candidate) == shard_file_name(file_name,
+                                                              shard):
+                found.append((shard, candidate))
+    return sorted(found)
+
+
+def _check_complete(shards):
+    """Logs missing shards and returns True if all shards are present"""
+    counts = {count for (_, count), _ in shards}
+    complete = len(counts) == 1
+    if len(counts) > 1:
+        LOGGER.error("Shard reports of different splits found: %s",
+                     sorted(counts))
+    for count in counts:
+        missing = set(range(1, count + 1)) - \
+            {index for (index, total), _ in shards if total == count}
+        for index in sorted(missing):
+            LOGGER.error("Report of shard %d/%d is missing", index, count)
+        complete = complete and not missing
+    return complete
+
+
+def _merge_findings(shards):
+    """Returns the deduplicated findings of the shard files"""
+    index = IssueIndex()
+    for _, file in shards:
+        with open(file, 'r') as report_file:
+            for vulnerability in json.load(report_file):
+                index.add(vulnerability)
+    return index.vulnerabilities
+
+
+def merge_reports(paths):
+    """Merges shard reports into a single deduplicated vulnerability list
+
+    :param paths: shard report files or directories containing them
+    :return: (vulnerabilities, status)
+    """
+    shards = find_shard_files(paths)
+    complete = _check_complete(shards)
+
+    vulnerabilities = _merge_findings(shards)
+    jsonschema.validate(vulnerabilities, VULNERABILITY_SCHEMA)
+
+    status = {'complete': complete, 'shards': len(shards)}
+    for _, file in find_shard_files(paths, CI_REPORT_STATUS_FILE):
+        with open(file, 'r') as status_file:
+            shard_status = json.load(status_file)
+        status['complete'] = status['complete'] and \
+            shard_status.pop('complete', True)
+        for key, values in shard_status.items():
+            if isinstance(values, list):
+                status[key] = sorted(set(status.get(key, [])) | set(values))
+    return vulnerabilities, status
+
+
+def merge_llvm_reports(paths):
+    """Merges the reports of the LLVM passes of the shards
+
+    :param paths: shard report files or directories containing them
+    :return: (vulnerabilities, status), None if no shard ran the passes
+    """
+    shards = find_shard_files(paths, LLVM_REPORT_FILE)
+    if not shards:
+        return None
+    return _merge_findings(shards), {'complete': _check_complete(shards),
+                                     'shards': len(shards)}
+
+
+@command_entry_point
+def merge_main(args=None):
+    """Merges the reports of a sharded ci-vulnscan run"""
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('paths', metavar="<path>", nargs="+",
+                        help="""shard reports or directories containing
+                        them""")
+    parser.add_argument('--output', '-o', metavar="<path>", default=".",
+                        help="""directory where the merged report is
+                        written""")
+    args = parser.parse_args(args)
+    if not find_shard_files(args.paths):
+        parser.error("no shard reports found in {}".format(
+            ", ".join(args.paths)))
+
+    vulnerabilities, status = merge_reports(args.paths)
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, CI_REPORT_FILE), "w") as report_file:
+        json.dump(vulnerabilities, report_file)
+    llvm = merge_llvm_reports(args.paths)
+    if llvm is not None:
+        llvm_vulnerabilities, status['llvm'] = llvm
+        status['complete'] = status['complete'] and \
+            status['llvm']['complete']
+        with open(os.path.join(args.output, LLVM_REPORT_FILE),
+                  "w") as report_file:
+            json.dump(llvm_vulnerabilities, report_file)
+    with open(os.path.join(args.output, CI_REPORT_STATUS_FILE),
+              "w") as status_file:
+        json.dump(status, status_file, indent=1)
+    return 0 if status['complete'] else 1
@@ -0,0 +1,152 @@
+"""Module running the clang SA in two tiers
+
+The fast tier runs the cheap checkers against every translation unit. The
+expensive tier (alpha and taint checkers) only runs against the TUs the fast
+tier found something in, recently changed TUs and allowlisted ones.
+"""
+import argparse
+import fnmatch
+import glob
+import logging
+import os
+import plistlib
+import time
+
+from .scheduling import TimingDatabase, recently_changed, run_analyzer_parallel
+
+LOGGER = logging.getLogger(name=__name__)
+
+# checkers (or checker packages) only run in the expensive tier
+EXPENSIVE_CHECKERS = ['alpha', 'ci.NetworkTaint']
+
+__all__ = ['split_checkers', 'load_allowlist', 'flagged_sources',
+           'TieredScheduler', 'run_tiered']
+
+
+def is_expensive(checker):
+    """Returns True if checker belongs to the expensive tier"""
+    return any(checker == name or checker.startswith(name + ".")
+               for name in EXPENSIVE_CHECKERS)
+
+
+def split_checkers(checkers):
+    """Splits checkers into (cheap, expensive) checkers"""
+    return ([checker for checker in checkers if not is_expensive(checker)],
+            [checker for checker in checkers if is_expensive(checker)])
+
+
+def load_allowlist(file):
+    """Reads source file patterns (fnmatch) always analyzed by the expensive
+    tier, one per line. Empty lines and lines starting with # are ignored."""
+    if not file:
+        return []
+    with open(file, "r") as handle:
+        return [os.path.abspath(line.strip()) for line in handle
+                if line.strip() and not line.startswith("#")]
+
+
+def flagged_sources(reports, index=None):
+    """Returns the files diagnostics were reported in, together with the
+    translation units including them
+
+    :param reports: plist reports of clang SA
+    :param index: DependencyIndex resolving headers to translation units
+    """
+    files = set()
+    for report in reports:
+        with open(report, 'rb') as report_file:
+            content = plistlib.load(report_file)
+        for diag in content.get('diagnostics', []):
+            files.add(os.path.abspath(
+                content['files'][diag['location']['file']]))
+    if index is None:
+        # compile imports analysis, hence the deferred import
+        from compile import DependencyIndex  # pylint: disable=cyclic-import
+        index = DependencyIndex()
+    return files | index.affected(files)
+
+
+class TieredScheduler(object):
+    """Runs the fast tier against all TUs and the expensive tier against
+    the selected ones"""
+
+    def __init__(self, args, allowlist=None, index=None, **kwargs):
+        """Initialization.
+
+        :param args: parsed arguments of ci-vulnscan
+        :param allowlist: source patterns always analyzed by both tiers
+        :param index: DependencyIndex resolving flagged headers
+        :param kwargs: passed to run_analyzer_parallel
+        """
+        self.args = args
+        self.allowlist = allowlist or []
+        self.index = index
+        self.kwargs = kwargs
+        self.schedulers = []
+        self.tiers = {}
+
+    @property
+    def complete(self):
+        """True if both tiers analyzed their TUs completely"""
+        return all(scheduler.complete for scheduler in self.schedulers)
+
+    @property
+    def status(self):
+        """Summary of both tiers, including their wall times"""
+        status = {'complete': self.complete}
+        for scheduler in self.schedulers:
+            for key, values in scheduler.status.items():
+                if isinstance(values, list):
+                    status[key] = sorted(set(status.get(key, [])) |
+                                         set(values))
+        status['tiers'] = self.tiers
+        return status
+
+    def selected(self, source, flagged):
+        """Returns True if the expensive tier analyzes source"""
+        changed_since = self.kwargs.get('changed_since')
+        return source in flagged or \
+            (changed_since is not None and
+             recently_changed(source, changed_since)) or \
+            any(fnmatch.fnmatch(source, pattern)
+                for pattern in self.allowlist)
+
+    def _run_tier(self, name, compilations, args, **kwargs):
+        start = time.monotonic()
+        kwargs = dict(self.kwargs, **kwargs)
+        self.schedulers.append(run_analyzer_parallel(compilations, args,
+                                                     **kwargs))
+        self.tiers[name] = {'units': len(compilations),
+                            'seconds': time.monotonic() - start}
+        LOGGER.warning("%s tier analyzed %d TUs in %.1fs", name,
+                       len(compilations), self.tiers[name]['seconds'])
+
+    def run(self, compilations):
+        """Runs both tiers against the compilations"""
+        compilations = list(compilations)
+        cheap, _ = split_checkers(self.args.enable_checker)
+        fast_args = argparse.Namespace(**vars(self.args))
+        fast_args.enable_checker = cheap
+        # the timings of the cheap checkers must not be taken for the
+        # timings of a full analysis
+        self._run_tier('fast', compilations, fast_args,
+                       timings=TimingDatabase('analyzer-timings-fast'))
+
+        reports = glob.iglob(os.path.join(self.args.output, "report-*.plist"))
+        flagged = flagged_sources(reports, self.index)
+        selected = [entry for entry in compilations
+                    if self.selected(entry.source, flagged)]
+        self._run_tier('expensive', selected, self.args)
+        return self
+
+
+def run_tiered(compilations, args, **kwargs):
+    """Runs the analyzer in two tiers against the compilations
+
+    :param compilations: entries of the compilation database
+    :param args: parsed arguments of ci-vulnscan
+    :param kwargs: passed to run_analyzer_parallel
+    :return: the TieredScheduler, holding the scan status
+    """
+    allowlist = load_allowlist(getattr(args, 'expensive_allowlist', None))
+    return TieredScheduler(args, allowlist, **kwargs).run(compilations)
@@ -1,5 +1,6 @@
 """Module for build/compile interception
 """
 from .clang import build_main, compile_main
+from .dependencies import DependencyIndex
 
-__all__ = ['build_main', 'compile_main']
+__all__ = ['build_main', 'compile_main', 'DependencyIndex']
@@ -4,13 +4,14 @@ This module provides support to compile files with clang and the
 """
 import glob
 import itertools
+import json
 import logging
 import re
 import sys
 import shlex
 import subprocess
 from collections import defaultdict
-from os import environ as env, path, getcwd, chdir
+from os import environ as env, path, getcwd, chdir, remove
 from pprint import pformat
 from pathlib import Path
 from shutil import which
@@ -22,10 +23,14 @@ from libscanbuild import intercept, arguments, compilation
 import yaml
 import yaml.representer
 
-from analysis import ClangAnalyzer
+from analysis import (ANALYZER_OPTIONS_ENV, ClangAnalyzer, ResultStore,
+                      RESULT_STORE_ENV, analysis_configuration)
 from settings import (CLANG, CLANGPP, CLANG_VERSION, CROSS_COMPILE_PATH, FUZZING_DIR,
+                      DEPENDENCY_INDEX_FILE, RESULT_STORE_DIR,
                       command_entry_point)
 
+from .dependencies import DependencyIndex, INDEX_ENV
+
 # treat defaultdicts as dicts in yaml
 yaml.add_representer(defaultdict, yaml.representer.Representer.represent_dict)
 
@@ -157,7 +162,7 @@ class CIArgumentListFilter(ArgumentListFilter):
         return input_name, output_name
 
 
-class Clang(object):
+class Clang(object):  # pylint: disable=too-many-instance-attributes
     """
     Provides bindings to compile a file with clang and the intended
     compiler (default CC)
@@ -166,6 +171,8 @@ class Clang(object):
     def __init__(self, args, name="clang"):
         self.cc = None
         self.options = {}
+        self.dependencies = []
+        self.args = args
 
         self.cmd = self.get_clang_path(name, CLANG_VERSION)
         self.get_default_compiler(name)
@@ -179,19 +186,41 @@ class Clang(object):
             'obj': obj_file,
             'bc': obj_file + ".bc",
             'yml': obj_file + ".yml",
+            'dep': obj_file + ".bc.d",
             'plist': src_file + ".plist",
         }
 
     def analyze(self, cmd):
-        """Here, we will implement the analysis passes based on the static clang
-        analyzer and vfinder
+        """Analyzes the compiled file with the clang static analyzer and
+        stores the findings in the result store of the build (only if ci-build
+        runs with --analyze)
         """
         argf = self.arg_filter
-        cmd = cmd + argf.compileArgs
-        if not (argf.isLinkOnly or argf.isDumpCommand or
-                argf.isPreprocessOnly or argf.isAssembly):
-            analyzer = ClangAnalyzer(cmd)
-            analyzer.run(self.files["src"])
+        if RESULT_STORE_ENV not in env or argf.isLinkOnly or \
+                argf.isDumpCommand or argf.isPreprocessOnly or \
+                argf.isAssembly:
+            return
+        # the checkers and options of the ci-vulnscan run reusing the findings
+        options = json.loads(env[ANALYZER_OPTIONS_ENV]) \
+            if ANALYZER_OPTIONS_ENV in env else None
+        analyzer = ClangAnalyzer(cmd + argf.compileArgs, options)
+        vulnerabilities = analyzer.run(self.files["src"])
+        if vulnerabilities is not None:
+            source = path.abspath(self.files["src"])
+            ResultStore(configuration=analysis_configuration(
+                analyzer.options)).record(
+                source, vulnerabilities, self.dependencies,
+                flags=self.database_flags(source))
+
+    def database_flags(self, source):
+        """Returns the flags of source as ci-build writes them to the
+        compilation database (None if it is not compiled)"""
+        execution = libscanbuild.Execution(pid=0, cwd=getcwd(),
+                                           cmd=["cc"] + self.args)
+        for entry in compilation.Compilation.iter_from_execution(execution):
+            if entry.source == source:
+                return entry.flags
+        return None
 
     def compile(self):
         """Compiles the intended file with clang and emits llvm bc file
@@ -209,6 +238,7 @@ class Clang(object):
             cmd.extend(self.arg_filter.inputList)
         elif not self.arg_filter.isLinkOnly:
             cmd.extend(self.clang_compile_args)
+            cmd.extend(["-MD", "-MF", self.files["dep"]])
             cmd.extend(["-emit-llvm", "-c", "-o", self.files["bc"],
                         self.files["src"]])
 
@@ -232,6 +262,9 @@ class Clang(object):
         if self.files["bc"]:
             self._save_linking_information()
 
+        if path.isfile(self.files["dep"]):
+            self._save_dependency_information()
+
         self.analyze(base_cmd)
 
         return proc.returncode
@@ -298,6 +331,19 @@ class Clang(object):
             LOGGER.warning("CC (%s) does not exist", cc)
             raise Exception()
 
+    def _save_dependency_information(self):
+        """Adds the headers included by the source file to the project's
+        dependency index (only if ci-build runs)
+        """
+        try:
+            if INDEX_ENV in env:
+                self.dependencies = DependencyIndex().record_depfile(
+                    self.files["src"], self.files["dep"])
+        except OSError as ex:
+            LOGGER.warning("Dependency information failed: %s", ex)
+        finally:
+            remove(self.files["dep"])
+
     def _save_linking_information(self):
         """Stores linking information to a yaml file
         """
@@ -377,8 +423,26 @@ def intercept_build(args):
         '--fuzzing-targets',
         action='store_true',
         help="""Build fuzzing targets""")
+    parser.add_argument(
+        '--analyze',
+        action='store_true',
+        help="""Analyze every compiled file with the clang static analyzer
+        during the build, ci-vulnscan --from-build reuses the findings""")
+    parser.add_argument(
+        '--analyzer-options',
+        metavar='<ci-vulnscan options>',
+        default="",
+        help="""Checker and analyzer options of the ci-vulnscan --from-build
+        run, e.g. "--maxloop 8 --enable-checker security", the build-time
+        analysis runs with the same ones""")
     args = parser.parse_args(args)
     chdir(args.cwd)
+    env[INDEX_ENV] = path.join(getcwd(), DEPENDENCY_INDEX_FILE)
+    if args.analyze:
+        env[RESULT_STORE_ENV] = path.join(getcwd(), RESULT_STORE_DIR)
+        env[ANALYZER_OPTIONS_ENV] = json.dumps(
+            ClangAnalyzer.parse_analyzer_options(
+                shlex.split(args.analyzer_options)))
 
     if args.sanitize_build:
         if not args.build:
@@ -413,6 +477,7 @@ def intercept_build(args):
 
     logging.debug('Parsed arguments: %s', args)
     exit_code, current = intercept.capture(args)
+    DependencyIndex().compact()
 
     # To support incremental builds, it is desired to read elements from
     # an existing compilation database from a previous run.
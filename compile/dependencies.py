@@ -0,0 +1,184 @@
+"""
+This module keeps a project-wide index of the headers included by each
+translation unit, captured from the depfiles clang writes during ci-cc
+"""
+import fcntl
+import json
+import logging
+import os
+from contextlib import contextmanager
+from os import environ as env
+
+from settings import DEPENDENCY_INDEX_FILE
+from storage import atomic_write
+
+LOGGER = logging.getLogger(name=__name__)
+
+INDEX_ENV = "CI_DEPENDENCY_INDEX"
+JOURNAL_SUFFIX = ".log"
+
+
+def parse_depfile(content):
+    """Parses the content of a make-style depfile (as written by -MD)
+
+    :param content: content of the depfile
+    :return: list of dependencies (the first one is the source file)
+    """
+    content = content.replace("\\\r\n", " ").replace("\\\n", " ")
+    _, _, prerequisites = content.partition(": ")
+    dependencies, current, chars = [], [], iter(prerequisites)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, "")
+            if escaped not in " #":
+                current.append(char)
+            current.append(escaped)
+        elif char == "$":
+            escaped = next(chars, "")
+            current.append("$" if escaped == "$" else char + escaped)
+        elif char.isspace():
+            if current:
+                dependencies.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    if current:
+        dependencies.append("".join(current))
+    return dependencies
+
+
+@contextmanager
+def locked(file):
+    """Holds an exclusive lock on file (created if necessary)"""
+    with open(file, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield handle
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class DependencyIndex(object):
+    """Reverse index from headers to the translation units including them
+
+    Concurrent ci-cc processes append their records to a journal next to the
+    index, recording never reads the index. It is loaded on the first query,
+    which replays the journal, compact() folds the journal into the index
+    file, which stores every path only once.
+    """
+
+    def __init__(self, file=None):
+        """Initialization.
+
+        :param file: index file, defaults to $CI_DEPENDENCY_INDEX or
+            DEPENDENCY_INDEX_FILE in the current working directory
+        """
+        if file is None:
+            file = env.get(INDEX_ENV, DEPENDENCY_INDEX_FILE)
+        self.file = os.path.abspath(file)
+        self.journal = self.file + JOURNAL_SUFFIX
+        self._units = None
+        self._reverse = None
+
+    def reload(self):
+        """Reads the index and replays the journal"""
+        self._units = {}
+        self._reverse = None
+        try:
+            with open(self.file, "r") as index_file:
+                data = json.load(index_file)
+            paths = data["paths"]
+            for unit, dependencies in data["units"].items():
+                self._units[paths[int(unit)]] = [paths[i]
+                                                 for i in dependencies]
+        except (OSError, ValueError, KeyError, IndexError):
+            pass
+        try:
+            with open(self.journal, "r") as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # partially written record
+                    self._units[record["source"]] = record["dependencies"]
+        except OSError:
+            pass
+
+    def record(self, source, dependencies):
+        """Appends the dependencies of a translation unit to the journal"""
+        line = json.dumps({"source": source,
+                           "dependencies": dependencies}) + "\n"
+        with locked(self.journal) as journal:
+            journal.write(line)
+        if self._units is not None:
+            self._units[source] = dependencies
+            self._reverse = None
+
+    def record_depfile(self, source, depfile, cwd=None):
+        """Records the dependencies found in depfile for source
+
+        :param cwd: directory relative paths in the depfile refer to
+        :return: the recorded dependencies
+        """
+        cwd = cwd or os.getcwd()
+        with open(depfile, "r") as handle:
+            dependencies = parse_depfile(handle.read())
+        source = os.path.normpath(os.path.join(cwd, source))
+        dependencies = sorted({os.path.normpath(os.path.join(cwd, dep))
+                               for dep in dependencies} - {source})
+        self.record(source, dependencies)
+        return dependencies
+
+    def compact(self):
+        """Folds the journal into the index file"""
+        with locked(self.journal):
+            self.reload()
+            ids = {}
+            units = {}
+            for unit, dependencies in sorted(self._units.items()):
+                unit_id = ids.setdefault(unit, len(ids))
+                units[unit_id] = [ids.setdefault(dep, len(ids))
+                                  for dep in dependencies]
+            paths = sorted(ids, key=ids.get)
+            atomic_write(self.file, json.dumps({"paths": paths,
+                                                "units": units}))
+            os.remove(self.journal)
+
+    def _loaded(self):
+        """Returns the units of the index, loading it if necessary"""
+        if self._units is None:
+            self.reload()
+        return self._units
+
+    def _reverse_index(self):
+        if self._reverse is None:
+            reverse = {}
+            for unit, dependencies in self._loaded().items():
+                for dependency in dependencies:
+                    reverse.setdefault(dependency, set()).add(unit)
+            self._reverse = reverse
+        return self._reverse
+
+    @property
+    def units(self):
+        """All known translation units"""
+        return set(self._loaded())
+
+    def dependencies(self, source):
+        """Returns the headers included by source"""
+        return list(self._loaded().get(os.path.abspath(source), []))
+
+    def including(self, header):
+        """Returns the translation units including header"""
+        return set(self._reverse_index().get(os.path.abspath(header), set()))
+
+    def affected(self, paths):
+        """Returns the translation units which need to be re-analyzed after
+        paths (sources or headers) changed"""
+        affected = set()
+        for path in paths:
+            path = os.path.abspath(path)
+            if path in self._loaded():
+                affected.add(path)
+            affected |= self._reverse_index().get(path, set())
+        return affected
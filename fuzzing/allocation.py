@@ -0,0 +1,160 @@
+"""Module allocating the fuzzing time of a campaign adaptively
+
+Instead of giving every target the same share, the campaign runs in short
+epochs. Before every epoch the slots are given to the targets with the best
+upper confidence bound (UCB1) of their reward, the new features found per
+core-second, and the cores are split among the chosen targets in proportion
+to their scores: every chosen target gets a core, the others are run as
+additional libFuzzer workers of the most promising targets. Targets whose
+coverage saturated are hence run less often and on fewer cores, while every
+target is still tried now and then. The rewards are kept between runs, so a
+campaign starts with the priorities learned before.
+"""
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import JsonStore
+
+from .scheduling import FuzzingScheduler
+
+LOGGER = logging.getLogger(name=__name__)
+
+# seconds of an epoch
+EPOCH_TIME = 60
+# epochs shorter than this are not started
+MIN_EPOCH_TIME = 10
+# weight of the reward of the last epoch in the average reward of a target
+REWARD_WEIGHT = 0.3
+# weight of the exploration term of the upper confidence bound
+EXPLORATION = 1.0
+# share of the epochs of earlier runs kept, older rewards count less
+PULL_DECAY = 0.5
+
+__all__ = ['TargetPriorities', 'AdaptiveScheduler']
+
+
+class TargetPriorities(JsonStore):
+    """Average reward and number of epochs of every target"""
+
+    def __init__(self, name="ci-fuzzing-priorities", directory=None):
+        super().__init__(name, directory=directory)
+        # earlier runs count less, saturated targets are tried again
+        for entry in self.values():
+            entry['epochs'] *= PULL_DECAY
+
+    def record(self, target, reward):
+        """Adds the reward of an epoch of target"""
+        entry = self.setdefault(os.path.basename(target),
+                                {'epochs': 0, 'reward': reward})
+        entry['reward'] += REWARD_WEIGHT * (reward - entry['reward'])
+        entry['epochs'] += 1
+
+    def score(self, target):
+        """Returns the upper confidence bound of the reward of target"""
+        entry = self.get(os.path.basename(target))
+        if not entry or entry['epochs'] <= 0:
+            return math.inf
+        best = max(value['reward'] for value in self.values()) or 1.0
+        total = sum(value['epochs'] for value in self.values())
+        return entry['reward'] / best + EXPLORATION * math.sqrt(
+            2 * math.log(max(total, 1)) / entry['epochs'])
+
+    def choose(self, targets, count):
+        """Returns the count targets with the best scores"""
+        return sorted(targets, key=self.score, reverse=True)[:count]
+
+    def allocate(self, targets, count, cores):
+        """Splits cores among the count targets with the best scores, in
+        proportion to their scores (largest remainder)
+
+        Untried targets count as much as the best tried one.
+
+        :return: dict of target -> cores, every chosen target gets one
+        """
+        chosen = self.choose(targets, min(count, cores))
+        scores = [self.score(target) for target in chosen]
+        default = max([score for score in scores if score != math.inf] or
+                      [1.0])
+        weights = [default if score == math.inf else max(score, 0.0)
+                   for score in scores]
+        if not sum(weights):
+            weights = [1.0] * len(chosen)
+        spare = cores - len(chosen)
+        shares = [spare * weight / sum(weights) for weight in weights]
+        allocation = {target: 1 + int(share)
+                      for target, share in zip(chosen, shares)}
+        remainders = sorted(range(len(chosen)), reverse=True,
+                            key=lambda index: shares[index] % 1)
+        for index in remainders[:spare - sum(int(share)
+                                             for share in shares)]:
+            allocation[chosen[index]] += 1
+        return allocation
+
+
+class AdaptiveScheduler(FuzzingScheduler):
+    """Runs the targets in epochs, the slots and cores of every epoch are
+    given to the most promising targets"""
+
+    def __init__(self, options, priorities, epoch_time=EPOCH_TIME, **kwargs):
+        """Initialization.
+
+        :param priorities: TargetPriorities learned in earlier runs
+        :param epoch_time: seconds of an epoch
+        :param kwargs: arguments of FuzzingScheduler, total_time is required
+        """
+        super().__init__(options, **kwargs)
+        self.priorities = priorities
+        self.epoch_time = epoch_time
+        # cores of the targets of the current epoch
+        self.allocation = {}
+        self.status['epochs'] = []
+
+    def budget(self, count):  # pylint: disable=unused-argument
+        budget = self.epoch_time
+        if self.target_time is not None:
+            budget = min(budget, self.target_time)
+        return min(budget, int(self.deadline - time.monotonic()))
+
+    def target_workers(self, target):
+        return self.allocation.get(target, self.workers)
+
+    def _record(self, key, entry):
+        super()._record(key, entry)
+        if key == 'skipped' or entry['seconds'] <= 0:
+            return
+        # targets without status lines (e.g. crashing at once) gain nothing
+        metrics = entry.get('metrics')
+        gained = max(0, metrics['final']['ft'] - metrics['initial']['ft']) \
+            if metrics else 0
+        with self._lock:
+            self.priorities.record(entry['target'], gained / (
+                entry['seconds'] * self.target_workers(entry['target'])))
+
+    def run(self, targets):
+        """Runs epochs until the total budget is used up"""
+        self.deadline = time.monotonic() + self.total_time
+        results = []
+        with ThreadPoolExecutor(max_workers=self.slots) as executor:
+            self._executor = executor
+            while self.deadline - time.monotonic() >= min(MIN_EPOCH_TIME,
+                                                          self.epoch_time):
+                self.allocation = self.priorities.allocate(
+                    targets, self.slots, self.jobs)
+                LOGGER.info("Epoch %d: %s", len(self.status['epochs']) + 1,
+                            ", ".join("{} ({:d} cores)".format(target, cores)
+                                      for target, cores in
+                                      self.allocation.items()))
+                self.status['epochs'].append(dict(self.allocation))
+                results += executor.map(
+                    lambda target: self.run_target(target, len(targets)),
+                    list(self.allocation))
+        self.priorities.save()
+        self.status['priorities'] = {
+            name: dict(entry, score=self.priorities.score(name))
+            for name, entry in self.priorities.items()}
+        self._finish()
+        return [vulnerability for result in results
+                for vulnerability in result]
@@ -0,0 +1,110 @@
+"""Module bucketing the crashes found by fuzzing
+
+The inputs libFuzzer writes are named by the hash of their content, hence
+a bug found with many inputs used to be reported many times. Crashes are
+now put into buckets keyed on the bug type and the normalized top frames of
+their stack trace. The buckets are kept between runs, crashes falling into
+a known bucket are counted instead of being reported again.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from storage import JsonStore
+
+# number of frames of the stack trace making up the signature
+TOP_FRAMES = 3
+# inputs kept per bucket
+BUCKET_INPUTS = 5
+# suffixes of function clones made by the compiler
+CLONE_SUFFIX_REGEX = re.compile(
+    r"(\.(localalias|isra|constprop|part|cold|lto_priv)(\.[0-9]+)?)+$")
+TEMPLATE_ARGS_REGEX = re.compile(r"<[^<>]*>")
+
+__all__ = ['normalize_frame', 'stack_frames', 'crash_signature',
+           'CrashIndex']
+
+
+def normalize_frame(event):
+    """Returns a frame of a path without the details which differ between
+    builds: template arguments, clone suffixes and, for frames without
+    function name, the directory of the module"""
+    function = event.get("message", "")
+    previous = None
+    while previous != function:
+        previous, function = function, TEMPLATE_ARGS_REGEX.sub("", function)
+    function = CLONE_SUFFIX_REGEX.sub("", function)
+    if function:
+        return function
+    return os.path.basename(event.get("location", {}).get("file", ""))
+
+
+def stack_frames(path, count=TOP_FRAMES):
+    """Returns the normalized top frames of a path, innermost first"""
+    frames = [normalize_frame(event) for event in reversed(path)
+              if event.get("kind") == "event"]
+    return [frame for frame in frames if frame][:count]
+
+
+def crash_signature(vulnerability, count=TOP_FRAMES):
+    """Returns the signature of the bucket of a finding"""
+    frames = stack_frames(vulnerability.get("path", []), count)
+    if not frames:
+        location = vulnerability.get("location", {})
+        frames = ["{}:{}".format(location.get("file", ""),
+                                 location.get("line", 0))]
+    content = json.dumps([vulnerability["type"], frames])
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class CrashIndex(JsonStore):
+    """Persistent buckets of the crashes of a project"""
+
+    def __init__(self, name="ci-crash-buckets", directory=None):
+        super().__init__(name, directory=directory)
+        self._lock = threading.Lock()
+        self.seen = {}
+        self.new = []
+
+    def add(self, vulnerability, target=None):
+        """Puts a finding into its bucket
+
+        :return: True if the bucket is new
+        """
+        signature = crash_signature(vulnerability)
+        crash_input = os.path.basename(vulnerability.get("test_unit", ""))
+        with self._lock:
+            self.seen[signature] = self.seen.get(signature, 0) + 1
+            bucket = self.get(signature)
+            new = bucket is None
+            if new:
+                self.new.append(signature)
+                bucket = self[signature] = {
+                    'type': vulnerability["type"],
+                    'frames': stack_frames(vulnerability.get("path", [])),
+                    'target': target, 'count': 0,
+                    'first_seen': time.time(), 'inputs': []}
+            bucket['count'] += 1
+            bucket['last_seen'] = time.time()
+            if crash_input and crash_input not in bucket['inputs'] and \
+                    len(bucket['inputs']) < BUCKET_INPUTS:
+                bucket['inputs'].append(crash_input)
+        return new
+
+    def save(self):
+        with self._lock:
+            super().save()
+
+    @property
+    def statistics(self):
+        """Buckets hit in this run and how often"""
+        return {
+            'buckets': len(self),
+            'new': len(self.new),
+            'hit': len(self.seen),
+            'crashes': sum(self.seen.values()),
+            'counts': self.seen
+        }
@@ -0,0 +1,200 @@
+"""Module keeping the corpora of the fuzzing targets between runs
+
+Every target has its own corpus, the inputs are named by the hash of their
+content, hence an input found by several runs or workers is kept once.
+Targets fuzz into an empty directory of their own and read the stored
+corpus, the new inputs are added to the store after the run.
+
+A corpus is minimized with libFuzzer's merge mode once it grew by a share
+of its size or once its last minimization is long enough ago. The size of
+every corpus, its features (as counted by the last merge) and the gains of
+the minimizations are kept in the statistics of the store. A corpus is
+minimized by one thread at a time, inputs added while it is merged are kept.
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from storage import JsonStore
+
+LOGGER = logging.getLogger(name=__name__)
+
+# a corpus is minimized once it grew by this share of its files
+MINIMIZE_GROWTH = 0.5
+# seconds after which a corpus is minimized regardless of its growth
+MINIMIZE_INTERVAL = 24 * 60 * 60
+# seconds a minimization may take
+MINIMIZE_TIMEOUT = 30 * 60
+MERGE_REGEX = re.compile(
+    r"MERGE-OUTER: ([0-9]+) new files with ([0-9]+) new features added")
+# minimizations kept in the statistics of a target
+HISTORY_LENGTH = 10
+
+__all__ = ['CorpusStore']
+
+
+def _content_hash(file):
+    """Returns the name libFuzzer gives an input, the sha1 of its content"""
+    with open(file, "rb") as handle:
+        return hashlib.sha1(handle.read()).hexdigest()
+
+
+def _size(directory):
+    """Returns the number of files and bytes in a directory"""
+    files = [os.path.join(directory, name) for name in os.listdir(directory)]
+    files = [file for file in files if os.path.isfile(file)]
+    return len(files), sum(os.path.getsize(file) for file in files)
+
+
+def _replace(corpus, merged, snapshot):
+    """Replaces a corpus by its merged version, the inputs added since the
+    snapshot of the corpus were not merged and are kept
+
+    :return: number of inputs kept
+    """
+    late = set(os.listdir(corpus)) - snapshot
+    for name in late:
+        if not os.path.exists(os.path.join(merged, name)):
+            shutil.move(os.path.join(corpus, name), os.path.join(merged, name))
+    stale = corpus + ".old"
+    os.rename(corpus, stale)
+    os.rename(merged, corpus)
+    shutil.rmtree(stale, ignore_errors=True)
+    return len(late)
+
+
+class CorpusStore(object):
+    """Corpora of the fuzzing targets, one directory per target"""
+
+    def __init__(self, directory):
+        """Initialization.
+
+        :param directory: directory of the store
+        """
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.statistics = JsonStore("corpus-statistics",
+                                    directory=self.directory)
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def _target_lock(self, target, purpose):
+        """Returns the lock of a target serializing purpose ('add' or
+        'minimize')"""
+        with self._lock:
+            return self._locks.setdefault(
+                (os.path.basename(target), purpose), threading.Lock())
+
+    def corpus(self, target):
+        """Returns the corpus directory of a target"""
+        directory = os.path.join(self.directory, os.path.basename(target))
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _update(self, target, **values):
+        """Updates the statistics of a target and saves them"""
+        with self._lock:
+            entry = self.statistics.setdefault(os.path.basename(target), {
+                'files': 0, 'bytes': 0, 'features': None, 'added': 0,
+                'minimized_at': None, 'minimizations': []})
+            for key, value in values.items():
+                entry[key] = value(entry[key]) if callable(value) else value
+            self.statistics.save()
+            return dict(entry)
+
+    def add(self, target, directory):
+        """Moves the inputs in directory to the corpus of target, inputs
+        already in the corpus are dropped
+
+        :return: number of new inputs
+        """
+        added = 0
+        with self._target_lock(target, 'add'):
+            corpus = self.corpus(target)
+            for name in os.listdir(directory):
+                file = os.path.join(directory, name)
+                if not os.path.isfile(file):
+                    continue
+                stored = os.path.join(corpus, _content_hash(file))
+                if os.path.exists(stored):
+                    os.unlink(file)
+                else:
+                    shutil.move(file, stored)
+                    added += 1
+            files, size = _size(corpus)
+            self._update(target, files=files, bytes=size,
+                         added=lambda count: count + added)
+        return added
+
+    def due(self, target):
+        """Returns True if the corpus of target is due for minimization (and
+        is not being minimized)"""
+        entry = self.statistics.get(os.path.basename(target))
+        if not entry or not entry['files'] or \
+                self._target_lock(target, 'minimize').locked():
+            return False
+        if entry['minimized_at'] is None or \
+                time.time() - entry['minimized_at'] > MINIMIZE_INTERVAL:
+            return True
+        return entry['added'] > MINIMIZE_GROWTH * (entry['files'] -
+                                                   entry['added'])
+
+    def minimize(self, target, timeout=MINIMIZE_TIMEOUT):
+        """Minimizes the corpus of target with libFuzzer's merge mode, the
+        minimized corpus replaces the stored one once it is complete
+
+        :param target: path of the fuzzing target
+        :return: statistics of the minimization, None if it failed or the
+            corpus is being minimized already
+        """
+        lock = self._target_lock(target, 'minimize')
+        if not lock.acquire(blocking=False):
+            LOGGER.info("The corpus of %s is being minimized already", target)
+            return None
+        try:
+            return self._merge(target, timeout)
+        finally:
+            lock.release()
+
+    def _merge(self, target, timeout):
+        """Replaces the corpus of target by the result of libFuzzer's merge
+        mode, see minimize"""
+        corpus = self.corpus(target)
+        snapshot = set(os.listdir(corpus))
+        before = _size(corpus)
+        merged = tempfile.mkdtemp(prefix=".merge-", dir=self.directory)
+        start = time.monotonic()
+        try:
+            output = subprocess.run(
+                [os.path.abspath(target), "-merge=1", merged, corpus],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                cwd=merged, timeout=timeout, check=True).stderr
+        except (OSError, subprocess.SubprocessError) as err:
+            LOGGER.warning("Cannot minimize the corpus of %s: %s", target, err)
+            shutil.rmtree(merged, ignore_errors=True)
+            return None
+        match = MERGE_REGEX.search(output.decode("latin_1"))
+        with self._target_lock(target, 'add'):
+            late = _replace(corpus, merged, snapshot)
+            files, size = _size(corpus)
+            minimization = {
+                'time': time.time(),
+                'seconds': time.monotonic() - start,
+                'files_before': before[0], 'files_after': files,
+                'bytes_before': before[1], 'bytes_after': size
+            }
+            self._update(target, files=files, bytes=size, added=late,
+                         features=int(match.group(2)) if match else None,
+                         minimized_at=minimization['time'],
+                         minimizations=lambda history: (
+                             history + [minimization])[-HISTORY_LENGTH:])
+        LOGGER.warning("Minimized the corpus of %s from %d to %d inputs "
+                       "(%d to %d bytes) in %.1fs", target, before[0], files,
+                       before[1], size, minimization['seconds'])
+        return minimization
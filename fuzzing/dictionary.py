@@ -0,0 +1,302 @@
+"""Module generating libFuzzer dictionaries from the AST of a project
+
+The dictionary-tokens tool prints, per translation unit, the string and
+character literals, the integer constants compared with and the enum values
+used by every function and global variable, together with the symbols they
+reference. Starting from the entry points of a harness
+(ci-fuzzing-targets/<target>.cc), the tokens of all symbols reachable from
+it are written into the dictionary of the target (<target>.dict), which
+ci-fuzz passes to the target.
+
+Whether a dictionary helps is measured by fuzzing the target from an empty
+corpus with and without it: the time saved is the difference of the times
+both runs take to reach the coverage the run without dictionary ended with.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import struct
+import subprocess
+import tempfile
+
+from settings import (DICTIONARY_TOKENS, FUZZING_DICTIONARY_DIR, FUZZING_DIR,
+                      command_entry_point)
+from storage import atomic_write
+
+from .metrics import FuzzerMetrics
+
+LOGGER = logging.getLogger(name=__name__)
+
+ENTRY_POINTS = ("LLVMFuzzerTestOneInput", "LLVMFuzzerInitialize")
+# libFuzzer ignores longer dictionary entries
+MAX_TOKEN_LENGTH = 64
+# entries written per dictionary
+MAX_TOKENS = 1024
+# integer constants of this size are found by libFuzzer alone
+TRIVIAL_INTEGER = 256
+# files passed to a single run of the tool
+FILES_PER_RUN = 64
+INTEGER_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+__all__ = ['extract_units', 'reachable_tokens', 'encode_token',
+           'write_dictionary', 'generate_dictionaries', 'time_to_coverage',
+           'measure_dictionary']
+
+
+def extract_units(files, arguments, tool=DICTIONARY_TOKENS):
+    """Runs the dictionary-tokens tool on source files
+
+    :param files: source files
+    :param arguments: arguments of the tool, e.g. ["-p", <build path>] or
+        ["--", <compiler flags>]
+    :return: list of translation units {'file': ..., 'symbols': ...}
+    """
+    units = []
+    for index in range(0, len(files), FILES_PER_RUN):
+        batch = files[index:index + FILES_PER_RUN]
+        position = arguments.index("--") if "--" in arguments \
+            else len(arguments)
+        command = [tool] + arguments[:position] + batch + arguments[position:]
+        proc = subprocess.run(command, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            LOGGER.warning("Could not parse all of %s: %s", " ".join(batch),
+                           proc.stderr.decode("utf-8", "replace").strip())
+        units += [json.loads(line) for line in
+                  proc.stdout.decode("utf-8", "replace").splitlines()
+                  if line.startswith("{")]
+    return units
+
+
+def merge_symbols(units):
+    """Merges the symbols of translation units
+
+    :return: dict of name -> {'tokens': [...], 'references': set}
+    """
+    symbols = {}
+    for unit in units:
+        for name, symbol in unit['symbols'].items():
+            merged = symbols.setdefault(name, {'tokens': [],
+                                               'references': set()})
+            merged['tokens'] += symbol['tokens']
+            merged['references'].update(symbol['references'])
+    return symbols
+
+
+def reachable_tokens(symbols, entry_points=ENTRY_POINTS):
+    """Returns the tokens of the symbols reachable from the entry points"""
+    pending = [name for name in entry_points if name in symbols]
+    reached = set(pending)
+    tokens = []
+    while pending:
+        symbol = symbols[pending.pop()]
+        tokens += symbol['tokens']
+        for name in symbol['references']:
+            if name in symbols and name not in reached:
+                reached.add(name)
+                pending.append(name)
+    return tokens
+
+
+def encode_token(token):
+    """Returns the dictionary entries of a token (bytes)
+
+    Integers are written in both byte orders, trivial integers and tokens
+    libFuzzer cannot use are dropped.
+    """
+    if token['kind'] == "string":
+        data = bytes.fromhex(token['value'])
+        return [data] if 0 < len(data) <= MAX_TOKEN_LENGTH else []
+    size, value = token['bytes'], token['value']
+    if size not in INTEGER_FORMATS:
+        return []
+    # character literals are kept, other small integers are trivial
+    if size > 1 and -TRIVIAL_INTEGER < value < TRIVIAL_INTEGER:
+        return []
+    value &= (1 << size * 8) - 1
+    entries = [struct.pack("<" + INTEGER_FORMATS[size], value),
+               struct.pack(">" + INTEGER_FORMATS[size], value)]
+    return sorted(set(entries))
+
+
+def format_entry(data):
+    """Returns a dictionary line of an entry"""
+    characters = []
+    for byte in data:
+        if 0x20 <= byte < 0x7f and chr(byte) not in '"\\':
+            characters.append(chr(byte))
+        else:
+            characters.append("\\x{:02X}".format(byte))
+    return '"{}"'.format("".join(characters))
+
+
+def write_dictionary(file, tokens):
+    """Writes the entries of tokens as libFuzzer dictionary
+
+    :return: number of entries written
+    """
+    entries = sorted({entry for token in tokens
+                      for entry in encode_token(token)},
+                     key=lambda entry: (len(entry), entry))[:MAX_TOKENS]
+    if entries:
+        atomic_write(file, "".join(format_entry(entry) + "\n"
+                                   for entry in entries))
+    elif os.path.isfile(file):
+        os.remove(file)
+    return len(entries)
+
+
+def _project_files(build_path):
+    database = os.path.join(build_path, "compile_commands.json")
+    if not os.path.isfile(database):
+        return []
+    with open(database) as file:
+        return sorted({os.path.join(entry['directory'], entry['file'])
+                       for entry in json.load(file)})
+
+
+def generate_dictionaries(targets, project, output, build_path=None,
+                          tool=DICTIONARY_TOKENS):
+    """Generates the dictionaries of fuzzing targets
+
+    :param targets: names of the targets, their harnesses are
+        <project>/ci-fuzzing-targets/<target>.cc
+    :param project: project path, the include path of the harnesses
+    :param output: directory the dictionaries are written to
+    :param build_path: directory of the compilation database of the project,
+        defaults to the project path
+    :return: dict of target -> number of entries
+    """
+    files = _project_files(build_path or project)
+    symbols = merge_symbols(extract_units(
+        files, ["-p", build_path or project], tool)) if files else {}
+    counts = {}
+    for target in targets:
+        harness = os.path.join(project, FUZZING_DIR, target + ".cc")
+        if not os.path.isfile(harness):
+            LOGGER.warning("No harness of %s found", target)
+            continue
+        units = extract_units([harness], ["--", "-I" + project], tool)
+        # the symbols of the harness shadow the ones of the project
+        harness_symbols = dict(symbols, **merge_symbols(units))
+        counts[target] = write_dictionary(
+            os.path.join(output, target + ".dict"),
+            reachable_tokens(harness_symbols))
+        LOGGER.info("Wrote %d entries for %s", counts[target], target)
+    return counts
+
+
+def time_to_coverage(series, coverage):
+    """Returns the seconds a series took to reach a coverage (None if it
+    did not)"""
+    for sample in series:
+        if sample['cov'] >= coverage:
+            return sample['seconds']
+    return None
+
+
+def _fuzz(target, options, seconds):
+    """Fuzzes a target from an empty corpus
+
+    :return: FuzzerMetrics of the run
+    """
+    metrics = FuzzerMetrics(interval=0)
+    with tempfile.TemporaryDirectory() as corpus:
+        command = [os.path.abspath(target),
+                   "-max_total_time={:d}".format(seconds)] + options + [corpus]
+        with subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, cwd=corpus) as proc:
+            for line in proc.stderr:
+                metrics.add(line.decode("latin_1"))
+    return metrics
+
+
+def measure_dictionary(target, dictionary, seconds, options=None):
+    """Measures the time a dictionary saves to reach the coverage of a run
+    without it
+
+    :return: dict with the coverage, the seconds of both runs to reach it
+        (None if the run with dictionary did not) and the seconds saved
+    """
+    options = list(options or [])
+    without = _fuzz(target, options, seconds)
+    if without.last is None:
+        return None
+    coverage = without.last['cov']
+    with_dictionary = _fuzz(target, options + ["-dict=" + dictionary],
+                            seconds)
+    before = time_to_coverage(without.series, coverage)
+    after = time_to_coverage(with_dictionary.series, coverage)
+    final = with_dictionary.last['cov'] if with_dictionary.last else 0
+    return {'coverage': coverage, 'seconds_without': before,
+            'seconds_with': after, 'final_coverage_with': final,
+            'saved': None if after is None else round(before - after, 1)}
+
+
+@command_entry_point
+def dictionary_main(args=None):
+    """Generates the dictionaries of the fuzzing targets of a project
+
+    :param args: arguments, defaults to sys.argv[:1]
+    :return: exit_code
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('targets', metavar="fuzzing target names",
+                        default=[], nargs="*",
+                        help="""Targets to generate dictionaries for, defaults
+                        to all harnesses""")
+    parser.add_argument(
+        '--project-path',
+        metavar="<path>",
+        dest='cwd',
+        type=str,
+        default=os.getcwd(),
+        help="""used path where the fuzzing tools are invoked """)
+    parser.add_argument(
+        '--build-path',
+        metavar="<path>",
+        dest='build_path',
+        type=str,
+        default=None,
+        help="""Directory of the compilation database (compile_commands.json)
+        of the project, defaults to the project path.""")
+    parser.add_argument(
+        '--dictionary-dir',
+        metavar='<path>',
+        dest='dictionary_dir',
+        type=str,
+        default=FUZZING_DICTIONARY_DIR,
+        help="""Directory the dictionaries are written to, relative to the
+        project path.""")
+    parser.add_argument(
+        '--measure',
+        metavar='<seconds>',
+        dest='measure',
+        type=int,
+        default=0,
+        help="""Fuzz every target this long with and without its dictionary
+        and report the time the dictionary saves to reach the same
+        coverage.""")
+    args = parser.parse_args(args)
+    project = os.path.abspath(args.cwd)
+    output = os.path.join(project, args.dictionary_dir)
+    os.makedirs(output, exist_ok=True)
+    if not args.targets:
+        args.targets = sorted(
+            os.path.splitext(os.path.basename(harness))[0] for harness in
+            glob.glob(os.path.join(project, FUZZING_DIR, "*.cc")))
+
+    counts = generate_dictionaries(args.targets, project, output,
+                                   build_path=args.build_path)
+    report = {target: {'entries': count} for target, count in counts.items()}
+    if args.measure > 0:
+        for target, count in counts.items():
+            if count:
+                report[target]['measurement'] = measure_dictionary(
+                    os.path.join(project, FUZZING_DIR, target),
+                    os.path.join(output, target + ".dict"), args.measure)
+    print(json.dumps(report, indent=1))
+    return 0
@@ -7,6 +7,8 @@
 import re
 from abc import ABC, abstractmethod
 
+from .buckets import stack_frames
+
 
 class LogParserException(Exception):
     """An Exception that signals an error in the libfuzzer log parsing process.
@@ -355,7 +357,8 @@ class LsanParserStrategy(ErrorParserStrategy):
 
     def gather_leaks(self, report):
         """Gathers leaks and makes sure we don't have multiple reports and the
-        same leak cause.
+        same leak cause. Leaks are the same if the top frames of their
+        allocation stacks are.
         """
         leaks = {}
         for line in report:
@@ -367,14 +370,13 @@ class LsanParserStrategy(ErrorParserStrategy):
                 no_bytes, no_objects = re.search(self.HEADER_PATTERN, line).groups()
                 no_bytes, no_objects = int(no_bytes), int(no_objects)
                 location, path = self.parse_stack_trace(report)
-                file_name = location["file"]
-                details = leaks.get(file_name)
+                key = tuple(stack_frames(path)) or location.get("file")
+                details = leaks.get(key)
                 if details:
                     details[0] += no_bytes
                     details[1] += no_objects
-                    leaks[file_name] = details
                 else:
-                    leaks[file_name] = [no_bytes, no_objects, location, path]
+                    leaks[key] = [no_bytes, no_objects, location, path]
 
         return leaks
 
@@ -433,3 +435,73 @@ class TimeoutParserStrategy(ErrorParserStrategy):
 
         stack_trace.seek(pos)
         return super().parse_stack_trace(stack_trace)
+
+
+class LibFuzzerParserStrategy(ErrorParserStrategy):
+    """ErrorParserStrategy for the errors libFuzzer detects itself apart
+    from timeouts: deadly signals (e.g. failed assertions, abort()) and
+    running out of memory."""
+    OUT_OF_MEMORY = "out-of-memory"
+    # frames of libFuzzer's handlers, the stack of the error is below them
+    HANDLER_FRAMES = ("Fuzzer::StaticCrashSignalCallback",
+                      "Fuzzer::CrashCallback", "MallocHook", "HandleMalloc")
+    # frames between the handler and the code raising the error
+    RUNTIME_FUNCTIONS = ("raise", "gsignal", "abort", "__assert_fail",
+                         "__assert_fail_base", "malloc", "calloc", "realloc",
+                         "operator new", "operator new[]")
+
+    def get_vulnerabilities(self, header, report):
+        info = header.split("libFuzzer:", 1)[-1].strip()
+        error_type = info.split("(")[0].strip().replace(" ", "-") or "crash"
+        category = self.MEMORY_ERROR if error_type == self.OUT_OF_MEMORY \
+            else self.LOGIC_ERROR
+        description = error_type
+
+        location, path = self.parse_stack_trace(self.find_stack_trace(report))
+        if path:
+            final_event = path[-1]
+            description += " in %s %s" % (
+                final_event.get("location", {}).get("file", ""),
+                final_event.get("message", ""))
+        hex_in, ascii_in = self.get_crash_input(report)
+        if hex_in:
+            description += " on input:\nHex: %s\nASCII: %s\n" % (hex_in,
+                                                                 ascii_in)
+        return [{
+            "category": category,
+            "type": error_type,
+            "description": description,
+            "location": location,
+            "path": path
+        }]
+
+    @staticmethod
+    def __get_function(line):
+        parts = line.split(" in ", 1)
+        return parts[1].split("(")[0].strip() if len(parts) == 2 else ""
+
+    def parse_stack_trace(self, stack_trace):
+        if not stack_trace:
+            return {}, []
+
+        position = stack_trace.tell()
+        frames = []
+        for line in stack_trace:
+            if not line.strip():
+                break
+            frames.append(line)
+        # the stack of the error starts below the last handler frame, after
+        # the signal trampoline and the runtime functions (abort, malloc, ...)
+        # called by the code of the target
+        start = 0
+        for index, line in enumerate(frames):
+            if any(frame in line for frame in self.HANDLER_FRAMES):
+                start = index + 1
+        while 0 < start < len(frames) and self.__get_function(
+                frames[start]) in ("",) + self.RUNTIME_FUNCTIONS:
+            start += 1
+
+        stack_trace.seek(position)
+        for _ in range(start):
+            stack_trace.readline()
+        return super().parse_stack_trace(stack_trace)
@@ -6,20 +6,24 @@ import glob
 import json
 import os
 import stat
-import subprocess
 
 import logging
 
 import jsonschema
 
-from settings import (SA_VULNERABILITY_SCHEMA, CI_REPORT_FILE, FUZZING_DIR,
-                      command_entry_point)
+from settings import (SA_VULNERABILITY_SCHEMA, CI_REPORT_FILE,
+                      CI_REPORT_STATUS_FILE, FUZZING_DIR, FUZZING_CORPUS_DIR,
+                      FUZZING_DICTIONARY_DIR, command_entry_point)
 
-from streams.linestream import LineStream
 from fuzzing.errorparser import (AsanParserStrategy,
                                  LsanParserStrategy,
                                  TimeoutParserStrategy,
+                                 LibFuzzerParserStrategy,
                                  LogParserException)
+from fuzzing.buckets import CrashIndex, crash_signature
+from fuzzing.corpus import CorpusStore
+
+LOGGER = logging.getLogger(name=__name__)
 
 with open(SA_VULNERABILITY_SCHEMA, 'r') as schema:
     VULNERABILITY_SCHEMA = json.load(schema)
@@ -56,6 +60,46 @@ def get_executables():
             if os.path.isfile(file) and os.stat(file).st_mode & is_executable]
 
 
+def log_findings(target, vulnerabilities):
+    """Logs the findings of a target as soon as they are parsed"""
+    for vulnerability in vulnerabilities:
+        location = vulnerability.get("location", {})
+        LOGGER.warning("%s: %s at %s:%s", target, vulnerability["type"],
+                       location.get("file", "?"), location.get("line", 0))
+
+
+def create_scheduler(args, symbolizer=None):
+    """Returns the scheduler of the campaign, its stores are kept in the
+    project path"""
+    # pylint: disable=cyclic-import
+    from .allocation import AdaptiveScheduler, TargetPriorities
+    from .scheduling import FuzzingScheduler
+    project = os.path.abspath(args.cwd)
+    options = dict(jobs=args.jobs, workers=args.workers,
+                   total_time=args.total_time, target_time=args.target_time,
+                   callback=log_findings,
+                   corpus=CorpusStore(os.path.join(project, args.corpus_dir)),
+                   buckets=CrashIndex(directory=project),
+                   report_known=args.known_crashes,
+                   dictionaries=os.path.join(project, args.dictionary_dir),
+                   symbolizer=symbolizer)
+    if args.adaptive:
+        return AdaptiveScheduler(
+            fuzzer_options(), TargetPriorities(directory=project),
+            epoch_time=args.epoch_time, **options)
+    return FuzzingScheduler(fuzzer_options(), **options)
+
+
+def write_report(vulnerabilities, status):
+    """Prints the findings and writes them and the status report"""
+    json_data = json.dumps(vulnerabilities, indent=1)
+    print(json_data)
+    with open(CI_REPORT_FILE, "w") as report_file:
+        json.dump(vulnerabilities, report_file, indent=1)
+    with open(CI_REPORT_STATUS_FILE, "w") as status_file:
+        json.dump(status, status_file, indent=1)
+
+
 @command_entry_point
 def run_fuzzer(args=None):
     """
@@ -63,6 +107,13 @@ def run_fuzzer(args=None):
     :param args: arguments, defaults to sys.argv[:1]
     :return: exit_code
     """
+    # the scheduler parses the logs with this module, hence the deferred
+    # imports
+    # pylint: disable=cyclic-import
+    from .allocation import EPOCH_TIME
+    from .replay import replay_targets
+    from .symbolize import Symbolizer
+    from .reproduce import MINIMIZE_TIME, reproduce_findings
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('files', metavar="fuzzing target names", default=[],
@@ -74,26 +125,136 @@ def run_fuzzer(args=None):
         type=str,
         default=os.getcwd(),
         help="""used path where the fuzzing tools are invoked """)
+    parser.add_argument(
+        '--jobs', '-j',
+        metavar='<number>',
+        dest='jobs',
+        type=int,
+        default=None,
+        help="""Number of cores used for fuzzing, defaults to all cores.""")
+    parser.add_argument(
+        '--workers',
+        metavar='<number>',
+        dest='workers',
+        type=int,
+        default=1,
+        help="""Number of libFuzzer workers (processes) per target. The
+        findings of all workers of a target are collected.""")
+    parser.add_argument(
+        '--total-time',
+        metavar='<seconds>',
+        dest='total_time',
+        type=int,
+        default=None,
+        help="""Time budget of the whole fuzzing campaign. Targets which could
+        not be started in time are listed as skipped in the status
+        report.""")
+    parser.add_argument(
+        '--target-time',
+        metavar='<seconds>',
+        dest='target_time',
+        type=int,
+        default=None,
+        help="""Time budget of a single target.""")
+    parser.add_argument(
+        '--corpus-dir',
+        metavar='<path>',
+        dest='corpus_dir',
+        type=str,
+        default=FUZZING_CORPUS_DIR,
+        help="""Directory keeping the corpora of the targets between runs,
+        relative to the project path. The corpora are minimized when they
+        grew considerably or were not minimized for a day.""")
+    parser.add_argument(
+        '--dictionary-dir',
+        metavar='<path>',
+        dest='dictionary_dir',
+        type=str,
+        default=FUZZING_DICTIONARY_DIR,
+        help="""Directory of the dictionaries of the targets, relative to the
+        project path. Targets with a dictionary (<target>.dict, see
+        ci-fuzz-dict) are run with it.""")
+    parser.add_argument(
+        '--known-crashes',
+        dest='known_crashes',
+        action='store_true',
+        help="""Report the crashes of buckets known from earlier runs too.
+        By default crashes are bucketed by their bug type and top frames and
+        only new buckets are reported, known ones are counted in the status
+        report.""")
+    parser.add_argument(
+        '--no-reproduce',
+        dest='reproduce',
+        action='store_false',
+        help="""Do not reproduce the reported crashes. By default every
+        crash is run again against its target, its input is minimized and the
+        minimized reproducer and its report are attached to the finding.""")
+    parser.add_argument(
+        '--minimize-time',
+        metavar='<seconds>',
+        dest='minimize_time',
+        type=int,
+        default=MINIMIZE_TIME,
+        help="""Time budget of the minimization of a crash input.""")
+    parser.add_argument(
+        '--adaptive',
+        dest='adaptive',
+        action='store_true',
+        help="""Run the campaign in epochs and give the cores of every epoch
+        to the targets still finding new features. The priorities of the
+        targets are kept between runs. Requires --total-time.""")
+    parser.add_argument(
+        '--epoch-time',
+        metavar='<seconds>',
+        dest='epoch_time',
+        type=int,
+        default=EPOCH_TIME,
+        help="""Length of an epoch of the adaptive mode.""")
+    parser.add_argument(
+        '--replay',
+        dest='replay',
+        action='store_true',
+        help="""Do not fuzz, run the stored corpora and crash inputs of the
+        targets once as a regression suite. The inputs are run in batches
+        spread over the cores, crashes and slow inputs are reported.""")
+    parser.add_argument(
+        '--offline-symbolize',
+        dest='offline_symbolize',
+        action='store_true',
+        help="""Run the targets without symbolization, which is much faster,
+        and symbolize the frames of the findings afterwards with a single
+        llvm-symbolizer process. The frames are cached by the build-id of
+        their module.""")
     args = parser.parse_args(args)
+    if args.adaptive and args.total_time is None:
+        parser.error("--adaptive requires --total-time")
+    symbolizer = Symbolizer() if args.offline_symbolize else None
+    scheduler = create_scheduler(args, symbolizer)
     os.chdir(os.path.join(args.cwd, FUZZING_DIR))
     if not args.files:
         args.files = get_executables()
 
-    vulnerabilities = []
-    for file in args.files:
-        proc = subprocess.run(["./" + file] + fuzzer_options() + ["CORPUS"],
-                              shell=True, stdout=subprocess.PIPE,
-                              stderr=subprocess.PIPE)
-        if proc.returncode != 0:
-            log_file = LineStream(proc.stderr)
-            while get_next_error(log_file):
-                vulnerabilities.extend(parse_libfuzzer(log_file))
-
-    json_data = json.dumps(vulnerabilities, indent=1)
-    print(json_data)
-    with open(CI_REPORT_FILE, "w") as report_file:
-        json.dump(vulnerabilities, report_file, indent=1)
-
+    try:
+        if args.replay:
+            vulnerabilities, status = replay_targets(
+                args.files, fuzzer_options(), corpus=scheduler.corpus,
+                jobs=args.jobs, symbolizer=symbolizer,
+                buckets=scheduler.buckets,
+                report_known=scheduler.report_known)
+        else:
+            vulnerabilities = scheduler.run(args.files)
+            status = scheduler.status
+            if args.reproduce:
+                status['reproduced'] = reproduce_findings(
+                    scheduler.findings, fuzzer_options(), jobs=args.jobs,
+                    minimize_time=args.minimize_time)
+    finally:
+        if symbolizer is not None:
+            symbolizer.close()
+    if symbolizer is not None:
+        status['symbolization'] = symbolizer.statistics
+
+    write_report(vulnerabilities, status)
     return vulnerabilities
 
 
@@ -114,19 +275,17 @@ def get_parser_strategy(tool_name, info):
     if tool_name == "libFuzzer":
         if "timeout" in info:
             return TimeoutParserStrategy()
-        else:
-            # deadly signal case, needs special handling
-            raise Exception("Not implemented yet.")
-    else:
-        return STRATEGY_TABLE[tool_name]
+        return LibFuzzerParserStrategy()
+    if tool_name not in STRATEGY_TABLE:
+        raise LogParserException("No parser for {}".format(tool_name))
+    return STRATEGY_TABLE[tool_name]
 
 
-def get_error_hash(report):
-    """Returns the hash identifying the bug."""
+def get_test_unit(report):
+    """Returns the path of the input libFuzzer wrote for the error."""
     for line in report:
         if "Test unit written to" in line:
-            line = line.split("-")
-            return line[-1].strip()
+            return line.split("Test unit written to", 1)[1].strip()
     return ""
 
 
@@ -149,9 +308,12 @@ def parse_libfuzzer(report):
         header = report.readline()
         parser = get_parser_strategy(*get_tool_name(header))
         vulnerabilities = parser.get_vulnerabilities(header, report)
-        issue_hash = get_error_hash(report)
+        test_unit = get_test_unit(report)
         for vulnerability in vulnerabilities:
-            vulnerability["issue_hash"] = issue_hash
+            # the bug is identified by its stack, not by the input
+            vulnerability["issue_hash"] = crash_signature(vulnerability)
+            if test_unit:
+                vulnerability["test_unit"] = test_unit
     except (LogParserException, IndexError, KeyError) as error:
         # the exception handling here is a temporary solution
         logger = logging.getLogger(name=__name__)
@@ -0,0 +1,161 @@
+"""Module parsing the output of running fuzzers as it is written
+
+Crash blocks are recognized line by line and handed to parse_libfuzzer as
+soon as they are complete. Only the block being read and a few lines
+before it are kept (timeout reports print the crash input before the error
+line), progress lines are only counted, hence the memory used does not grow
+with the length of a campaign.
+"""
+import functools
+import glob
+import logging
+import os
+import re
+import threading
+from collections import deque
+
+from streams.linestream import LineStream
+
+from .libfuzzer import get_next_error, is_error_start, parse_libfuzzer
+
+LOGGER = logging.getLogger(name=__name__)
+
+# lines kept before an error line
+CONTEXT_LINES = 16
+# lines of a crash block kept at most, the rest of a block is dropped
+MAX_BLOCK_LINES = 4096
+PROGRESS_REGEX = re.compile(r"^#[0-9]+\s")
+POLL_INTERVAL = 1.0
+
+__all__ = ['CrashBlockReader', 'LogFollower']
+
+
+class CrashBlockReader(object):
+    """Recognizes the crash blocks in the output of a fuzzer"""
+
+    def __init__(self, encoding="latin_1", progress=None):
+        """Initialization.
+
+        :param progress: called with every progress line
+        """
+        self.encoding = encoding
+        self.on_progress = progress
+        self.context = deque(maxlen=CONTEXT_LINES)
+        self.block = None
+        self.header = None
+        self.progress = {'lines': 0, 'last': None}
+
+    def _is_block_end(self, line):
+        """Returns True if line is the last line of the current block"""
+        if "libFuzzer: timeout" in self.header:
+            # timeouts end with their summary, their crash input is printed
+            # before the error line
+            return line.startswith("SUMMARY:")
+        return "Test unit written to" in line
+
+    def _parse_block(self):
+        """Parses the current block and starts a new one"""
+        block, self.block = self.block, None
+        stream = LineStream(b"".join(block))
+        vulnerabilities = []
+        while get_next_error(stream):
+            vulnerabilities.extend(parse_libfuzzer(stream))
+        return vulnerabilities
+
+    def feed(self, line):
+        """Reads a line of output
+
+        :param line: line of output in bytes, including its line break
+        :return: findings of the block completed by line
+        """
+        text = line.decode(self.encoding)
+        vulnerabilities = []
+        if is_error_start(text):
+            if self.block is not None:
+                vulnerabilities = self._parse_block()
+            self.block = list(self.context) + [line]
+            self.header = text
+            self.context.clear()
+        elif self.block is not None:
+            if len(self.block) < MAX_BLOCK_LINES:
+                self.block.append(line)
+            if self._is_block_end(text):
+                vulnerabilities = self._parse_block()
+        elif PROGRESS_REGEX.match(text):
+            self.progress['lines'] += 1
+            self.progress['last'] = text.rstrip()
+            if self.on_progress is not None:
+                self.on_progress(text)
+        else:
+            self.context.append(line)
+        return vulnerabilities
+
+    def close(self):
+        """Parses the block cut off by the end of the output"""
+        return self._parse_block() if self.block is not None else []
+
+
+class LogFollower(object):
+    """Follows the logs libFuzzer workers write to a directory while they
+    grow, every log is parsed by its own CrashBlockReader"""
+
+    def __init__(self, directory, callback, pattern="fuzz-*.log",
+                 progress=None):
+        """Initialization.
+
+        :param directory: directory the workers write their logs to
+        :param callback: called with the findings of every crash block
+        :param pattern: glob pattern of the logs
+        :param progress: called with the log and every progress line
+        """
+        self.directory = directory
+        self.callback = callback
+        self.pattern = pattern
+        self.progress = progress
+        self.logs = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _found(self, vulnerabilities):
+        if vulnerabilities:
+            self.callback(vulnerabilities)
+
+    def poll(self):
+        """Reads the complete lines written to the logs since the last poll"""
+        for file in glob.glob(os.path.join(self.directory, self.pattern)):
+            if file not in self.logs:
+                progress = None if self.progress is None else \
+                    functools.partial(self.progress, file)
+                self.logs[file] = (open(file, "rb"),
+                                   CrashBlockReader(progress=progress))
+            handle, reader = self.logs[file]
+            for line in iter(handle.readline, b""):
+                if not line.endswith(b"\n"):
+                    # the rest of the line is not written yet
+                    handle.seek(-len(line), os.SEEK_CUR)
+                    break
+                self._found(reader.feed(line))
+
+    def _follow(self):
+        while not self._stop.wait(POLL_INTERVAL):
+            self.poll()
+
+    def start(self):
+        """Follows the logs in a background thread"""
+        self._thread = threading.Thread(target=self._follow, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops following, reads the rest of the logs and closes them"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        self.poll()
+        for handle, reader in self.logs.values():
+            rest = handle.read()
+            if rest:
+                self._found(reader.feed(rest))
+            self._found(reader.close())
+            handle.close()
+        self.logs = {}
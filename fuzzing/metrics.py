@@ -0,0 +1,156 @@
+"""Module extracting throughput and coverage metrics from fuzzer output
+
+libFuzzer prints a status line whenever it finds new coverage and at
+regular pulses. The lines of every fuzzer process are parsed into a time
+series, which is thinned out to one sample per interval and written as CSV
+next to the target. The final and peak values and the problems detected in
+the series (stalled coverage, slow executions, growing memory) go into the
+status report.
+"""
+import re
+import time
+
+from storage import atomic_write
+
+STATUS_REGEX = re.compile(
+    r"^#([0-9]+)\s+(\w+)\s+cov: ([0-9]+) ft: ([0-9]+) "
+    r"corp: ([0-9]+)/([0-9]+)(b|Kb|Mb)\b.*?exec/s: ([0-9]+) rss: ([0-9]+)Mb")
+UNITS = {'b': 1, 'Kb': 1 << 10, 'Mb': 1 << 20}
+FIELDS = ('seconds', 'execs', 'cov', 'ft', 'corp', 'corp_bytes', 'exec_s',
+          'rss_mb')
+# seconds between two samples kept in the time series
+SAMPLE_INTERVAL = 5.0
+# coverage is stalled if it did not grow for this share of the run ...
+STALL_SHARE = 0.5
+# ... and for at least this many seconds
+STALL_SECONDS = 60.0
+# executions per second below which a target is slow
+SLOW_EXEC_S = 100
+# the resident set grows if its final size is this factor of its size
+# after the first sample and at least RSS_GROWTH_MB larger
+RSS_GROWTH_FACTOR = 1.5
+RSS_GROWTH_MB = 64
+
+# fields which add up over the workers of a target, the others are maxima
+SUMMED_FIELDS = ('execs', 'exec_s', 'rss_mb')
+
+__all__ = ['parse_status_line', 'FuzzerMetrics', 'combine_summaries']
+
+
+def parse_status_line(line):
+    """Returns the values of a libFuzzer status line (None for other lines)
+
+    :return: dict of FIELDS without 'seconds'
+    """
+    match = STATUS_REGEX.match(line)
+    if not match:
+        return None
+    execs, _, cov, features, corp, size, unit, exec_s, rss = match.groups()
+    return {'execs': int(execs), 'cov': int(cov), 'ft': int(features),
+            'corp': int(corp), 'corp_bytes': int(size) * UNITS[unit],
+            'exec_s': int(exec_s), 'rss_mb': int(rss)}
+
+
+class FuzzerMetrics(object):
+    """Time series of the status lines of a fuzzer process"""
+
+    def __init__(self, start=None, interval=SAMPLE_INTERVAL):
+        """Initialization.
+
+        :param start: monotonic time the process started
+        :param interval: seconds between two samples kept
+        """
+        self.start = time.monotonic() if start is None else start
+        self.interval = interval
+        self.samples = []
+        self.last = None
+        self.peak = {}
+        # time of the last coverage increase
+        self.covered = 0.0
+
+    def add(self, line, now=None):
+        """Adds a status line to the series
+
+        :return: True if line is a status line
+        """
+        values = parse_status_line(line)
+        if values is None:
+            return False
+        now = time.monotonic() if now is None else now
+        values['seconds'] = round(now - self.start, 1)
+        if self.last is None or values['cov'] > self.last['cov']:
+            self.covered = values['seconds']
+        for field, value in values.items():
+            self.peak[field] = max(self.peak.get(field, value), value)
+        if not self.samples or values['seconds'] - \
+                self.samples[-1]['seconds'] >= self.interval:
+            self.samples.append(values)
+        self.last = values
+        return True
+
+    @property
+    def series(self):
+        """Samples of the series, the last status line included"""
+        if self.last is not None and self.samples[-1] is not self.last:
+            return self.samples + [self.last]
+        return list(self.samples)
+
+    def alerts(self):
+        """Returns the problems shown by the series"""
+        if self.last is None:
+            return []
+        alerts = []
+        stalled = self.last['seconds'] - self.covered
+        if stalled >= STALL_SECONDS and \
+                stalled >= STALL_SHARE * self.last['seconds']:
+            alerts.append("coverage stalled for {:.0f}s at {}".format(
+                stalled, self.last['cov']))
+        if self.last['exec_s'] and self.last['exec_s'] < SLOW_EXEC_S:
+            alerts.append("slow: {} exec/s".format(self.last['exec_s']))
+        first = self.samples[0]['rss_mb']
+        growth = self.last['rss_mb'] - first
+        if growth >= RSS_GROWTH_MB and \
+                self.last['rss_mb'] >= RSS_GROWTH_FACTOR * first:
+            alerts.append("rss grew from {}Mb to {}Mb".format(
+                first, self.last['rss_mb']))
+        return alerts
+
+    @property
+    def summary(self):
+        """Initial, final and peak values and the alerts of the series"""
+        if self.last is None:
+            return None
+        return {'initial': dict(self.samples[0]), 'final': dict(self.last),
+                'peak': dict(self.peak),
+                'samples': len(self.series), 'alerts': self.alerts()}
+
+    def write(self, file):
+        """Writes the series as CSV, one sample per row"""
+        rows = [",".join(FIELDS)]
+        rows += [",".join(str(sample[field]) for field in FIELDS)
+                 for sample in self.series]
+        atomic_write(file, "\n".join(rows) + "\n")
+
+
+def combine_summaries(summaries):
+    """Combines the summaries of the processes of a target
+
+    :param summaries: dict of process name -> summary
+    :return: summary of the target
+    """
+    summaries = {name: summary for name, summary in summaries.items()
+                 if summary is not None}
+    if len(summaries) <= 1:
+        return next(iter(summaries.values()), None)
+    combined = {'samples': 0, 'alerts': [], 'processes': summaries}
+    for kind in ('initial', 'final', 'peak'):
+        combined[kind] = {}
+        for field in FIELDS:
+            values = [summary[kind][field] for summary in summaries.values()]
+            combined[kind][field] = sum(values) if field in SUMMED_FIELDS \
+                else max(values)
+    for name, summary in sorted(summaries.items()):
+        combined['samples'] += summary['samples']
+        combined['alerts'] += ["{}: {}".format(name, alert)
+                               for alert in summary['alerts']]
+    return combined
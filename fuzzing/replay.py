@@ -0,0 +1,224 @@
+"""Module replaying the saved inputs of the fuzzing targets
+
+The stored corpus and the crash inputs of every target are run against the
+(rebuilt) target without mutation, which turns them into a regression
+suite. The inputs are split into batches run by a process pool, a batch
+hitting a crash is continued after the crashing input. Crashes are parsed
+with the errorparser strategies and put into the crash buckets of the
+project, only new buckets are reported (the stored crash inputs of known
+buckets crash on every replay). Inputs taking much longer than the others
+are reported as slow.
+"""
+import glob
+import logging
+import multiprocessing
+import os
+import statistics
+import subprocess
+import time
+
+from .logstream import CrashBlockReader
+from .scheduling import FuzzingScheduler
+from .symbolize import offline_environment
+
+LOGGER = logging.getLogger(name=__name__)
+
+# inputs run by a single process
+BATCH_SIZE = 64
+# seconds a single input may take (libFuzzer's -timeout)
+INPUT_TIMEOUT = 25
+# an input is slow if it takes this factor of the median time ...
+SLOW_FACTOR = 10
+# ... and at least this many milliseconds
+SLOW_MIN_MS = 100
+# slow inputs listed per target
+SLOW_INPUTS = 10
+CRASH_PATTERNS = ("crash-*", "leak-*", "timeout-*", "oom-*",
+                  os.path.join("reproducers", "*"))
+
+__all__ = ['saved_inputs', 'replay_targets']
+
+
+def saved_inputs(target, corpus=None):
+    """Returns the stored corpus and the crash inputs of a target, the paths
+    are absolute"""
+    inputs = []
+    if corpus is not None:
+        directory = corpus.corpus(target)
+        inputs += sorted(os.path.join(directory, name)
+                         for name in os.listdir(directory))
+    work = FuzzingScheduler.directory(target)
+    for pattern in CRASH_PATTERNS:
+        inputs += sorted(glob.glob(os.path.join(work, pattern)))
+    return [os.path.abspath(file) for file in inputs if os.path.isfile(file)]
+
+
+def _run_batch(target, inputs, options, timeout, environment=None):
+    """Runs a target on inputs until they are done or one of them crashes
+
+    :return: (dict of input -> milliseconds, crashing input or None,
+        findings of the crash)
+    """
+    reader = CrashBlockReader()
+    times, running, vulnerabilities = {}, None, []
+    try:
+        output = subprocess.run(
+            [target, "-timeout={:d}".format(timeout)] + options + inputs,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            cwd=FuzzingScheduler.directory(target), env=environment,
+            timeout=timeout * len(inputs) + 60).stderr
+    except subprocess.TimeoutExpired as err:
+        output = err.stderr or b""
+    for line in output.splitlines(keepends=True):
+        text = line.decode("latin_1")
+        if text.startswith("Running: "):
+            running = text[len("Running: "):].strip()
+        elif text.startswith("Executed ") and text.rstrip().endswith(" ms"):
+            file, _, milliseconds = text[len("Executed "):].rpartition(" in ")
+            times[file] = int(milliseconds.split()[0])
+            running = None
+        vulnerabilities.extend(reader.feed(line))
+    vulnerabilities.extend(reader.close())
+    if running is None and vulnerabilities:
+        # crashed after the last input, e.g. leaks detected at exit
+        running = inputs[-1]
+    return times, running, vulnerabilities
+
+
+def replay_batch(job):
+    """Replays a batch of inputs (process pool worker)
+
+    :param job: dict with target, inputs, options, timeout and environment
+    :return: dict with target, times and crashes [(input, findings)]
+    """
+    inputs, times, crashes = list(job['inputs']), {}, []
+    while inputs:
+        batch_times, crashing, found = _run_batch(
+            job['target'], inputs, job['options'], job['timeout'],
+            job['environment'])
+        times.update(batch_times)
+        if crashing is None or crashing not in inputs:
+            break
+        # a batch killed while hanging has no findings, it is continued too
+        if found:
+            crashes.append((crashing, found))
+        inputs = inputs[inputs.index(crashing) + 1:]
+    return {'target': job['target'], 'times': times, 'crashes': crashes}
+
+
+def slow_inputs(times):
+    """Returns the inputs taking much longer than the median, slowest
+    first"""
+    if not times:
+        return []
+    limit = max(SLOW_MIN_MS, SLOW_FACTOR * statistics.median(times.values()))
+    slow = sorted((item for item in times.items() if item[1] >= limit),
+                  key=lambda item: item[1], reverse=True)
+    return [{'input': file, 'ms': milliseconds}
+            for file, milliseconds in slow[:SLOW_INPUTS]]
+
+
+def _collect(results, targets, status, symbolizer=None, is_new=None):
+    """Collects the results of the batches in the order of the inputs, the
+    first input of every new crash bucket of a target is reported, known
+    buckets are counted
+
+    :param is_new: called with a finding and its target, returns False if
+        the bucket of the finding is known
+    :return: findings
+    """
+    times = {target: {} for target in targets}
+    vulnerabilities, signatures = [], set()
+    names = {os.path.abspath(target): target for target in targets}
+    for result in results:
+        target = names[result['target']]
+        times[target].update(result['times'])
+        for crash_input, found in result['crashes']:
+            status[target]['crashes'] += 1
+            if symbolizer is not None:
+                symbolizer.symbolize(found)
+            for vulnerability in found:
+                vulnerability['test_unit'] = crash_input
+                known = is_new is not None and \
+                    not is_new(vulnerability, target)
+                if (target, vulnerability['issue_hash']) in signatures:
+                    continue
+                signatures.add((target, vulnerability['issue_hash']))
+                if known:
+                    status[target]['known'] += 1
+                    continue
+                vulnerabilities.append(vulnerability)
+                LOGGER.warning("%s: %s on %s", target, vulnerability['type'],
+                               crash_input)
+    for target in targets:
+        status[target]['executed'] = len(times[target])
+        status[target]['slow'] = slow_inputs(times[target])
+    return vulnerabilities
+
+
+def _batches(targets, corpus, job, batch_size, status):
+    """Splits the saved inputs of targets into batches
+
+    :param job: options, timeout and environment of the batches
+    :param status: filled with the statistics of every target
+    :return: jobs of replay_batch
+    """
+    work = []
+    for target in targets:
+        inputs = saved_inputs(target, corpus)
+        status[target] = {'inputs': len(inputs), 'executed': 0, 'crashes': 0,
+                          'known': 0, 'slow': []}
+        # libFuzzer writes the crash inputs into its working directory
+        os.makedirs(FuzzingScheduler.directory(target), exist_ok=True)
+        work += [dict(job, target=os.path.abspath(target),
+                      inputs=inputs[index:index + batch_size])
+                 for index in range(0, len(inputs), batch_size)]
+    return work
+
+
+def replay_targets(targets, options, corpus=None, jobs=None,  # pylint: disable=too-many-arguments
+                   timeout=INPUT_TIMEOUT, batch_size=BATCH_SIZE,
+                   symbolizer=None, buckets=None, report_known=False):
+    """Replays the saved inputs of targets in parallel
+
+    :param targets: names of the targets
+    :param options: libFuzzer options of the campaign
+    :param corpus: CorpusStore of the targets
+    :param jobs: number of processes, defaults to all cores
+    :param timeout: seconds a single input may take
+    :param batch_size: inputs run by a single process
+    :param symbolizer: Symbolizer, the inputs are run without symbolization
+        and the crashes are symbolized offline
+    :param buckets: CrashIndex, only crashes of new buckets are reported
+    :param report_known: report the buckets known from earlier runs too
+    :return: (findings, status with the statistics of every target)
+    """
+    start = time.monotonic()
+    status = {}
+    work = _batches(targets, corpus, {
+        'options': list(options), 'timeout': timeout,
+        'environment': None if symbolizer is None else offline_environment()
+    }, batch_size, status)
+
+    if not work:
+        return [], {'replay': status}
+    pool = multiprocessing.Pool(min(jobs or multiprocessing.cpu_count(),
+                                    len(work)))
+    try:
+        vulnerabilities = _collect(
+            pool.imap(replay_batch, work), targets, status, symbolizer,
+            None if buckets is None else lambda vulnerability, target:
+            buckets.add(vulnerability, target) or report_known)
+    finally:
+        pool.close()
+        pool.join()
+    LOGGER.warning("Replayed %d inputs of %d targets in %.1fs, %d new "
+                   "crashes, %d known",
+                   sum(entry['inputs'] for entry in status.values()),
+                   len(targets), time.monotonic() - start,
+                   len(vulnerabilities),
+                   sum(entry['known'] for entry in status.values()))
+    if buckets is None:
+        return vulnerabilities, {'replay': status}
+    buckets.save()
+    return vulnerabilities, {'replay': status, 'buckets': buckets.statistics}
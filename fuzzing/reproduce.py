@@ -0,0 +1,160 @@
+"""Module reproducing and minimizing the crashes found by fuzzing
+
+Every reported crash is run again against its target, the input is then
+minimized with libFuzzer's -minimize_crash mode and the reduced reproducer
+is run once more with full symbolization. The runs of all crashes are
+spread over a process pool, every run is bounded by a timeout.
+"""
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+
+from .buckets import crash_signature
+from .logstream import CrashBlockReader
+from .scheduling import FuzzingScheduler
+
+LOGGER = logging.getLogger(name=__name__)
+
+# seconds a single run of a crash input may take
+REPRODUCE_TIMEOUT = 60
+# seconds the minimization of a crash input may take
+MINIMIZE_TIME = 60
+REPRODUCER_DIR = "reproducers"
+SYMBOLIZE_OPTIONS = "symbolize=1:symbolize_inline_frames=1:" \
+    "fast_unwind_on_malloc=0:detect_leaks=1"
+
+__all__ = ['reproduce_findings']
+
+
+def _environment():
+    environment = dict(os.environ)
+    environment['ASAN_OPTIONS'] = ":".join(
+        option for option in [environment.get('ASAN_OPTIONS'),
+                              SYMBOLIZE_OPTIONS] if option)
+    return environment
+
+
+def run_input(target, crash_input, options, timeout=REPRODUCE_TIMEOUT):
+    """Runs a target on a single input and parses its output
+
+    :return: findings of the run, None if the run timed out
+    """
+    reader = CrashBlockReader()
+    vulnerabilities = []
+    try:
+        proc = subprocess.run([target] + options + [crash_input],
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, env=_environment(),
+                              cwd=os.path.dirname(crash_input),
+                              timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None
+    for line in proc.stderr.splitlines(keepends=True):
+        vulnerabilities.extend(reader.feed(line))
+    return vulnerabilities + reader.close()
+
+
+def minimize_input(target, crash_input, output, options,
+                   minimize_time=MINIMIZE_TIME):
+    """Minimizes a crash input with libFuzzer's -minimize_crash mode
+
+    :return: True if a minimized input was written to output
+    """
+    command = [target, "-minimize_crash=1",
+               "-max_total_time={:d}".format(minimize_time),
+               "-exact_artifact_path={}".format(output)] + options + \
+        [crash_input]
+    try:
+        subprocess.run(command, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL,
+                       cwd=os.path.dirname(crash_input),
+                       timeout=minimize_time + REPRODUCE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return False
+    return os.path.isfile(output) and os.path.getsize(output) > 0
+
+
+def reproduce(job):
+    """Reproduces and minimizes a crash input (process pool worker)
+
+    :param job: dict with target, input, signature, output, options,
+        timeout and minimize_time
+    :return: (index of the job, reproduction)
+    """
+    start = time.monotonic()
+    reproduction = {'reproduced': False, 'reproducer': None,
+                    'input_bytes': os.path.getsize(job['input'])}
+    found = run_input(job['target'], job['input'], job['options'],
+                      job['timeout'])
+    signatures = [crash_signature(vulnerability)
+                  for vulnerability in found or []]
+    if job['signature'] in signatures:
+        reproduction['reproduced'] = True
+        if not minimize_input(job['target'], job['input'], job['output'],
+                              job['options'], job['minimize_time']):
+            shutil.copyfile(job['input'], job['output'])
+        reproduction['reproducer'] = job['output']
+        reproduction['reproducer_bytes'] = os.path.getsize(job['output'])
+        found = run_input(job['target'], job['output'], job['options'],
+                          job['timeout'])
+        reproduction['report'] = [
+            vulnerability for vulnerability in found or []
+            if crash_signature(vulnerability) == job['signature']]
+    else:
+        reproduction['error'] = "timed out" if found is None else \
+            "crashed differently" if found else "did not crash"
+    reproduction['seconds'] = time.monotonic() - start
+    return job['index'], reproduction
+
+
+def reproduce_findings(findings, options, jobs=None,
+                       timeout=REPRODUCE_TIMEOUT, minimize_time=MINIMIZE_TIME):
+    """Reproduces and minimizes the crash inputs of findings in parallel, the
+    results are attached to the findings (key 'reproduction')
+
+    :param findings: list of (target, vulnerability)
+    :param options: libFuzzer options of the campaign
+    :return: number of reproduced findings
+    """
+    work = []
+    for index, (target, vulnerability) in enumerate(findings):
+        if not vulnerability.get("test_unit"):
+            continue
+        directory = FuzzingScheduler.directory(target)
+        output_dir = os.path.join(directory, REPRODUCER_DIR)
+        os.makedirs(output_dir, exist_ok=True)
+        work.append({
+            'index': index,
+            'target': os.path.abspath(target),
+            'input': os.path.join(directory, vulnerability["test_unit"]),
+            'signature': vulnerability["issue_hash"],
+            'output': os.path.join(output_dir, vulnerability["issue_hash"]),
+            'options': list(options),
+            'timeout': timeout,
+            'minimize_time': minimize_time
+        })
+    if not work:
+        return 0
+
+    reproduced = 0
+    pool = multiprocessing.Pool(min(jobs or multiprocessing.cpu_count(),
+                                    len(work)))
+    try:
+        for index, reproduction in pool.imap_unordered(reproduce, work):
+            target, vulnerability = findings[index]
+            vulnerability['reproduction'] = reproduction
+            if reproduction['reproduced']:
+                reproduced += 1
+                vulnerability['reproducer'] = reproduction['reproducer']
+            else:
+                LOGGER.warning("Could not reproduce %s of %s: %s",
+                               vulnerability["type"], target,
+                               reproduction['error'])
+    finally:
+        pool.close()
+        pool.join()
+    LOGGER.warning("Reproduced %d of %d crashes", reproduced, len(work))
+    return reproduced
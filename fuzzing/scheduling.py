@@ -0,0 +1,327 @@
+"""Module scheduling the fuzzing targets of a project
+
+Targets run concurrently, each one on as many cores as it has libFuzzer
+workers, until all cores are busy. Every target runs within its own time
+budget, which is bounded by the time left of the total budget of the
+campaign; targets which could not be started in time are reported as
+skipped. Each target runs in its own working directory, hence the logs of
+its workers (fuzz-<job>.log) and its crash inputs never mix with the ones
+of other targets.
+
+The output of the targets and the logs of their workers are parsed while
+they are written, findings are reported as soon as their crash block is
+complete.
+
+With a corpus store, targets read their stored corpus and the inputs they
+found are added to it after their run. Corpora due for minimization are
+minimized in the slots of the campaign as soon as their target finished.
+
+With a crash index, a bucket is reported once per campaign and only if it
+is new (unless known buckets are asked for), all crashes are counted in
+the status report.
+
+The status lines of every process are kept as time series (metrics*.csv in
+the working directory of the target), their final and peak values and the
+problems they show are added to the status report.
+
+With a symbolizer, targets run without symbolization, which is much faster,
+and the frames of their findings are symbolized offline before they are
+bucketed.
+
+Targets with a dictionary (<target>.dict in the dictionary directory, see
+fuzzing.dictionary) are run with it.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .corpus import MINIMIZE_TIMEOUT
+from .logstream import CrashBlockReader, LogFollower
+from .metrics import FuzzerMetrics, combine_summaries
+from .symbolize import offline_environment
+
+LOGGER = logging.getLogger(name=__name__)
+
+# directory next to the fuzzing targets keeping their working directories
+WORK_DIR = "work"
+# seconds a target gets beyond its budget to write its final report
+KILL_GRACE = 10
+
+__all__ = ['FuzzingScheduler']
+
+
+class FuzzingScheduler(object):  # pylint: disable=too-many-instance-attributes
+    """Runs fuzzing targets concurrently within a total and a per-target
+    time budget"""
+
+    def __init__(self, options, jobs=None, workers=1, total_time=None,  # pylint: disable=too-many-arguments
+                 target_time=None, callback=None, corpus=None,
+                 buckets=None, report_known=False, dictionaries=None,
+                 symbolizer=None):
+        """Initialization.
+
+        :param options: libFuzzer options passed to every target
+        :param jobs: number of cores used, defaults to all cores
+        :param workers: libFuzzer workers (processes) per target
+        :param total_time: seconds the whole campaign may take
+        :param target_time: seconds a single target may take
+        :param callback: called with the target and its findings as soon as
+            a crash block is parsed
+        :param corpus: CorpusStore keeping the corpora of the targets
+        :param buckets: CrashIndex deduplicating the crashes
+        :param report_known: report the buckets known from earlier runs too
+        :param dictionaries: directory of the dictionaries of the targets
+            (<target>.dict)
+        :param symbolizer: Symbolizer, targets are run without symbolization
+            and their findings are symbolized offline
+        """
+        self.options = list(options)
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.workers = max(1, workers)
+        self.total_time = total_time
+        self.target_time = target_time
+        self.callback = callback
+        self.corpus = corpus
+        self.buckets = buckets
+        self.report_known = report_known
+        self.dictionaries = dictionaries
+        self.symbolizer = symbolizer
+        self._reported = set()
+        self.findings = []
+        self._executor = None
+        self.deadline = None
+        self.status = {'finished': [], 'crashed': [], 'skipped': []}
+        self._lock = threading.Lock()
+
+    @property
+    def slots(self):
+        """Number of targets running at the same time"""
+        return max(1, self.jobs // self.workers)
+
+    def budget(self, count):
+        """Returns the budget of a target in seconds (None if unbounded)
+
+        :param count: number of targets of the campaign
+        """
+        budget = self.target_time
+        if self.total_time is not None:
+            # targets beyond the number of slots run in later rounds
+            rounds = -(-count // self.slots)
+            share = max(1, int(self.total_time / rounds))
+            budget = share if budget is None else min(budget, share)
+        if self.deadline is not None:
+            budget = min(budget, int(self.deadline - time.monotonic()))
+        return budget
+
+    def target_workers(self, target):  # pylint: disable=unused-argument
+        """Returns the number of libFuzzer workers of a target"""
+        return self.workers
+
+    def command(self, target, budget):
+        """Returns the command line running a target"""
+        command = [os.path.abspath(target)] + self.options
+        if budget is not None:
+            command.append("-max_total_time={:d}".format(budget))
+        workers = self.target_workers(target)
+        if workers > 1:
+            command += ["-workers={:d}".format(workers),
+                        "-jobs={:d}".format(workers)]
+        if self.dictionaries is not None:
+            dictionary = os.path.join(self.dictionaries,
+                                      os.path.basename(target) + ".dict")
+            if os.path.isfile(dictionary):
+                command.append("-dict={}".format(dictionary))
+        command.append("corpus")
+        if self.corpus is not None:
+            command.append(self.corpus.corpus(target))
+        return command
+
+    @staticmethod
+    def directory(target):
+        """Returns the working directory of a target"""
+        return os.path.join(os.path.dirname(os.path.abspath(target)),
+                            WORK_DIR, os.path.basename(target))
+
+    def _prepare(self, target):
+        """Creates the working directory of a target, the worker logs of its
+        last run are removed"""
+        directory = self.directory(target)
+        os.makedirs(os.path.join(directory, "corpus"), exist_ok=True)
+        for log in os.listdir(directory):
+            if log.startswith("fuzz-") and log.endswith(".log"):
+                os.unlink(os.path.join(directory, log))
+        return directory
+
+    def _record(self, key, entry):
+        with self._lock:
+            self.status[key].append(entry)
+
+    def run_target(self, target, count):
+        """Runs a target within its budget and returns its findings
+
+        :param target: path of the fuzzing target
+        :param count: number of targets of the campaign
+        """
+        budget = self.budget(count)
+        if budget is not None and budget <= 0:
+            LOGGER.warning("Skipped %s, out of time", target)
+            self._record('skipped', target)
+            return []
+        directory = self._prepare(target)
+        start = time.monotonic()
+        vulnerabilities = []
+
+        def found(findings):
+            """Collects the findings of a crash block"""
+            if self.symbolizer is not None:
+                self.symbolizer.symbolize(findings)
+            if self.buckets is not None:
+                findings = [vulnerability for vulnerability in findings
+                            if self._is_reported(vulnerability, target)]
+            if not findings:
+                return
+            with self._lock:
+                vulnerabilities.extend(findings)
+                self.findings.extend((target, vulnerability)
+                                     for vulnerability in findings)
+            if self.callback is not None:
+                self.callback(target, findings)
+
+        metrics = {}
+
+        def progress(name, line):
+            """Adds a status line to the series of a process"""
+            if name not in metrics:
+                metrics[name] = FuzzerMetrics(start)
+            metrics[name].add(line)
+
+        returncode, lines = self._execute(target, budget, found, progress)
+        entry = {
+            'target': target,
+            'seconds': time.monotonic() - start,
+            'returncode': returncode,
+            'findings': len(vulnerabilities),
+            'progress': lines,
+            'metrics': self._write_metrics(target, directory, metrics)
+        }
+        if self.corpus is not None:
+            entry['new_inputs'] = self.corpus.add(
+                target, os.path.join(directory, "corpus"))
+            if self.corpus.due(target):
+                self._executor.submit(self._minimize, target)
+        self._record('crashed' if vulnerabilities else 'finished', entry)
+        return vulnerabilities
+
+    def _execute(self, target, budget, found, progress):
+        """Runs a target, its output and the logs of its workers are parsed
+        while they are written
+
+        :param found: called with the findings of every crash block
+        :param progress: called with the process name and every status line
+        :return: (exit code, summary of the progress lines of the target)
+        """
+        directory = self.directory(target)
+        proc = subprocess.Popen(self.command(target, budget), cwd=directory,
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE,
+                                env=None if self.symbolizer is None else
+                                offline_environment(),
+                                start_new_session=True)
+        timer = None
+        if budget is not None:
+            timer = threading.Timer(budget + KILL_GRACE, self._kill,
+                                    [target, proc, budget])
+            timer.start()
+        follower = LogFollower(directory, found, progress=lambda log, line:
+                               progress(os.path.basename(log)[:-4], line))
+        follower.start()
+        reader = CrashBlockReader(
+            progress=lambda line: progress("main", line))
+        for line in proc.stderr:
+            found(reader.feed(line))
+        found(reader.close())
+        proc.stderr.close()
+        proc.wait()
+        if timer is not None:
+            timer.cancel()
+        follower.stop()
+        return proc.returncode, reader.progress
+
+    @staticmethod
+    def _write_metrics(target, directory, metrics):
+        """Writes the time series of the processes of a target and returns
+        their summary"""
+        for name, series in metrics.items():
+            series.write(os.path.join(directory, "metrics.csv" if
+                                      name == "main" else
+                                      "metrics-{}.csv".format(name)))
+        summary = combine_summaries({name: series.summary for name, series
+                                     in metrics.items()})
+        for alert in summary['alerts'] if summary else []:
+            LOGGER.warning("%s: %s", target, alert)
+        return summary
+
+    def _is_reported(self, vulnerability, target):
+        """Puts a finding into its bucket, returns True if it is the first
+        finding of a bucket to be reported"""
+        new = self.buckets.add(vulnerability, target)
+        with self._lock:
+            if vulnerability["issue_hash"] in self._reported or \
+                    not (new or self.report_known):
+                return False
+            self._reported.add(vulnerability["issue_hash"])
+            return True
+
+    def _minimize(self, target):
+        """Minimizes the corpus of a target in the time left"""
+        if not self.corpus.due(target):
+            # minimized by an earlier submission of the same target
+            return
+        timeout = MINIMIZE_TIMEOUT
+        if self.deadline is not None:
+            timeout = min(timeout, self.deadline - time.monotonic())
+            if timeout <= 0:
+                LOGGER.info("No time left to minimize the corpus of %s",
+                            target)
+                return
+        self.corpus.minimize(target, timeout=timeout)
+
+    @staticmethod
+    def _kill(target, proc, budget):
+        """Kills a target and its workers once it exceeded its budget"""
+        LOGGER.warning("Killed %s, it exceeded its budget of %ds", target,
+                       budget)
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def run(self, targets):
+        """Runs all targets and returns the findings of all their workers"""
+        if self.total_time is not None:
+            self.deadline = time.monotonic() + self.total_time
+        LOGGER.info("Fuzzing %d targets, %d at a time with %d workers each",
+                    len(targets), self.slots, self.workers)
+        # minimizations are queued behind the targets, leaving the executor
+        # waits for them
+        with ThreadPoolExecutor(max_workers=self.slots) as executor:
+            self._executor = executor
+            results = list(executor.map(
+                lambda target: self.run_target(target, len(targets)),
+                targets))
+        self._finish()
+        return [vulnerability for result in results
+                for vulnerability in result]
+
+    def _finish(self):
+        """Adds the statistics of the stores to the status report"""
+        if self.corpus is not None:
+            self.status['corpus'] = dict(self.corpus.statistics)
+        if self.buckets is not None:
+            self.buckets.save()
+            self.status['buckets'] = self.buckets.statistics
@@ -0,0 +1,276 @@
+"""Module symbolizing the stack frames of findings offline
+
+Without debug information or with online symbolization turned off, the
+frames of a stack trace only name their module and the offset within it
+(line 0, the offset as column). The unique (module, offset) pairs of the
+findings are resolved by a single long-lived llvm-symbolizer process and
+the locations are rewritten. A frame of inlined functions is expanded into
+one frame per function, as with symbolize_inline_frames=1, hence the
+signatures of the findings match the ones of symbolized runs. The results
+are cached by the build-id of the module (or the digest of its content if it
+has none), hence a build is symbolized once, however many runs and findings
+it has. Frames stay unsymbolized if llvm-symbolizer cannot be run.
+
+Targets run with symbolization turned off (see offline_environment) start
+and report crashes considerably faster.
+"""
+import logging
+import os
+import struct
+import subprocess
+import threading
+
+from storage import JsonStore, file_digest
+
+from .buckets import crash_signature
+from .errorparser import ErrorParserStrategy
+
+LOGGER = logging.getLogger(name=__name__)
+
+SYMBOLIZER = os.environ.get("ASAN_SYMBOLIZER_PATH", "llvm-symbolizer")
+OFFLINE_OPTIONS = "symbolize=0"
+SANITIZER_OPTIONS = ("ASAN_OPTIONS", "UBSAN_OPTIONS")
+# ELF program header and note types
+PT_NOTE = 4
+NT_GNU_BUILD_ID = 3
+
+__all__ = ['build_id', 'offline_environment', 'Symbolizer']
+
+
+def offline_environment(environment=None):
+    """Returns the environment running targets without symbolization"""
+    environment = dict(os.environ if environment is None else environment)
+    for name in SANITIZER_OPTIONS:
+        environment[name] = ":".join(
+            option for option in [environment.get(name), OFFLINE_OPTIONS]
+            if option)
+    return environment
+
+
+def _notes(data, endian):
+    """Yields the (type, name, description) of the notes of a segment"""
+    position = 0
+    while position + 12 <= len(data):
+        name_size, description_size, note_type = struct.unpack_from(
+            endian + "III", data, position)
+        name_start = position + 12
+        description_start = name_start + (name_size + 3) // 4 * 4
+        position = description_start + (description_size + 3) // 4 * 4
+        yield (note_type, data[name_start:name_start + name_size],
+               data[description_start:description_start + description_size])
+
+
+def build_id(module):
+    """Returns the GNU build-id of an ELF module (None if it has none)"""
+    try:
+        with open(module, "rb") as file:
+            header = file.read(64)
+            if len(header) < 52 or header[:4] != b"\x7fELF":
+                return None
+            is_64 = header[4] == 2
+            endian = "<" if header[5] == 1 else ">"
+            if is_64:
+                (phoff,) = struct.unpack_from(endian + "Q", header, 32)
+                phentsize, phnum = struct.unpack_from(endian + "HH", header,
+                                                      54)
+            else:
+                (phoff,) = struct.unpack_from(endian + "I", header, 28)
+                phentsize, phnum = struct.unpack_from(endian + "HH", header,
+                                                      42)
+            for index in range(phnum):
+                file.seek(phoff + index * phentsize)
+                entry = file.read(phentsize)
+                if struct.unpack_from(endian + "I", entry)[0] != PT_NOTE:
+                    continue
+                if is_64:
+                    (offset,) = struct.unpack_from(endian + "Q", entry, 8)
+                    (size,) = struct.unpack_from(endian + "Q", entry, 32)
+                else:
+                    (offset,) = struct.unpack_from(endian + "I", entry, 4)
+                    (size,) = struct.unpack_from(endian + "I", entry, 16)
+                file.seek(offset)
+                for note_type, name, description in _notes(file.read(size),
+                                                           endian):
+                    if note_type == NT_GNU_BUILD_ID and \
+                            name.rstrip(b"\0") == b"GNU":
+                        return description.hex()
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+def _unsymbolized(location):
+    """Returns True for the location of a frame of an existing module"""
+    return location.get("line") == 0 and \
+        os.path.isfile(location.get("file", ""))
+
+
+def _parse_frame(function, location):
+    """Returns the frame of a function and location printed by
+    llvm-symbolizer (None if it is unknown)"""
+    parts = location.rsplit(":", 2)
+    if len(parts) != 3 or parts[0] == "??" or not parts[1].isdigit() \
+            or int(parts[1]) == 0:
+        return None
+    return {'function': "" if function == "??" else function,
+            'file': parts[0], 'line': int(parts[1]),
+            'col': int(parts[2]) if parts[2].isdigit() else 0}
+
+
+def _inline_events(event, frames):
+    """Returns the path events of the (inlined) frames of an event, the
+    outermost function first"""
+    events = []
+    for frame in reversed(frames):
+        step = dict(event, location={'file': frame['file'],
+                                     'line': frame['line'],
+                                     'col': frame['col']})
+        if frame is not frames[-1] or not event.get("message"):
+            step["message"] = frame['function']
+        events.append(step)
+    return events
+
+
+def _skip_instrumentation(vulnerability):
+    """Moves the location of a finding out of the sanitizer runtime, which
+    online symbolization skips already"""
+    path = vulnerability.get("path", [])
+    while len(path) > 1 and ErrorParserStrategy.INSTRUMENTATION_PATH in \
+            path[-1].get("location", {}).get("file", ""):
+        path.pop()
+    if path and ErrorParserStrategy.INSTRUMENTATION_PATH in \
+            vulnerability.get("location", {}).get("file", ""):
+        vulnerability["location"] = dict(path[-1]["location"])
+
+
+class Symbolizer(object):
+    """Resolves module offsets with a long-lived llvm-symbolizer process"""
+
+    def __init__(self, executable=SYMBOLIZER, cache=None):
+        """Initialization.
+
+        :param executable: llvm-symbolizer
+        :param cache: JsonStore of the frames of the modules, keyed by their
+            build-id, defaults to ci-symbol-cache in the cache directory
+        """
+        self.executable = executable
+        self.cache = JsonStore("ci-symbol-cache") if cache is None else cache
+        self.statistics = {'frames': 0, 'cached': 0, 'resolved': 0}
+        self._keys = {}
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def _key(self, module):
+        """Returns the cache key of a module"""
+        if module not in self._keys:
+            identity = build_id(module)
+            self._keys[module] = "build-id:" + identity if identity else \
+                "sha256:" + file_digest(module)
+        return self._keys[module]
+
+    def _query(self, module, offset):
+        """Returns the frames of an offset, the innermost (inlined) function
+        first (None if unknown)"""
+        if self._proc is None:
+            self._proc = subprocess.Popen(
+                [self.executable], stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                universal_newlines=True)
+        self._proc.stdin.write("{} 0x{:x}\n".format(module, offset))
+        self._proc.stdin.flush()
+        # one pair of lines per (inlined) frame, ended by an empty line
+        lines = []
+        for line in self._proc.stdout:
+            if not line.strip():
+                break
+            lines.append(line.strip())
+        if len(lines) < 2:
+            raise OSError("{} stopped answering".format(self.executable))
+        frames = [_parse_frame(lines[index], lines[index + 1])
+                  for index in range(0, len(lines) - 1, 2)]
+        if frames[0] is None:
+            LOGGER.debug("Could not symbolize %s+0x%x", module, offset)
+            return None
+        return [frame for frame in frames if frame is not None]
+
+    def resolve(self, pairs):
+        """Resolves (module, offset) pairs, the cache is asked first
+
+        :return: dict of pair -> frames, the innermost first (None if it
+            could not be resolved)
+        """
+        frames = {}
+        for module, offset in sorted(set(pairs)):
+            name = "0x{:x}".format(offset)
+            try:
+                entries = self.cache.setdefault(self._key(module), {})
+                if name in entries:
+                    self.statistics['cached'] += 1
+                else:
+                    entries[name] = self._query(module, offset)
+                    if entries[name] is not None:
+                        self.statistics['resolved'] += 1
+            except OSError as err:
+                # the remaining frames stay unsymbolized
+                LOGGER.warning("Could not symbolize %s: %s", module, err)
+                self.close()
+                break
+            frames[module, offset] = entries[name]
+        if frames:
+            self.cache.save()
+        return frames
+
+    def symbolize(self, vulnerabilities):
+        """Rewrites the unsymbolized locations of findings, their signature
+        is computed again
+
+        :return: number of frames rewritten
+        """
+        pending = []
+        for vulnerability in vulnerabilities:
+            pending += [(vulnerability, event) for event in
+                        vulnerability.get("path", []) if "location" in event]
+            pending.append((vulnerability, vulnerability))
+        pending = [(vulnerability, item) for vulnerability, item in pending
+                   if _unsymbolized(item.get("location", {}))]
+        if not pending:
+            return 0
+        with self._lock:
+            frames = self.resolve((item["location"]["file"],
+                                   item["location"]["col"])
+                                  for _, item in pending)
+            self.statistics['frames'] += len(pending)
+
+        rewritten, changed, inlined = 0, {}, {}
+        for vulnerability, item in pending:
+            location = item["location"]
+            found = frames.get((location["file"], location["col"]))
+            if not found:
+                continue
+            if item is vulnerability:
+                location.update(file=found[0]['file'], line=found[0]['line'],
+                                col=found[0]['col'])
+            else:
+                inlined[id(item)] = found
+            changed[id(vulnerability)] = vulnerability
+            rewritten += 1
+        for vulnerability in changed.values():
+            if "path" in vulnerability:
+                vulnerability["path"] = [
+                    step for event in vulnerability["path"]
+                    for step in (_inline_events(event, inlined[id(event)])
+                                 if id(event) in inlined else [event])]
+            _skip_instrumentation(vulnerability)
+            if "issue_hash" in vulnerability:
+                vulnerability["issue_hash"] = crash_signature(vulnerability)
+        return rewritten
+
+    def close(self):
+        """Stops the symbolizer process"""
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass  # the symbolizer died already
+            self._proc.wait()
+            self._proc = None
@@ -0,0 +1,186 @@
+#include <iomanip>
+#include <map>
+#include <set>
+#include <sstream>
+
+#include <clang/AST/RecursiveASTVisitor.h>
+#include <clang/Frontend/CompilerInstance.h>
+#include <clang/Frontend/FrontendPluginRegistry.h>
+
+#include "DictionaryTokensAction.h"
+#include "clangtojson.h"
+
+using namespace dictionarytokens;
+using namespace clang;
+
+static clang::FrontendPluginRegistry::Add<DictionaryTokensAction> X(
+    "dictionary-tokens", "Print the tokens of a file for fuzzing dictionaries.");
+
+/// Returns the hex encoding of bytes
+static std::string
+toHex(llvm::StringRef bytes) {
+  std::ostringstream out;
+  out << std::hex << std::setfill('0');
+  for (unsigned char c : bytes) {
+    out << std::setw(2) << static_cast<unsigned>(c);
+  }
+  return out.str();
+}
+
+class DictionaryTokensVisitor
+    : public clang::RecursiveASTVisitor<DictionaryTokensVisitor> {
+public:
+  DictionaryTokensVisitor(ASTContext &Context, llvm::StringRef InFile)
+      : Context(Context), InFile(InFile) {}
+  ~DictionaryTokensVisitor() {
+    nlohmann::json symbols = nlohmann::json::object();
+    for (auto &symbol : Tokens) {
+      // the tokens are kept dumped to drop duplicates
+      auto tokens = nlohmann::json::array();
+      for (auto &token : symbol.second) {
+        tokens.push_back(nlohmann::json::parse(token));
+      }
+      symbols[symbol.first]["tokens"] = tokens;
+      symbols[symbol.first]["references"] = References[symbol.first];
+    }
+    for (auto &symbol : References) {
+      if (!symbols.count(symbol.first)) {
+        symbols[symbol.first]["tokens"] = nlohmann::json::array();
+        symbols[symbol.first]["references"] = symbol.second;
+      }
+    }
+    llvm::outs() << nlohmann::json{{"file", InFile}, {"symbols", symbols}}
+                 << "\n";
+  }
+
+  /// Sets the symbol the tokens found in a declaration belong to
+  bool TraverseDecl(clang::Decl *D) {
+    std::string previous = Current;
+    if (auto *F = llvm::dyn_cast_or_null<FunctionDecl>(D)) {
+      if (F->hasBody()) {
+        Current = F->getQualifiedNameAsString();
+      }
+    } else if (auto *V = llvm::dyn_cast_or_null<VarDecl>(D)) {
+      if (V->hasGlobalStorage() && V->hasInit()) {
+        Current = V->getQualifiedNameAsString();
+      }
+    }
+    bool result = RecursiveASTVisitor::TraverseDecl(D);
+    Current = previous;
+    return result;
+  }
+
+  bool VisitStringLiteral(clang::StringLiteral *S) {
+    if (S->getCharByteWidth() == 1) {
+      addToken("string", toHex(S->getBytes()), S->getByteLength());
+    }
+    return true;
+  }
+
+  bool VisitCharacterLiteral(clang::CharacterLiteral *C) {
+    addToken("int", C->getValue(), 1);
+    return true;
+  }
+
+  bool VisitBinaryOperator(clang::BinaryOperator *B) {
+    if (B->isComparisonOp()) {
+      addConstant(B->getLHS(), byteWidth(B->getRHS()));
+      addConstant(B->getRHS(), byteWidth(B->getLHS()));
+    }
+    return true;
+  }
+
+  bool VisitSwitchStmt(clang::SwitchStmt *S) {
+    auto width = byteWidth(S->getCond());
+    for (auto *Case = S->getSwitchCaseList(); Case;
+         Case = Case->getNextSwitchCase()) {
+      if (auto *C = llvm::dyn_cast<CaseStmt>(Case)) {
+        addConstant(C->getLHS(), width);
+      }
+    }
+    return true;
+  }
+
+  bool VisitCallExpr(clang::CallExpr *C) {
+    if (auto *F = C->getDirectCallee()) {
+      addReference(F->getQualifiedNameAsString());
+    }
+    return true;
+  }
+
+  bool VisitDeclRefExpr(clang::DeclRefExpr *E) {
+    auto *D = E->getDecl();
+    if (auto *Enum = llvm::dyn_cast<EnumConstantDecl>(D)) {
+      addToken("int", Enum->getInitVal().getSExtValue(),
+               Context.getTypeSize(Enum->getType()) / 8);
+    } else if (auto *F = llvm::dyn_cast<FunctionDecl>(D)) {
+      addReference(F->getQualifiedNameAsString());
+    } else if (auto *V = llvm::dyn_cast<VarDecl>(D)) {
+      if (V->hasGlobalStorage()) {
+        addReference(V->getQualifiedNameAsString());
+      }
+    }
+    return true;
+  }
+
+private:
+  template<typename T>
+  void addToken(const char *kind, T value, uint64_t size) {
+    if (Current.empty()) {
+      return;
+    }
+    Tokens[Current].insert(
+        nlohmann::json{{"kind", kind}, {"value", value}, {"bytes", size}}.dump());
+  }
+
+  /// Returns the size in bytes of the type of an operand before the integer
+  /// promotions, e.g. 2 for a uint16_t compared with an int literal (0 if
+  /// the type is unknown)
+  uint64_t byteWidth(clang::Expr *E) {
+    auto type = E->IgnoreParenImpCasts()->getType();
+    if (type->isDependentType() || type->isIncompleteType()) {
+      return 0;
+    }
+    return Context.getTypeSize(type) / 8;
+  }
+
+  /// Adds an integer constant with the width of the operand it is compared
+  /// with, literals are int and the operand is promoted
+  void addConstant(clang::Expr *E, uint64_t width) {
+    E = E->IgnoreParenImpCasts();
+    llvm::APSInt value;
+    if (width == 0 || E->isValueDependent() ||
+        !E->isIntegerConstantExpr(value, Context)) {
+      return;
+    }
+    addToken("int", value.getSExtValue(), width);
+  }
+
+  void addReference(const std::string &name) {
+    if (!Current.empty() && name != Current) {
+      References[Current].insert(name);
+    }
+  }
+
+  ASTContext &Context;
+  std::string InFile;
+  std::string Current;
+  std::map<std::string, std::set<std::string>> Tokens;
+  std::map<std::string, std::set<std::string>> References;
+};
+
+void DictionaryTokensAction::EndSourceFileAction() {
+  auto &ci = getCompilerInstance();
+  auto &context = ci.getASTContext();
+
+  auto &input = getCurrentInput();
+  std::string InFile = input.getFile();
+
+  auto *unit = context.getTranslationUnitDecl();
+  {
+    DictionaryTokensVisitor visitor(context, InFile);
+    visitor.TraverseDecl(unit);
+  }
+
+  clang::ASTFrontendAction::EndSourceFileAction();
+}
@@ -0,0 +1,47 @@
+#pragma once
+
+#include "clang/AST/ASTConsumer.h"
+#include "clang/Basic/Diagnostic.h"
+#include "clang/Frontend/CompilerInstance.h"
+#include "clang/Frontend/FrontendActions.h"
+#include "clang/Tooling/Tooling.h"
+
+namespace dictionarytokens {
+
+/// Prints the tokens of a translation unit which are useful in a fuzzing
+/// dictionary as a json line:
+///
+///   {"file": <file>, "symbols": {<name>: {"tokens": [...],
+///                                         "references": [...]}}}
+///
+/// Symbols are the functions with a body and the global variables. Tokens
+/// are string and character literals (hex encoded), integer constants
+/// compared with (as wide as the compared operand before the integer
+/// promotions) and the values of the enum constants used, references are
+/// the functions called and the functions and global variables used.
+class DictionaryTokensAction : public clang::PluginASTAction {
+public:
+  DictionaryTokensAction() {}
+
+  std::unique_ptr<clang::ASTConsumer>
+  CreateASTConsumer(clang::CompilerInstance &ci, llvm::StringRef) override {
+    ci.getDiagnostics().setClient(new clang::IgnoringDiagConsumer());
+    return llvm::make_unique<clang::ASTConsumer>();
+  }
+
+  bool
+  ParseArgs(const clang::CompilerInstance &ci,
+            const std::vector<std::string> &args) override {
+    return true;
+  }
+
+protected:
+  void EndSourceFileAction() override;
+
+  clang::PluginASTAction::ActionType
+  getActionType() override {
+    return ReplaceAction;
+  }
+};
+
+}
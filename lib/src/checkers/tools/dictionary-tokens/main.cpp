@@ -0,0 +1,40 @@
+#include "llvm/Support/CommandLine.h"
+#include "llvm/Support/PrettyStackTrace.h"
+#include "llvm/Support/Signals.h"
+#include "llvm/Support/raw_ostream.h"
+
+#include <clang/Tooling/Tooling.h>
+#include <clang/Tooling/CommonOptionsParser.h>
+
+#include "DictionaryTokensAction.h"
+
+using namespace dictionarytokens;
+using namespace llvm;
+using namespace clang;
+using namespace clang::tooling;
+
+
+static cl::OptionCategory dictionaryTokensCategory{"dictionary-tokens options"};
+
+
+int
+main(int argc, char const **argv) {
+  sys::PrintStackTraceOnErrorSignal(argv[0]);
+  llvm::PrettyStackTraceProgram X(argc, argv);
+  llvm_shutdown_obj shutdown;
+
+  cl::HideUnrelatedOptions(dictionaryTokensCategory);
+
+  // the source files are required, clang 6 looks for the compilation
+  // database next to the first one unless -p is given
+  CommonOptionsParser OptionsParser(argc, argv, dictionaryTokensCategory);
+  auto &compilationDB = OptionsParser.getCompilations();
+  auto files = OptionsParser.getSourcePathList();
+
+  // one json line is printed per file
+  ClangTool tool{compilationDB, files};
+  tool.appendArgumentsAdjuster(clang::tooling::getClangStripOutputAdjuster());
+  auto frontendFactory =
+    clang::tooling::newFrontendActionFactory<DictionaryTokensAction>();
+  return tool.run(frontendFactory.get());
+}
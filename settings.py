@@ -14,8 +14,18 @@ CROSS_COMPILE_PATH = ROOT_DIR + "/cross-compile"
 SPECS_DIR = ROOT_DIR + "/config/specs"
 SA_VULNERABILITY_SCHEMA = SPECS_DIR + "/vulnerability_schema.json"
 CI_REPORT_FILE = "ci-report.json"
+CI_REPORT_STATUS_FILE = "ci-report-status.json"
+DEPENDENCY_INDEX_FILE = "ci-deps.json"
+CHECKER_PROFILE_FILE = "ci-checker-profile.json"
+RESULT_STORE_DIR = "ci-results"
+LLVM_REPORT_FILE = "ci-llvm-report.json"
 CHECKER_PATH = ROOT_DIR + "/lib/sa-checker"
+DICTIONARY_TOKENS = ROOT_DIR + "/bin/dictionary-tokens"
 FUZZING_DIR = "ci-fuzzing-targets"
+FUZZING_CORPUS_DIR = "ci-fuzzing-corpus"
+FUZZING_DICTIONARY_DIR = "ci-fuzzing-dictionaries"
+CACHE_DIR = os.environ.get(
+    "CI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ci-tools"))
 
 REQUIRED_CLANG_VERSION = "6.0"
 CLANG_REGEX = r"^clang-[2-7]\.[0-9]$"
@@ -94,10 +94,12 @@ setup(
     entry_points={
         'console_scripts': [
             'ci-vulnscan = analysis:analyze_main',
+            'ci-vulnscan-merge = analysis:merge_main',
             'ci-build = compile:build_main',
             'ci-cc = compile:compile_main',
             'ci-server = service.server:main',
-            'ci-fuzz = fuzzing.libfuzzer:run_fuzzer'
+            'ci-fuzz = fuzzing.libfuzzer:run_fuzzer',
+            'ci-fuzz-dict = fuzzing.dictionary:dictionary_main'
         ]
     },
     cmdclass=dict(build_ext=CMakeBuild),
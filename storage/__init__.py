@@ -0,0 +1,4 @@
+"""Module for results persisted between runs of the ci-tools
+"""
+from .jsonstore import JsonStore, atomic_write, file_digest
+__all__ = ['JsonStore', 'atomic_write', 'file_digest']
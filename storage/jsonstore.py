@@ -0,0 +1,70 @@
+"""A persistent dictionary stored as JSON file, used to keep results between
+runs of the ci-tools.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from settings import CACHE_DIR
+
+
+def file_digest(file, algorithm="sha256", chunk_size=1 << 16):
+    """Returns the hex digest of a file's content.
+
+    :param file: path to the file
+    :param algorithm: hashlib algorithm used for the digest
+    :param chunk_size: number of bytes read at once
+    """
+    digest = hashlib.new(algorithm)
+    with open(file, "rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write(file, content, mode="w"):
+    """Writes content to file without ever exposing a partially written file
+    to concurrent readers.
+    """
+    directory = os.path.dirname(os.path.abspath(file))
+    os.makedirs(directory, exist_ok=True)
+    handle, name = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(handle, mode) as tmp_file:
+            tmp_file.write(content)
+        os.replace(name, file)
+    except BaseException:
+        os.unlink(name)
+        raise
+
+
+class JsonStore(dict):
+    """Dictionary which is loaded from and saved to a JSON file.
+
+    A missing or corrupted file results in an empty store, since everything
+    kept in a store can be recomputed.
+    """
+
+    def __init__(self, name, directory=None):
+        """Initialization.
+
+        :param name: name of the store, used as file name
+        :param directory: where the store is kept, defaults to CACHE_DIR
+        """
+        super().__init__()
+        self.file = os.path.join(directory or CACHE_DIR, name + ".json")
+        self.reload()
+
+    def reload(self):
+        """Discards the current content and reads the file again."""
+        self.clear()
+        try:
+            with open(self.file, "r") as handle:
+                self.update(json.load(handle))
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        """Writes the store to its file atomically."""
+        atomic_write(self.file, json.dumps(self, sort_keys=True))
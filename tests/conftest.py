@@ -13,3 +13,19 @@ def fix_cwd():
     cwd = os.getcwd()
     yield cwd
     os.chdir(cwd)
+
+
+@pytest.fixture(name="script")
+def fix_script(tmpdir):
+    """Returns a function creating an executable script, e.g. a stand-in of
+    a tool or of a fuzzing target
+
+    The script is created in tmpdir unless a directory is given, values are
+    formatted into its content.
+    """
+    def create(name, content, directory=None, **values):
+        path = (directory or tmpdir).join(name)
+        path.write(content.format(**values) if values else content)
+        path.chmod(0o755)
+        return str(path)
+    return create
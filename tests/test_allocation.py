@@ -0,0 +1,60 @@
+"""Tests to test the adaptive allocation of fuzzing time"""
+from fuzzing.allocation import AdaptiveScheduler, TargetPriorities
+
+# libFuzzer stand-in finding {gain} new features per run
+FAKE_TARGET = """#!/bin/sh
+echo "#1 INITED cov: 1 ft: 1 corp: 1/1b exec/s: 0 rss: 30Mb" >&2
+echo "#9 NEW cov: 2 ft: $((1 + {gain})) corp: 2/2b exec/s: 9 rss: 30Mb" >&2
+sleep 1
+"""
+
+
+def test_choose(tmpdir):
+    """Untried targets come first, then the ones with the best reward"""
+    priorities = TargetPriorities(directory=str(tmpdir))
+    for _ in range(3):
+        priorities.record("growing", 10.0)
+        priorities.record("saturated", 0.0)
+    assert priorities.choose(["saturated", "new", "growing"], 2) == [
+        "new", "growing"]
+    priorities.save()
+
+    # earlier runs count less, hence they are explored more
+    priorities = TargetPriorities(directory=str(tmpdir))
+    assert priorities["growing"]["epochs"] == 1.5
+
+
+def test_allocate(tmpdir):
+    """The cores are split in proportion to the scores"""
+    priorities = TargetPriorities(directory=str(tmpdir))
+    assert priorities.allocate(["a", "b"], 8, 8) == {'a': 4, 'b': 4}
+    for _ in range(3):
+        priorities.record("growing", 10.0)
+        priorities.record("saturated", 0.0)
+    allocation = priorities.allocate(["saturated", "growing"], 8, 8)
+    assert allocation == {'growing': 5, 'saturated': 3}
+    assert priorities.allocate(["saturated", "growing"], 1, 8) == {
+        'growing': 8}
+    assert priorities.allocate(["saturated", "new", "growing"], 8, 2) == {
+        'new': 1, 'growing': 1}
+
+    scheduler = AdaptiveScheduler([], priorities, jobs=8, total_time=1)
+    scheduler.allocation = allocation
+    assert "-workers=5" in scheduler.command("growing", 1)
+    assert "-jobs=3" in scheduler.command("saturated", 1)
+
+
+def test_adaptive_run(tmpdir, script):
+    """Rewards are learned from the epochs and kept between runs"""
+    targets = [script("saturated", FAKE_TARGET, gain=0),
+               script("growing", FAKE_TARGET, gain=50)]
+    scheduler = AdaptiveScheduler(
+        [], TargetPriorities(directory=str(tmpdir)), epoch_time=1, jobs=1,
+        total_time=3)
+    scheduler.run(targets)
+    assert scheduler.status['epochs'][:2] == [{targets[0]: 1},
+                                              {targets[1]: 1}]
+
+    priorities = TargetPriorities(directory=str(tmpdir))
+    assert priorities["growing"]["reward"] > priorities["saturated"]["reward"]
+    assert priorities["saturated"]["reward"] == 0.0
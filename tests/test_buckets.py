@@ -0,0 +1,80 @@
+"""Tests to test the bucketing of crashes found by fuzzing"""
+import copy
+
+from fuzzing import libfuzzer
+from fuzzing.buckets import CrashIndex, crash_signature, normalize_frame
+from streams.linestream import LineStream
+
+LEAKS = """==1==ERROR: LeakSanitizer: detected memory leaks
+
+Direct leak of 2 byte(s) in 1 object(s) allocated from:
+    #0 0x5192d8 in malloc /llvm/compiler-rt/lib/asan/asan_malloc_linux.cc:88
+    #1 0x555bba in First /src/leak.c:5:12
+    #2 0x55735c in LLVMFuzzerTestOneInput /src/target.cc:7:18
+    #3 0x42fb97 in fuzzer::Fuzzer::ExecuteCallback(unsigned char const*, unsigned long) /llvm/compiler-rt/lib/fuzzer/FuzzerLoop.cpp:517
+
+Direct leak of 3 byte(s) in 1 object(s) allocated from:
+    #0 0x5192d8 in malloc /llvm/compiler-rt/lib/asan/asan_malloc_linux.cc:88
+    #1 0x555cba in Second /src/leak.c:9:12
+    #2 0x55735c in LLVMFuzzerTestOneInput /src/target.cc:8:18
+    #3 0x42fb97 in fuzzer::Fuzzer::ExecuteCallback(unsigned char const*, unsigned long) /llvm/compiler-rt/lib/fuzzer/FuzzerLoop.cpp:517
+
+Direct leak of 4 byte(s) in 2 object(s) allocated from:
+    #0 0x5192d8 in malloc /llvm/compiler-rt/lib/asan/asan_malloc_linux.cc:88
+    #1 0x555bba in First /src/leak.c:5:12
+    #2 0x55735c in LLVMFuzzerTestOneInput /src/target.cc:7:18
+    #3 0x42fb97 in fuzzer::Fuzzer::ExecuteCallback(unsigned char const*, unsigned long) /llvm/compiler-rt/lib/fuzzer/FuzzerLoop.cpp:517
+
+SUMMARY: AddressSanitizer: 9 byte(s) leaked in 4 allocation(s).
+artifact_prefix='./'; Test unit written to ./leak-8f27084b6294ddbe28dbcbf98f798730e8a79289
+"""
+
+
+def parse(log):
+    """Parses the first error of a log"""
+    content = LineStream(log.encode())
+    assert libfuzzer.get_next_error(content)
+    return libfuzzer.parse_libfuzzer(content)
+
+
+def test_leaks_merged_by_stack():
+    """Leaks in the same file with different stacks are kept apart"""
+    leaks = sorted(parse(LEAKS), key=lambda leak: leak["location"]["line"])
+    assert [leak["location"]["line"] for leak in leaks] == [5, 9]
+    assert leaks[0]["description"].startswith("6 byte(s) leaked in 3")
+    assert leaks[0]["issue_hash"] != leaks[1]["issue_hash"]
+    assert leaks[0]["test_unit"] == \
+        "./leak-8f27084b6294ddbe28dbcbf98f798730e8a79289"
+
+
+def test_normalization():
+    """Clone suffixes and template arguments do not change the bucket"""
+    assert normalize_frame({"message": "free.localalias.0"}) == "free"
+    assert normalize_frame({"message": "Parse<Map<int>>"}) == "Parse"
+    assert normalize_frame({"message": "", "location": {
+        "file": "/usr/lib/libc.so.6"}}) == "libc.so.6"
+
+    leak = parse(LEAKS)[0]
+    other_input = copy.deepcopy(leak)
+    other_input["test_unit"] = "./leak-0000"
+    other_input["path"][-1]["location"]["line"] = 42
+    assert crash_signature(leak) == crash_signature(other_input)
+    other_type = dict(leak, type="heap-use-after-free")
+    assert crash_signature(leak) != crash_signature(other_type)
+
+
+def test_known_buckets_are_counted(tmpdir):
+    """Crashes of buckets known from earlier runs are not new"""
+    leak = parse(LEAKS)[0]
+    index = CrashIndex(directory=str(tmpdir))
+    assert index.add(copy.deepcopy(leak), "target")
+    assert not index.add(copy.deepcopy(leak), "target")
+    index.save()
+
+    index = CrashIndex(directory=str(tmpdir))
+    assert not index.add(copy.deepcopy(leak), "target")
+    bucket = index[crash_signature(leak)]
+    assert bucket["count"] == 3
+    assert bucket["inputs"] == ["leak-8f27084b6294ddbe28dbcbf98f798730e8a79289"]
+    assert index.statistics["new"] == 0
+    assert index.statistics["crashes"] == 1
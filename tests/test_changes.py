@@ -0,0 +1,136 @@
+"""Tests to test the diff-scoped analysis of ci-vulnscan"""
+import glob
+import os
+import plistlib
+import subprocess
+import tempfile
+from collections import namedtuple
+
+from libscanbuild import analyze
+
+from analysis import clang_analyzer, interpret_plist_reports
+from analysis.changes import (ChangeSet, affected_compilations,
+                              filter_vulnerabilities)
+from compile import DependencyIndex
+
+Compilation = namedtuple("Compilation", ["source"])
+
+
+def git(tmpdir, *args):
+    """Runs git in tmpdir"""
+    subprocess.check_call(["git", "-c", "user.name=ci", "-c",
+                           "user.email=ci@localhost"] + list(args),
+                          cwd=str(tmpdir), stdout=subprocess.DEVNULL)
+
+
+def test_changed_lines_from_git(tmpdir):
+    """Changed lines are taken from the hunks of git diff"""
+    source = tmpdir.join("main.c")
+    source.write("".join("line {}\n".format(i) for i in range(1, 11)))
+    git(tmpdir, "init", "-q")
+    git(tmpdir, "add", "main.c")
+    git(tmpdir, "commit", "-q", "-m", "initial")
+    lines = source.read().splitlines(True)
+    lines[2] = "changed\n"
+    lines[6:8] = ["changed\n"] * 3
+    source.write("".join(lines))
+    git(tmpdir, "commit", "-q", "-am", "change")
+
+    changes = ChangeSet.from_git("HEAD~1..HEAD", cwd=str(tmpdir))
+    assert changes.files == {str(source)}
+    assert {"file": str(source), "line": 3} in changes
+    assert {"file": str(source), "line": 9} in changes
+    assert {"file": str(source), "line": 4} not in changes
+    assert {"file": str(tmpdir.join("other.c")), "line": 3} not in changes
+
+
+def test_deletions_from_git(tmpdir):
+    """Deleted lines and files are changes too"""
+    source, header = tmpdir.join("main.c"), tmpdir.join("main.h")
+    source.write("".join("line {}\n".format(i) for i in range(1, 11)))
+    header.write("int f(void);\n")
+    git(tmpdir, "init", "-q")
+    git(tmpdir, "add", "main.c", "main.h")
+    git(tmpdir, "commit", "-q", "-m", "initial")
+    lines = source.read().splitlines(True)
+    del lines[4:6]
+    source.write("".join(lines))
+    git(tmpdir, "rm", "-q", "main.h")
+    git(tmpdir, "commit", "-q", "-am", "delete")
+
+    changes = ChangeSet.from_git("HEAD~1..HEAD", cwd=str(tmpdir))
+    assert changes.files == {str(source), str(header)}
+    assert {"file": str(source), "line": 4} in changes
+    assert {"file": str(source), "line": 5} in changes
+    assert {"file": str(source), "line": 3} not in changes
+    assert {"file": str(header), "line": 1} in changes
+
+
+def test_affected_compilations(tmpdir):
+    """Changed headers select the translation units including them"""
+    index = DependencyIndex(str(tmpdir.join("ci-deps.json")))
+    header = str(tmpdir.join("fuzzme.h"))
+    index.record(str(tmpdir.join("a.c")), [header])
+    index.record(str(tmpdir.join("b.c")), [])
+    compilations = [Compilation(str(tmpdir.join(name)))
+                    for name in ["a.c", "b.c", "c.c"]]
+
+    changes = ChangeSet({header: None, str(tmpdir.join("c.c")): None})
+    assert [entry.source for entry in affected_compilations(
+        compilations, changes, index)] == [str(tmpdir.join("a.c")),
+                                           str(tmpdir.join("c.c"))]
+
+    # without dependency information a header change affects everything
+    empty = DependencyIndex(str(tmpdir.join("missing.json")))
+    assert affected_compilations(compilations, changes, empty) == compilations
+
+
+def test_filter_vulnerabilities():
+    """Findings are kept if located in or with a path through changed lines"""
+    def location(line):
+        return {"file": "/src/main.c", "line": line, "col": 1}
+
+    located = {"location": location(3), "path": []}
+    through = {"location": location(20), "path": [
+        {"kind": "control", "edges": [{"start": [location(4), location(4)],
+                                       "end": [location(20), location(20)]}]}
+    ]}
+    unrelated = {"location": location(20), "path": [
+        {"kind": "event", "location": location(21)}]}
+    changes = ChangeSet({"/src/main.c": [(3, 4)]})
+    assert filter_vulnerabilities([located, through, unrelated],
+                                  changes) == [located, through]
+
+
+def test_relative_report_files(tmpdir, monkeypatch):
+    """Files clang reports relative to the directory of the compilation are
+    matched with the changed files"""
+    build, output = tmpdir.mkdir("build"), tmpdir.mkdir("output")
+
+    def exclude(opts):
+        """Writes a report as clang does in the directory of the compilation"""
+        handle, _ = tempfile.mkstemp(prefix="report-", suffix=".plist",
+                                     dir=opts['output_dir'])
+        with os.fdopen(handle, "wb") as report:
+            plistlib.dump({'files': ["include/parser.h"],
+                           'clang_version': "clang version 6.0.0",
+                           'diagnostics': [{
+                               'location': {'file': 0, 'line': 3, 'col': 1},
+                               'path': []}]}, report)
+        return {'exit_code': 0}
+
+    monkeypatch.setattr(analyze, 'exclude', exclude)
+    monkeypatch.chdir(tmpdir)
+    clang_analyzer.run({
+        'flags': [], 'compiler': "cc", 'directory': str(build),
+        'source': "parser.c", 'clang': "clang", 'direct_args': [],
+        'excludes': [], 'force_debug': False, 'output_dir': str(output),
+        'output_format': "plist-multi-file", 'output_failures': False})
+    assert os.listdir(str(output))[0].startswith("report-")
+
+    vulnerabilities = interpret_plist_reports(
+        glob.glob(str(output.join("report-*.plist"))), validate=False)
+    changes = ChangeSet({str(build.join("include", "parser.h")): None})
+    assert len(filter_vulnerabilities(vulnerabilities, changes)) == 1
+    assert not filter_vulnerabilities(vulnerabilities, ChangeSet(
+        {str(tmpdir.join("include", "parser.h")): None}))
@@ -3,6 +3,7 @@
 import subprocess
 
 import analysis
+from analysis import clang_analyzer
 
 from settings import TEST_DIR, TEST_PROJECT_PATH_ARGS
 
@@ -21,3 +22,25 @@ def test_executable():
 def test_ci_vulnscan():
     """Tests basic ci-vulnscan functionality"""
     analysis.analyze_main(args=TEST_PROJECT_PATH_ARGS)
+
+
+def test_flag_filter():
+    """Tests filtering the compiler flags for the analyzer"""
+    flags = ['-x', 'c', '-arch', 'x86_64', '-Wall', '-Wno-unused',
+             '-march=armv7', '-std=c99', '-DFOO']
+    results = analysis.FlagListFilter(flags).results
+    assert results['language'] == 'c'
+    assert results['arch_list'] == ['x86_64']
+    assert results['flags'] == ['-Wno-unused', '-std=c99', '-DFOO']
+
+
+def test_flag_filter_cache():
+    """Entries with identical flags share the cached filter results"""
+    clang_analyzer.filter_flags.cache_clear()
+    flags = ['-Wall', '-O2', '-DFOO']
+    first, second = {'flags': list(flags)}, {'flags': list(flags)}
+    for opts in (first, second):
+        clang_analyzer.classify_parameters(opts, continuation=lambda o: o)
+    assert first['flags'] == second['flags'] == ['-O2', '-DFOO']
+    assert first['flags'] is not second['flags']
+    assert clang_analyzer.filter_flags.cache_info().hits == 1
@@ -0,0 +1,106 @@
+"""Tests to test the corpus store of the fuzzing targets"""
+import os
+import threading
+
+from fuzzing.corpus import CorpusStore
+from fuzzing.scheduling import FuzzingScheduler
+
+# libFuzzer stand-in: merging keeps the two smallest inputs, fuzzing writes
+# two inputs to the first corpus directory
+FAKE_TARGET = """#!/bin/sh
+if [ "$1" = "-merge=1" ]; then
+  for file in $(ls -S -r "$3" | head -n 2); do cp "$3/$file" "$2/"; done
+  echo "MERGE-OUTER: 2 new files with 7 new features added" >&2
+  exit 0
+fi
+for arg in "$@"; do
+  case "$arg" in
+    -*) ;;
+    *) printf a > "$arg/first"; printf b > "$arg/second"; break ;;
+  esac
+done
+"""
+# libFuzzer stand-in: merging copies the corpus and waits for a file
+SLOW_MERGE = """#!/bin/sh
+cp "$3"/* "$2/"
+touch {started}
+while [ ! -e {go} ]; do sleep 0.05; done
+"""
+
+
+def add_inputs(tmpdir, store, contents):
+    """Adds inputs with contents to the corpus of the target"""
+    new = tmpdir.mkdir("new")
+    for number, content in enumerate(contents):
+        new.join(str(number)).write(content)
+    added = store.add("target", str(new))
+    new.remove()
+    return added
+
+
+def test_deduplication(tmpdir):
+    """Inputs are kept once, named by the hash of their content"""
+    store = CorpusStore(str(tmpdir.join("store")))
+    assert add_inputs(tmpdir, store, ["x", "y", "x"]) == 2
+    assert add_inputs(tmpdir, store, ["y", "z"]) == 1
+    assert sorted(os.listdir(store.corpus("target"))) == sorted([
+        "11f6ad8ec52a2984abaafd7c3b516503785c2072",
+        "95cb0bfd2977c761298d9624e4b4d4c72a39974a",
+        "395df8f7c51f007019cb30201c49e884b46b92fa"])
+    assert store.statistics["target"]["files"] == 3
+
+
+def test_minimization(tmpdir, script):
+    """Grown corpora are merged, the gains are recorded"""
+    target = script("target", FAKE_TARGET)
+    store = CorpusStore(str(tmpdir.join("store")))
+    add_inputs(tmpdir, store, ["a", "bb", "ccc"])
+    assert store.due(target)
+
+    minimization = store.minimize(target)
+    assert (minimization['files_before'], minimization['files_after']) == \
+        (3, 2)
+    assert minimization['bytes_after'] == 3
+    statistics = CorpusStore(str(tmpdir.join("store"))).statistics["target"]
+    assert statistics['features'] == 7
+    assert statistics['added'] == 0
+    assert len(statistics['minimizations']) == 1
+    assert not store.due(target)
+
+    add_inputs(tmpdir, store, ["dddd", "eeeee"])
+    assert store.due(target)
+
+
+def test_scheduler_keeps_new_inputs(tmpdir, script):
+    """Inputs found by a run are added to the store, the stored corpus is
+    read by the next run"""
+    target = script("target", FAKE_TARGET)
+    store = CorpusStore(str(tmpdir.join("store")))
+    scheduler = FuzzingScheduler([], jobs=1, corpus=store)
+    assert scheduler.command(target, None)[-1] == store.corpus(target)
+
+    scheduler.run([target])
+    assert scheduler.status['finished'][0]['new_inputs'] == 2
+    # the new corpus was due for minimization
+    assert scheduler.status['corpus']['target']['features'] == 7
+
+
+def test_added_while_minimizing(tmpdir, script):
+    """A corpus is minimized once at a time, inputs added during the merge
+    are kept"""
+    started, released = tmpdir.join("started"), tmpdir.join("go")
+    target = script("target", SLOW_MERGE, started=started, go=released)
+    store = CorpusStore(str(tmpdir.join("store")))
+    add_inputs(tmpdir, store, ["a", "bb"])
+    minimizing = threading.Thread(target=store.minimize, args=[target])
+    minimizing.start()
+    while not started.exists():
+        minimizing.join(0.05)
+
+    assert not store.due(target)
+    assert store.minimize(target) is None
+    assert add_inputs(tmpdir, store, ["late"]) == 1
+    released.write("")
+    minimizing.join()
+    assert len(os.listdir(store.corpus(target))) == 3
+    assert store.statistics["target"]['added'] == 1
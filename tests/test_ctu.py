@@ -0,0 +1,81 @@
+"""Tests to test the preparation of the cross translation unit analysis"""
+import os
+
+from libscanbuild.compilation import Compilation
+
+from analysis.ctu import FUNC_MAP_FILE, CtuIndex, ctu_error
+from compile import DependencyIndex
+
+FAKE_CLANG = """#!/bin/sh
+while [ "$#" -gt 0 ]; do
+  if [ "$1" = "-DBROKEN" ]; then exit 1; fi
+  if [ "$1" = "-o" ]; then echo ast > "$2"; fi
+  shift
+done
+"""
+FAKE_FUNC_MAPPING = """#!/bin/sh
+echo "c:@F@$(basename "$1" .c) $1"
+echo "c:@F@shared $1"
+"""
+
+
+def test_ctu_unavailable():
+    """CTU analysis needs clang 7"""
+    assert "requires clang >= 7.0" in ctu_error("6.0.0", "clang-6.0")
+
+
+def test_ctu_index(tmpdir, monkeypatch, script):
+    """ASTs are cached, functions defined in several TUs are left out"""
+    bin_dir = tmpdir.mkdir("bin")
+    clang = script("clang-7.0", FAKE_CLANG, directory=bin_dir)
+    script("clang-func-mapping-7.0", FAKE_FUNC_MAPPING, directory=bin_dir)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    assert ctu_error("7.0.1", "clang-7.0") is None
+
+    index = DependencyIndex(str(tmpdir.join("ci-deps.json")))
+    compilations = []
+    for name in ["a.c", "b.c"]:
+        tmpdir.join(name).write("int {}(void) {{ return 0; }}\n".format(
+            name[0]))
+        index.record(str(tmpdir.join(name)), [])
+        compilations.append(Compilation('c', [], name, str(tmpdir)))
+
+    def build():
+        """Builds the CTU index of both TUs"""
+        return CtuIndex("clang-7.0", clang=clang,
+                        cache_dir=str(tmpdir.join("cache")),
+                        index=index).build(compilations, jobs=2)
+
+    ctu = build()
+    assert ctu.statistics['generated'] == 2
+    assert ctu.statistics['ast_bytes'] == 2 * len("ast\n")
+    with open(os.path.join(ctu.directory, FUNC_MAP_FILE)) as fn_map:
+        entries = sorted(line.split()[0] for line in fn_map)
+    assert entries == ["c:@F@a", "c:@F@b"]
+    assert "ctu-dir={}".format(ctu.directory) in ctu.analyzer_config
+    ctu.cleanup()
+
+    tmpdir.join("b.c").write("int b(void) { return 1; }\n")
+    ctu = build()
+    assert (ctu.statistics['generated'], ctu.statistics['cached']) == (1, 1)
+    ctu.cleanup()
+
+
+def test_ctu_configurations(tmpdir, monkeypatch, script):
+    """Every configuration of a source is indexed on its own"""
+    bin_dir = tmpdir.mkdir("bin")
+    clang = script("clang-7.0", FAKE_CLANG, directory=bin_dir)
+    script("clang-func-mapping-7.0", FAKE_FUNC_MAPPING, directory=bin_dir)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    index = DependencyIndex(str(tmpdir.join("ci-deps.json")))
+    tmpdir.join("a.c").write("int a(void) { return 0; }\n")
+    index.record(str(tmpdir.join("a.c")), [])
+    compilations = [Compilation('c', flags, "a.c", str(tmpdir))
+                    for flags in [["-DBROKEN"], [], ["-DBROKEN", "-O2"], []]]
+
+    ctu = CtuIndex("clang-7.0", clang=clang,
+                   cache_dir=str(tmpdir.join("cache")),
+                   index=index).build(compilations, jobs=2)
+    assert (ctu.statistics['generated'], ctu.statistics['failed']) == (1, 2)
+    assert list(ctu.keys.values()) == [str(tmpdir.join("a.c"))]
+    ctu.cleanup()
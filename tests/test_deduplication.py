@@ -0,0 +1,52 @@
+"""Tests to test the deduplication of clang SA diagnostics"""
+import glob
+import json
+import os
+
+import jsonschema
+
+from analysis import (IssueIndex, interpret_plist_report,
+                      interpret_plist_reports)
+from settings import TEST_DIR
+
+with open('config/specs/vulnerability_schema.json', 'r') as f:
+    SCHEMA = json.load(f)
+
+REPORTS = sorted(glob.iglob(
+    os.path.join(TEST_DIR, "scan_build_report", "report-*.plist")))
+
+
+def test_same_report_twice():
+    """The same diagnostics reported by two TUs are only kept once"""
+    once = interpret_plist_reports(REPORTS[:1])
+    twice = interpret_plist_reports(REPORTS[:1] * 2)
+    assert len(once) == len(twice)
+    assert not jsonschema.validate(twice, SCHEMA)
+
+
+def test_no_deduplication():
+    """Deduplication can be turned off"""
+    once = interpret_plist_reports(REPORTS[:1], deduplicate=False)
+    twice = interpret_plist_reports(REPORTS[:1] * 2, deduplicate=False)
+    assert len(twice) == 2 * len(once)
+
+
+def test_files_are_merged():
+    """Files of duplicated diagnostics are merged into the first one"""
+    vulnerability = interpret_plist_report(REPORTS[0])[0]
+    duplicate = dict(vulnerability, files=["header.h"])
+    index = IssueIndex([vulnerability])
+    assert not index.add(duplicate)
+    assert len(index) == 1
+    assert index.duplicates == 1
+    assert "header.h" in index.vulnerabilities[0]['files']
+
+
+def test_signature_without_hash():
+    """Diagnostics without clang's issue hash are keyed on their path"""
+    vulnerability = interpret_plist_report(REPORTS[0])[0]
+    vulnerability.pop('issue_hash_content_of_line_in_context', None)
+    index = IssueIndex([vulnerability])
+    assert vulnerability in index
+    assert not index.add(dict(vulnerability))
+    assert index.add(dict(vulnerability, path=[]))
@@ -0,0 +1,54 @@
+"""Tests to test the header dependency index"""
+from compile import DependencyIndex
+from compile.dependencies import parse_depfile
+
+DEPFILE = """fuzzme.o.bc: fuzzme.c /usr/include/stdio.h \\
+  fuzzme.h dir\\ with\\ space/a.h cost$$.h
+"""
+
+
+def test_parse_depfile():
+    """Tests parsing a make-style depfile"""
+    assert parse_depfile(DEPFILE) == ["fuzzme.c", "/usr/include/stdio.h",
+                                      "fuzzme.h", "dir with space/a.h",
+                                      "cost$.h"]
+
+
+def test_dependency_index(tmpdir):
+    """Recorded dependencies are found in the reverse index"""
+    depfile = tmpdir.join("fuzzme.o.bc.d")
+    depfile.write(DEPFILE)
+    index = DependencyIndex(str(tmpdir.join("ci-deps.json")))
+    index.record_depfile("fuzzme.c", str(depfile), cwd=str(tmpdir))
+    index.record(str(tmpdir.join("other.c")), [str(tmpdir.join("fuzzme.h"))])
+
+    header = str(tmpdir.join("fuzzme.h"))
+    assert index.including(header) == {str(tmpdir.join("fuzzme.c")),
+                                       str(tmpdir.join("other.c"))}
+    assert index.affected([str(tmpdir.join("fuzzme.c"))]) == \
+        {str(tmpdir.join("fuzzme.c"))}
+
+    # the journal is replayed and folded into the index file
+    assert DependencyIndex(index.file).including(header) == \
+        index.including(header)
+    index.compact()
+    assert not tmpdir.join("ci-deps.json.log").check()
+    compacted = DependencyIndex(index.file)
+    assert compacted.including(header) == index.including(header)
+    assert compacted.dependencies(str(tmpdir.join("other.c"))) == [header]
+
+
+def test_record_appends_only(tmpdir, monkeypatch):
+    """Recording appends to the journal without loading the index"""
+    index = DependencyIndex(str(tmpdir.join("ci-deps.json")))
+    index.record(str(tmpdir.join("a.c")), [])
+    index.compact()
+
+    def fail():
+        raise AssertionError("index loaded")
+    recorder = DependencyIndex(index.file)
+    monkeypatch.setattr(recorder, "reload", fail)
+    recorder.record(str(tmpdir.join("b.c")), [str(tmpdir.join("b.h"))])
+    assert len(tmpdir.join("ci-deps.json.log").readlines()) == 1
+    assert DependencyIndex(index.file).units == {str(tmpdir.join("a.c")),
+                                                 str(tmpdir.join("b.c"))}
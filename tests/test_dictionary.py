@@ -0,0 +1,122 @@
+"""Tests to test the generation of fuzzing dictionaries"""
+import json
+import os
+
+import pytest
+
+from fuzzing.dictionary import (encode_token, extract_units, format_entry,
+                                generate_dictionaries, measure_dictionary,
+                                merge_symbols, reachable_tokens,
+                                time_to_coverage)
+from fuzzing.scheduling import FuzzingScheduler
+from settings import DICTIONARY_TOKENS, TEST_DIR
+
+# dictionary-tokens stand-in: prints the units stored next to the sources
+FAKE_TOOL = """#!/bin/sh
+for arg in "$@"; do
+  case "$arg" in *.c|*.cc) cat "$arg.json"; echo ;; esac
+done
+"""
+# libFuzzer stand-in: reaches coverage 20 at once with a dictionary, later
+# without
+FAKE_TARGET = """#!/bin/sh
+status() {
+  echo "#$1	NEW    cov: $2 ft: $2 corp: 1/1b exec/s: 1000 rss: 30Mb" >&2
+}
+status 2 10
+case "$*" in *-dict=*) ;; *) sleep 0.5 ;; esac
+status 1000 20
+"""
+
+
+def string(value):
+    """Returns a string token"""
+    return {'kind': "string", 'value': value.encode().hex(),
+            'bytes': len(value)}
+
+
+def unit(file, symbols):
+    """Writes the output of the fake tool for a source file"""
+    with open(file + ".json", "w") as output:
+        json.dump({'file': file, 'symbols': symbols}, output)
+
+
+def test_encode_token():
+    """Integers are written in both byte orders, trivial ones dropped"""
+    assert encode_token(string("GIF89a")) == [b"GIF89a"]
+    assert not encode_token(string(""))
+    assert not encode_token(string("x" * 65))
+    assert not encode_token({'kind': "int", 'value': 3, 'bytes': 4})
+    assert encode_token({'kind': "int", 'value': 0x1234, 'bytes': 2}) == [
+        b"\x12\x34", b"\x34\x12"]
+    assert encode_token({'kind': "int", 'value': -2, 'bytes': 1}) == [
+        b"\xfe"]
+    assert format_entry(b'a"\\\x00') == '"a\\x22\\x5C\\x00"'
+
+
+def test_generate_dictionaries(tmpdir, script):
+    """The tokens of the symbols reachable from the harness are written"""
+    tool = script("tool", FAKE_TOOL)
+    source = str(tmpdir.join("parser.c"))
+    open(source, "w").close()
+    with open(str(tmpdir.join("compile_commands.json")), "w") as database:
+        json.dump([{'directory': str(tmpdir), 'file': "parser.c",
+                    'command': "cc -c parser.c"}], database)
+    unit(source, {
+        'parse': {'tokens': [string("MAGIC"),
+                             {'kind': "int", 'value': 7, 'bytes': 4}],
+                  'references': ["keywords", "memcmp"]},
+        'keywords': {'tokens': [string("END")], 'references': []},
+        'unused': {'tokens': [string("UNUSED")], 'references': []}})
+    os.makedirs(str(tmpdir.join("ci-fuzzing-targets")))
+    harness = str(tmpdir.join("ci-fuzzing-targets", "parser.cc"))
+    open(harness, "w").close()
+    unit(harness, {'LLVMFuzzerTestOneInput': {'tokens': [],
+                                              'references': ["parse"]}})
+
+    output = str(tmpdir.join("dictionaries"))
+    counts = generate_dictionaries(["parser", "missing"], str(tmpdir),
+                                   output, tool=tool)
+    assert counts == {'parser': 2}
+    with open(os.path.join(output, "parser.dict")) as dictionary:
+        assert dictionary.read() == '"END"\n"MAGIC"\n'
+
+    scheduler = FuzzingScheduler([], dictionaries=output)
+    assert "-dict=" + os.path.join(output, "parser.dict") in \
+        scheduler.command("parser", None)
+    assert not any(option.startswith("-dict=")
+                   for option in scheduler.command("missing", None))
+
+
+def test_measure_dictionary(script):
+    """The time saved to reach the coverage of the run without dictionary
+    is measured"""
+    target = script("target", FAKE_TARGET)
+    assert time_to_coverage([{'seconds': 0, 'cov': 1},
+                             {'seconds': 4, 'cov': 9}], 5) == 4
+    assert time_to_coverage([{'seconds': 0, 'cov': 1}], 5) is None
+
+    measurement = measure_dictionary(target, "parser.dict", 1)
+    assert measurement['coverage'] == 20
+    assert measurement['seconds_with'] < measurement['seconds_without']
+    assert measurement['saved'] >= 0.4
+
+
+@pytest.mark.skipif(not os.path.isfile(DICTIONARY_TOKENS),
+                    reason="dictionary-tokens is not built")
+def test_dictionary_tokens():
+    """The built tool prints the compared characters of fuzzme.c"""
+    units = extract_units([os.path.join(TEST_DIR, "fuzzme.c")],
+                          ["--", "-I" + TEST_DIR])
+    assert [os.path.basename(unit['file']) for unit in units] == ["fuzzme.c"]
+    symbols = merge_symbols(units)
+    assert set(symbols) >= {"hello", "FuzzMe"}
+    tokens = reachable_tokens(symbols, ["FuzzMe"])
+    for letter in "FUZ":
+        assert {'kind': "int", 'value': ord(letter), 'bytes': 1} in tokens
+        # the literal is compared with a byte, not with the promoted int
+        assert {'kind': "int", 'value': ord(letter), 'bytes': 4} \
+            not in tokens
+    assert {'kind': "int", 'value': ord("!"), 'bytes': 1} not in tokens
+    assert {'kind': "int", 'value': ord("!"), 'bytes': 1} in \
+        symbols["hello"]['tokens']
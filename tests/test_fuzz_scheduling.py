@@ -0,0 +1,107 @@
+"""Tests to test the scheduling of fuzzing targets"""
+import os
+
+from fuzzing.buckets import CrashIndex
+from fuzzing.scheduling import FuzzingScheduler
+
+CRASH_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "fuzzing", "fuzz-0.log")
+# libFuzzer stand-in, its workers write fuzz-<job>.log in the working dir
+FAKE_TARGET = """#!/bin/sh
+jobs=0
+for arg in "$@"; do
+  case "$arg" in
+    -jobs=*) jobs="${{arg#-jobs=}}" ;;
+    -max_total_time=*) echo "$arg" > budget ;;
+  esac
+done
+if [ "$jobs" -gt 0 ]; then
+  i=0
+  while [ "$i" -lt "$jobs" ]; do
+    cp {log} "fuzz-$i.log"
+    i=$((i + 1))
+  done
+  exit 0
+fi
+echo "#1 INITED cov: 1 ft: 1 corp: 1/1b exec/s: 0 rss: 30Mb" >&2
+case "$0" in
+  *crash*) cat {log} >&2; exit 1 ;;
+esac
+exit 0
+"""
+
+
+def test_findings_of_all_workers(script):
+    """The findings in the logs of all workers of a target are collected"""
+    crashing = script("crashing", FAKE_TARGET, log=CRASH_LOG)
+    scheduler = FuzzingScheduler([], jobs=4, workers=2, target_time=5)
+    assert scheduler.slots == 2
+    command = scheduler.command(crashing, 5)
+    assert "-workers=2" in command and "-jobs=2" in command
+
+    vulnerabilities = scheduler.run([crashing])
+    assert len(vulnerabilities) == 2
+    assert [entry['target'] for entry in scheduler.status['crashed']] == [
+        crashing]
+
+
+def test_main_process_findings(script):
+    """Crash blocks in the output of a target are reported while it runs"""
+    crashing = script("crashing", FAKE_TARGET, log=CRASH_LOG)
+    reported = []
+    scheduler = FuzzingScheduler([], jobs=1, callback=lambda target, found:
+                                 reported.append((target, len(found))))
+    vulnerabilities = scheduler.run([crashing])
+    assert len(vulnerabilities) == 1
+    assert reported == [(crashing, 1)]
+    assert scheduler.status['crashed'][0]['progress']['lines'] == 8
+
+
+def test_budgets(tmpdir, script):
+    """Targets get a share of the total budget, bounded by their own"""
+    targets = [script(name, FAKE_TARGET, log=CRASH_LOG)
+               for name in ["a", "b", "c"]]
+    scheduler = FuzzingScheduler([], jobs=2, total_time=60, target_time=20)
+    # three targets on two cores run in two rounds of 30 seconds
+    assert scheduler.budget(len(targets)) == 20
+    scheduler.target_time = None
+    assert scheduler.budget(len(targets)) == 30
+
+    assert scheduler.run(targets) == []
+    assert len(scheduler.status['finished']) == 3
+    budget = tmpdir.join("work", "a", "budget").read().strip()
+    assert budget == "-max_total_time=30"
+
+
+def test_out_of_time(script):
+    """Targets are skipped once the total budget is used up"""
+    target = script("target", FAKE_TARGET, log=CRASH_LOG)
+    scheduler = FuzzingScheduler([], jobs=1, total_time=0)
+    assert scheduler.run([target]) == []
+    assert scheduler.status['skipped'] == [target]
+
+
+def test_crashes_are_bucketed(tmpdir, script):
+    """The same crash found by several workers is reported once"""
+    crashing = script("crashing", FAKE_TARGET, log=CRASH_LOG)
+    scheduler = FuzzingScheduler([], jobs=3, workers=3,
+                                 buckets=CrashIndex(directory=str(tmpdir)))
+    assert len(scheduler.run([crashing])) == 1
+    assert scheduler.status['buckets']['crashes'] == 3
+
+    scheduler = FuzzingScheduler([], jobs=3, workers=3,
+                                 buckets=CrashIndex(directory=str(tmpdir)))
+    assert scheduler.run([crashing]) == []
+    scheduler = FuzzingScheduler([], jobs=3, workers=3, report_known=True,
+                                 buckets=CrashIndex(directory=str(tmpdir)))
+    assert len(scheduler.run([crashing])) == 1
+
+
+def test_metrics(tmpdir, script):
+    """The status lines of a target end up in its time series"""
+    target = script("target", FAKE_TARGET, log=CRASH_LOG)
+    scheduler = FuzzingScheduler([], jobs=1)
+    scheduler.run([target])
+    metrics = scheduler.status['finished'][0]['metrics']
+    assert metrics['final']['rss_mb'] == 30
+    assert len(tmpdir.join("work", "target", "metrics.csv").readlines()) == 2
@@ -66,7 +66,7 @@ def test_fuzzing_execution(is_built):
     """Test running a simple fuzzer"""
     assert is_built is True
     vulnerabilities = fuzzing.run_fuzzer(
-        args=TEST_PROJECT_PATH_ARGS + ['fuzz_target'])
+        args=TEST_PROJECT_PATH_ARGS + ['--known-crashes', 'fuzz_target'])
     assert len(vulnerabilities) == 1
 
 
@@ -120,3 +120,21 @@ def test_no_instrumentation_in_path(filename):
     for json_object in parsed_log(filename):
         path = json_object.get("path", [])
         assert not any(map(contains_instrumentation, path))
+
+
+def test_deadly_signal():
+    """A failed assertion is reported where the target asserted"""
+    json_object = parsed_log("tests/fuzzing/fuzz-9.log")[0]
+    assert json_object["type"] == "deadly-signal"
+    assert json_object["category"] == "Logic error"
+    assert json_object["location"]["file"].endswith("fuzz_target_assert.cc")
+    assert json_object["location"]["line"] == 9
+
+
+def test_out_of_memory():
+    """An allocation exceeding the malloc limit is reported at its caller"""
+    json_object = parsed_log("tests/fuzzing/fuzz-10.log")[0]
+    assert json_object["type"] == "out-of-memory"
+    assert json_object["category"] == "Memory error"
+    assert json_object["location"]["file"].endswith("grow.c")
+    assert json_object["location"]["line"] == 4
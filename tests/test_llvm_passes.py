@@ -0,0 +1,100 @@
+"""Tests to test the project-level driver of the LLVM passes"""
+from analysis.llvm_passes import (LLVMAnalyzer, find_link_info,
+                                  parse_yaml_stream)
+from storage import JsonStore
+
+FAKE_OPT = """#!/bin/sh
+for file; do :; done
+echo "$file" >> {log}
+echo "--- !ci"
+echo "- name: hardcoded password"
+echo "  file: $file"
+echo "..."
+echo "---"
+echo "- name: unsafe function"
+"""
+
+FAKE_LINK = """#!/bin/sh
+echo link >> {log}
+output="$2"
+shift 2
+cat "$@" > "$output"
+"""
+
+LINK_INFO = """{bc}:
+  archive_files: {{}}
+  libraries: {{}}
+  object_files: {objects}
+"""
+
+
+def test_parse_yaml_stream():
+    """Documents are parsed one at a time"""
+    lines = ["--- !tag\n", "- a: 1\n", "...\n", "---\n", "- b\n", "- c\n"]
+    assert list(parse_yaml_stream(lines)) == [[{'a': '1'}], ['b', 'c']]
+
+
+def test_run_project(tmpdir, monkeypatch, script):
+    """TU bitcode is analyzed in parallel, unchanged files are cached"""
+    log = tmpdir.join("opt.log")
+    monkeypatch.setattr(LLVMAnalyzer, 'OPT',
+                        script("opt", FAKE_OPT, log=log))
+
+    build = tmpdir.mkdir("build")
+    for name in ["a.o", "b.o"]:
+        build.join(name + ".bc").write(name)
+        build.join(name + ".yml").write(LINK_INFO.format(bc=name + ".bc",
+                                                         objects="[]"))
+    build.join("app.bc").write("app")
+    build.join("app.yml").write(LINK_INFO.format(
+        bc="app.bc", objects="[a.o, b.o]"))
+    assert len(find_link_info(str(tmpdir))) == 3
+
+    cache = JsonStore('llvm-results', directory=str(tmpdir))
+    analyzer = LLVMAnalyzer()
+    assert not analyzer.run_project(str(tmpdir), jobs=2, cache=cache)
+    assert sorted(log.read().split()) == [str(build.join("a.o.bc")),
+                                          str(build.join("b.o.bc"))]
+    assert len(analyzer.vulnerabilities) == 4
+
+    build.join("b.o.bc").write("changed")
+    log.remove()
+    cached = LLVMAnalyzer()
+    cached.run_project(str(tmpdir), jobs=2,
+                       cache=JsonStore('llvm-results', directory=str(tmpdir)))
+    assert log.read().split() == [str(build.join("b.o.bc"))]
+    assert len(cached.vulnerabilities) == 4
+
+
+def test_whole_program(tmpdir, monkeypatch, script):
+    """Each binary is linked once and analyzed as a whole"""
+    log = tmpdir.join("opt.log")
+    for attribute, content in [("OPT", FAKE_OPT), ("LINK", FAKE_LINK)]:
+        monkeypatch.setattr(LLVMAnalyzer, attribute,
+                            script(attribute.lower(), content, log=log))
+
+    build = tmpdir.mkdir("build")
+    for name in ["a.o", "b.o", "c.o"]:
+        build.join(name + ".bc").write(name)
+        build.join(name + ".yml").write(LINK_INFO.format(bc=name + ".bc",
+                                                         objects="[]"))
+    build.join("app.bc").write("app")
+    build.join("app.yml").write(LINK_INFO.format(
+        bc="app.bc", objects="[a.o, b.o]"))
+
+    def run():
+        """Runs the whole-program analysis"""
+        log.write("")
+        LLVMAnalyzer().run_whole_program(
+            str(tmpdir), jobs=2,
+            cache=JsonStore('llvm-results', directory=str(tmpdir)),
+            cache_dir=str(tmpdir.join("linked")))
+        return log.read().split()
+
+    first = run()
+    assert first.count("link") == 1
+    assert len(first) == 3  # one link and one opt run per binary and c.o
+    assert str(build.join("c.o.bc")) in first
+    assert run() == []
+    build.join("a.o.bc").write("changed")
+    assert run().count("link") == 1
@@ -0,0 +1,85 @@
+"""Tests to test the parsing of fuzzer output while it is written"""
+import os
+
+import pytest
+
+from fuzzing import libfuzzer
+from fuzzing.logstream import CONTEXT_LINES, CrashBlockReader, LogFollower
+from streams.linestream import LineStream
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fuzzing")
+LOG_FILES = sorted(os.path.join(LOG_DIR, name) for name in os.listdir(LOG_DIR)
+                   if name.endswith(".log"))
+
+
+def parse_whole_log(filename):
+    """Parses a log at once, as ci-fuzz did before streaming"""
+    vulnerabilities = []
+    with open(filename, "rb") as log:
+        content = LineStream(log.read())
+    while libfuzzer.get_next_error(content):
+        vulnerabilities.extend(libfuzzer.parse_libfuzzer(content))
+    return vulnerabilities
+
+
+@pytest.mark.parametrize("filename", LOG_FILES)
+def test_same_findings(filename):
+    """Streaming the log yields the findings of parsing it at once"""
+    reader = CrashBlockReader()
+    vulnerabilities = []
+    with open(filename, "rb") as log:
+        for line in log:
+            vulnerabilities.extend(reader.feed(line))
+    vulnerabilities.extend(reader.close())
+    assert vulnerabilities == parse_whole_log(filename)
+
+
+def test_progress_is_summarized():
+    """Progress lines are counted, not kept"""
+    reader = CrashBlockReader()
+    for number in range(10000):
+        line = "#{}\tNEW    cov: 1 ft: 1 corp: 1/1b exec/s: 0 rss: 30Mb\n"
+        assert not reader.feed(line.format(number).encode())
+        assert not reader.feed(b"INFO: some message\n")
+    assert reader.progress['lines'] == 10000
+    assert reader.progress['last'].startswith("#9999\t")
+    assert len(reader.context) == CONTEXT_LINES
+    assert reader.block is None
+
+
+def test_crash_reported_early():
+    """A crash block is parsed as soon as its last line is read"""
+    reader = CrashBlockReader()
+    with open(os.path.join(LOG_DIR, "fuzz-1.log"), "rb") as log:
+        lines = log.readlines()
+    found = [index for index, line in enumerate(lines)
+             if reader.feed(line)]
+    assert len(found) == 1
+    assert b"Test unit written to" in lines[found[0]]
+
+
+def test_deadly_signal_reported():
+    """Errors libFuzzer detects itself are parsed, not raised"""
+    reader = CrashBlockReader()
+    vulnerabilities = []
+    with open(os.path.join(LOG_DIR, "fuzz-9.log"), "rb") as log:
+        for line in log:
+            vulnerabilities.extend(reader.feed(line))
+    assert [vulnerability['type'] for vulnerability in vulnerabilities] == [
+        "deadly-signal"]
+    assert vulnerabilities[0]['test_unit'].startswith("./crash-")
+
+
+def test_follow_worker_logs(tmpdir):
+    """Lines are only parsed once they are complete"""
+    found = []
+    follower = LogFollower(str(tmpdir), found.extend)
+    with open(os.path.join(LOG_DIR, "fuzz-0.log"), "rb") as log:
+        content = log.read()
+    worker_log = tmpdir.join("fuzz-0.log")
+    worker_log.write_binary(content[:len(content) // 2])
+    follower.poll()
+    assert not found
+    worker_log.write_binary(content)
+    follower.stop()
+    assert len(found) == 1
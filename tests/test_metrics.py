@@ -0,0 +1,61 @@
+"""Tests to test the metrics extracted from fuzzer output"""
+from fuzzing.metrics import (FuzzerMetrics, combine_summaries,
+                             parse_status_line)
+
+LINE = "#{execs}\tNEW    cov: {cov} ft: {cov} corp: 3/{size}Kb lim: 4 " \
+    "exec/s: {exec_s} rss: {rss}Mb L: 2/3 MS: 1 ChangeBit-\n"
+
+
+def status_line(execs=1, cov=10, size=1, exec_s=1000, rss=30):
+    """Returns a libFuzzer status line"""
+    return LINE.format(execs=execs, cov=cov, size=size, exec_s=exec_s,
+                       rss=rss)
+
+
+def test_status_line():
+    """Status lines are parsed, other lines are not"""
+    assert parse_status_line(status_line(execs=42, size=2)) == {
+        'execs': 42, 'cov': 10, 'ft': 10, 'corp': 3, 'corp_bytes': 2048,
+        'exec_s': 1000, 'rss_mb': 30}
+    assert parse_status_line("#3268\tTEMP_MAX_LEN: 6 (1000 1263)") is None
+
+
+def test_series(tmpdir):
+    """Samples are thinned out, the final and peak values are kept"""
+    metrics = FuzzerMetrics(start=0.0, interval=10.0)
+    for second in range(100):
+        metrics.add(status_line(execs=second, cov=min(second, 20),
+                                rss=30 + (second % 7)), now=float(second))
+    assert len(metrics.series) == 11
+    summary = metrics.summary
+    assert summary['final']['execs'] == 99
+    assert summary['peak']['rss_mb'] == 36
+    assert summary['alerts'] == ["coverage stalled for 79s at 20"]
+
+    csv = tmpdir.join("metrics.csv")
+    metrics.write(str(csv))
+    rows = csv.read().splitlines()
+    assert rows[0].startswith("seconds,execs,cov")
+    assert rows[-1].startswith("99.0,99,20,")
+
+
+def test_alerts():
+    """Slow targets and growing memory are detected"""
+    metrics = FuzzerMetrics(start=0.0)
+    metrics.add(status_line(cov=1, exec_s=50, rss=100), now=0.0)
+    metrics.add(status_line(cov=2, exec_s=50, rss=400), now=10.0)
+    assert metrics.alerts() == ["slow: 50 exec/s",
+                                "rss grew from 100Mb to 400Mb"]
+
+
+def test_combined_workers():
+    """Throughput adds up over the workers, coverage does not"""
+    summaries = {}
+    for name, cov in [("fuzz-0", 10), ("fuzz-1", 12)]:
+        metrics = FuzzerMetrics(start=0.0)
+        metrics.add(status_line(cov=cov, exec_s=500), now=1.0)
+        summaries[name] = metrics.summary
+    combined = combine_summaries(dict(summaries, main=None))
+    assert combined['final']['exec_s'] == 1000
+    assert combined['final']['cov'] == 12
+    assert sorted(combined['processes']) == ["fuzz-0", "fuzz-1"]
@@ -0,0 +1,110 @@
+"""Tests to test the attribution of analyzer costs to checkers"""
+import argparse
+import time
+
+from analysis import profiling
+from analysis.profiling import CheckerProfile, parse_statistics
+
+STATISTICS = """===-------------------------------------------------------------------------===
+                          ... Statistics Collected ...
+===-------------------------------------------------------------------------===
+
+   120 CoreEngine       - The # of steps executed.
+     3 CoreEngine       - The # of paths explored by the analyzer.
+    17 ExprEngine       - The # of times RemoveDeadBindings is called
+""".splitlines()
+
+# (seconds, steps) of the analyzer runs by disabled checker
+COSTS = {None: (10.0, 120), 'alpha.core': (4.0, 50),
+         'ci.NetworkTaint': (9.5, 110)}
+
+
+class Compilation(object):  # pylint: disable=too-few-public-methods
+    """Entry of a compilation database"""
+
+    def __init__(self, source):
+        self.source = source
+
+    def as_dict(self):
+        """Returns the analyzer parameters of the entry"""
+        return {'source': self.source, 'flags': [], 'directory': "/",
+                'language': "c"}
+
+
+def fake_run(opts):
+    """Takes the time and steps of a run from COSTS"""
+    disabled = opts['direct_args'][-1] \
+        if '-analyzer-disable-checker' in opts['direct_args'] else None
+    seconds, steps = COSTS[disabled]
+    output = ["{} CoreEngine - The # of steps executed.".format(steps)]
+    return opts['source'], seconds, {}, {'error_output': output,
+                                         'exit_code': 0}
+
+
+def test_parse_statistics():
+    """LLVM statistics are grouped by component"""
+    statistics = parse_statistics(STATISTICS)
+    assert statistics == {
+        'CoreEngine': {'The # of steps executed.': 120,
+                       'The # of paths explored by the analyzer.': 3},
+        'ExprEngine': {'The # of times RemoveDeadBindings is called': 17}}
+    assert profiling.analyzer_steps(statistics) == 120
+
+
+def test_checker_ablation(monkeypatch):
+    """Time and steps saved by disabling a checker are attributed to it"""
+    monkeypatch.setattr(profiling, 'timed_run', fake_run)
+    monkeypatch.setattr(profiling.analyze, 'analyze_parameters',
+                        lambda args: {'direct_args': []})
+    profile = CheckerProfile(count=1)
+    profile.add("slow.c", 12.0, {'error_output': STATISTICS})
+    profile.add("fast.c", 1.0, {'error_output': STATISTICS})
+    args = argparse.Namespace(enable_checker=['ci.NetworkTaint',
+                                              'alpha.core'])
+    profile.ablate([Compilation("fast.c"), Compilation("slow.c")], args)
+
+    report = profile.report
+    assert [cost['checker'] for cost in report['checkers']] == \
+        ['alpha.core', 'ci.NetworkTaint']
+    assert report['checkers'][0] == {'checker': 'alpha.core', 'seconds': 6.0,
+                                     'steps': 70, 'units': 1}
+    assert report['statistics']['ExprEngine'] == {
+        'The # of times RemoveDeadBindings is called': 34}
+    assert report['slowest_units'][0]['source'] == "slow.c"
+    assert report['slowest_units'][0]['checkers'] == {
+        'ci.NetworkTaint': 0.5, 'alpha.core': 6.0}
+
+
+def test_ablation_limits(monkeypatch):
+    """The runs are killed after the TU budget and stop at the deadline"""
+    timeouts = []
+
+    def limited_run(opts):
+        """Times out the run without alpha.core"""
+        timeouts.append(opts['timeout'])
+        source, seconds, usage, result = fake_run(opts)
+        if opts['direct_args'][-1:] == ['alpha.core']:
+            usage = {'timed_out': True}
+        return source, seconds, usage, result
+
+    monkeypatch.setattr(profiling, 'timed_run', limited_run)
+    monkeypatch.setattr(profiling.analyze, 'analyze_parameters',
+                        lambda args: {'direct_args': []})
+    args = argparse.Namespace(enable_checker=['ci.NetworkTaint',
+                                              'alpha.core'], tu_budget=2.0)
+    profile = CheckerProfile(count=1)
+    profile.add("slow.c", 12.0, {'error_output': STATISTICS})
+    profile.ablate([Compilation("slow.c")], args,
+                   deadline=time.monotonic() + 60)
+    assert timeouts == [8.0] * 3
+    assert profile.report['complete']
+    assert [cost['checker'] for cost in profile.report['checkers']] == \
+        ['ci.NetworkTaint']
+
+    del timeouts[:]
+    profile = CheckerProfile(count=1)
+    profile.add("slow.c", 12.0, {'error_output': STATISTICS})
+    profile.ablate([Compilation("slow.c")], args, deadline=time.monotonic())
+    assert not timeouts
+    assert not profile.report['complete']
+    assert not profile.report['checkers']
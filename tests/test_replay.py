@@ -0,0 +1,66 @@
+"""Tests to test the replay of the saved inputs"""
+import os
+
+from fuzzing.buckets import CrashIndex
+from fuzzing.corpus import CorpusStore
+from fuzzing.replay import replay_targets, slow_inputs
+from fuzzing.scheduling import FuzzingScheduler
+
+CRASH_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "fuzzing", "fuzz-1.log")
+# libFuzzer stand-in: runs its inputs in order, inputs containing an X
+# crash, inputs containing an S are slow
+FAKE_TARGET = """#!/bin/sh
+for input in "$@"; do
+  case "$input" in -*) continue ;; esac
+  echo "Running: $input" >&2
+  if grep -q X "$input"; then touch crash-1; cat {log} >&2; exit 1; fi
+  if grep -q S "$input"; then ms=500; else ms=1; fi
+  echo "Executed $input in $ms ms" >&2
+done
+exit 0
+"""
+
+
+def test_replay_targets(tmpdir, script):
+    """Batches are continued after a crash, crashes are reported once"""
+    target = script("target", FAKE_TARGET, log=CRASH_LOG)
+    corpus = CorpusStore(str(tmpdir.join("corpus")))
+    directory = corpus.corpus(target)
+    for index, content in enumerate(["a", "X", "b", "S", "c", "d", "e"]):
+        with open(os.path.join(directory, str(index)), "w") as unit:
+            unit.write(content)
+    work = FuzzingScheduler.directory(target)
+    os.makedirs(work)
+    with open(os.path.join(work, "crash-1"), "w") as unit:
+        unit.write("XX")
+
+    buckets = CrashIndex(directory=str(tmpdir))
+    vulnerabilities, status = replay_targets(
+        [target], [], corpus=corpus, jobs=2, batch_size=3,
+        buckets=buckets)
+    assert len(vulnerabilities) == 1
+    assert vulnerabilities[0]["test_unit"] == os.path.join(directory, "1")
+    replayed = status["replay"][target]
+    assert (replayed["inputs"], replayed["executed"], replayed["crashes"],
+            replayed["known"]) == (8, 6, 2, 0)
+    assert replayed["slow"] == [{'input': os.path.join(directory, "3"),
+                                 'ms': 500}]
+    # the crash inputs are written into the working directory of the target
+    assert not tmpdir.join("crash-1").check()
+
+    # known buckets are counted, not reported
+    vulnerabilities, status = replay_targets(
+        [target], [], corpus=corpus, batch_size=3,
+        buckets=CrashIndex(directory=str(tmpdir)))
+    assert not vulnerabilities
+    assert status["replay"][target]["known"] == 1
+    assert status["buckets"]["new"] == 0
+
+
+def test_slow_inputs():
+    """Inputs are slow compared to the median"""
+    assert not slow_inputs({})
+    assert not slow_inputs({"a": 50, "b": 90})
+    assert slow_inputs({"a": 10, "b": 10, "c": 10, "d": 200}) == [
+        {'input': "d", 'ms': 200}]
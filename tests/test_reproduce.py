@@ -0,0 +1,53 @@
+"""Tests to test the reproduction and minimization of crashes"""
+import copy
+import os
+
+from fuzzing.logstream import CrashBlockReader
+from fuzzing.reproduce import reproduce_findings
+from fuzzing.scheduling import FuzzingScheduler
+
+CRASH_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "fuzzing", "fuzz-1.log")
+# libFuzzer stand-in: inputs containing an X crash, minimization writes X
+FAKE_TARGET = """#!/bin/sh
+for arg in "$@"; do
+  case "$arg" in
+    -exact_artifact_path=*) output="${{arg#-exact_artifact_path=}}" ;;
+    -minimize_crash=1) minimize=1 ;;
+  esac
+done
+if [ -n "$minimize" ]; then printf X > "$output"; exit 0; fi
+for input in "$@"; do :; done
+if grep -q X "$input"; then cat {log} >&2; exit 1; fi
+exit 0
+"""
+
+
+def test_reproduce_findings(script):
+    """Crashes are reproduced, minimized and reported again"""
+    target = script("target", FAKE_TARGET, log=CRASH_LOG)
+    directory = FuzzingScheduler.directory(target)
+    os.makedirs(directory)
+
+    reader = CrashBlockReader()
+    with open(CRASH_LOG, "rb") as log:
+        crash = [vulnerability for line in log
+                 for vulnerability in reader.feed(line)][0]
+    with open(os.path.join(directory, crash["test_unit"]), "w") as unit:
+        unit.write("FUZXXXX")
+    flaky = dict(copy.deepcopy(crash), test_unit="./crash-flaky")
+    with open(os.path.join(directory, "crash-flaky"), "w") as unit:
+        unit.write("FUZ")
+
+    findings = [(target, crash), (target, flaky)]
+    assert reproduce_findings(findings, [], jobs=2) == 1
+
+    reproduction = crash["reproduction"]
+    assert (reproduction["input_bytes"], reproduction["reproducer_bytes"]) \
+        == (7, 1)
+    assert crash["reproducer"] == reproduction["reproducer"]
+    with open(crash["reproducer"]) as reproducer:
+        assert reproducer.read() == "X"
+    assert reproduction["report"][0]["issue_hash"] == crash["issue_hash"]
+    assert flaky["reproduction"]["error"] == "did not crash"
+    assert "reproducer" not in flaky
@@ -0,0 +1,92 @@
+"""Tests to test the build-time analysis and its result store"""
+import json
+import os
+
+from libscanbuild.compilation import Compilation
+
+from analysis import ClangAnalyzer, ResultStore
+from analysis.clang_analyzer import (ACTIVATED_CHECKERS,
+                                     analysis_configuration, analyzer_options)
+from settings import TEST_DIR
+
+REPORT = os.path.abspath(os.path.join(TEST_DIR, "test_clang_sa_output.plist"))
+
+
+def test_inline_analysis(script):
+    """The analyzer can be reused and returns the interpreted findings"""
+    clang = script("clang", "#!/bin/sh\ncat {report}\n", report=REPORT)
+    analyzer = ClangAnalyzer([clang])
+    command = list(analyzer.cmd)
+    first = analyzer.run("a.c")
+    second = analyzer.run("b.c")
+    assert analyzer.cmd == command
+    assert len(first) == len(second) == 1
+    assert first[0]['location']['file'] == \
+        "/absolute/path/to/DateCalculation.m"
+    assert analyzer.vulnerabilities == first + second
+
+
+def test_result_store(tmpdir):
+    """Stored findings are only reused while source and headers are
+    unchanged"""
+    source, header = tmpdir.join("main.c"), tmpdir.join("main.h")
+    source.write("#include \"main.h\"\n")
+    header.write("int f(void);\n")
+    store = ResultStore(str(tmpdir.join("ci-results")))
+    store.record(str(source), [{'check_name': "core.NullDereference"}],
+                 [str(header)], flags=["-O2"])
+
+    assert ResultStore(store.directory).collect(
+        [Compilation("c", ["-O2"], str(source), str(tmpdir)),
+         Compilation("c", ["-O2"], "other.c", str(tmpdir))]) == {
+             str(source): [{'check_name': "core.NullDereference"}]}
+    assert store.fresh(str(source), ["-O0"]) is None
+    header.write("int f(int);\n")
+    assert store.fresh(str(source), ["-O2"]) is None
+
+
+def test_result_store_configuration(tmpdir):
+    """Findings of another clang, other plugins or other analyzer arguments
+    are not reused"""
+    source = tmpdir.join("main.c")
+    source.write("int main(void) { return 0; }\n")
+    configuration = {'clang': "/usr/bin/clang:6.0:1:2",
+                     'plugins': {"/lib/ci.so": "digest"},
+                     'arguments': ["-Xclang", "-analyzer-checker"]}
+    store = ResultStore(str(tmpdir.join("ci-results")), configuration)
+    store.record(str(source), [], flags=[])
+    assert store.fresh(str(source), []) == []
+    for key, value in [('clang', "/usr/bin/clang:6.0:1:3"),
+                       ('plugins', {"/lib/ci.so": "changed"}),
+                       ('arguments', ["-Xclang", "-analyzer-max-loop"])]:
+        changed = ResultStore(store.directory,
+                              dict(configuration, **{key: value}))
+        assert changed.fresh(str(source), []) is None
+
+
+def test_configuration_of_the_scan(tmpdir, monkeypatch):
+    """The findings of ci-cc are reused by the scan with the same checkers
+    and options only"""
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join("compile_commands.json").write("[]")
+    source = tmpdir.join("main.c")
+    source.write("int main(void) { return 0; }\n")
+    checkers = list(ACTIVATED_CHECKERS)
+    store = str(tmpdir.join("ci-results"))
+
+    # ci-build passes the options to ci-cc as JSON
+    options = json.loads(json.dumps(
+        ClangAnalyzer.parse_analyzer_options(["--maxloop", "8"])))
+    ResultStore(store, analysis_configuration(options)).record(
+        str(source), [{'check_name': "core.NullDereference"}], flags=[])
+
+    compilations = [Compilation("cc", [], str(source), str(tmpdir))]
+    for scan, reused in [(["--maxloop", "8"], 1), (["--maxloop", "8"], 1),
+                         (["--maxloop", "4"], 0),
+                         (["--maxloop", "8", "--enable-checker", "ci.X"], 0)]:
+        args = ClangAnalyzer.parse_args_for_analyze_build(
+            ["--from-build", "--project-path", str(tmpdir)] + scan)
+        assert args.enable_checker.count("ci.NetworkTaint") == 1
+        assert len(ResultStore(store, analysis_configuration(
+            analyzer_options(args))).collect(compilations)) == reused
+    assert ACTIVATED_CHECKERS == checkers
@@ -0,0 +1,118 @@
+"""Tests to test the scheduling of clang SA runs"""
+import os
+import subprocess
+import time
+
+from libscanbuild import analyze
+
+from analysis import scheduling
+from analysis.scheduling import (AnalyzerScheduler, MemoryDatabase,
+                                 TimingDatabase, critical_path)
+from settings import TEST_DIR
+
+
+def test_longest_first(tmpdir):
+    """Known TUs are ordered by their wall time, unknown ones by size"""
+    timings = TimingDatabase(directory=str(tmpdir))
+    timings.record("slow.c", 100.0)
+    timings.record("fast.c", 0.0)
+    unknown = os.path.join(TEST_DIR, "hardcoded_passwords.c")
+    ordered = timings.order([{'source': "fast.c"}, {'source': unknown},
+                             {'source': "slow.c"}])
+    assert [opts['source'] for opts in ordered] == ["slow.c", unknown,
+                                                    "fast.c"]
+
+
+def test_timings_persist(tmpdir):
+    """Recorded timings are available in the next run"""
+    timings = TimingDatabase(directory=str(tmpdir))
+    timings.record("file.c", 42.0)
+    timings.save()
+    assert TimingDatabase(directory=str(tmpdir)).estimate("file.c") == 42.0
+
+
+def test_critical_path():
+    """The critical path is the chain of the worker finishing last"""
+    timings = {"a.c": 10.0, "b.c": 4.0, "c.c": 3.0, "d.c": 2.0}
+    assert critical_path(timings, 2) == [("a.c", 10.0)]
+    assert critical_path(timings, 1) == sorted(
+        timings.items(), key=lambda item: item[1], reverse=True)
+
+
+def fake_analyzer(opts):
+    """Runs a command instead of the analyzer"""
+    try:
+        scheduling.run_command(['sh', '-c', opts['command']])
+        return {'error_output': [], 'exit_code': 0}
+    except subprocess.CalledProcessError as ex:
+        return {'error_output': ex.output, 'exit_code': ex.returncode}
+
+
+def test_scheduler_retries_killed(tmpdir, monkeypatch):
+    """Killed runs are retried with lower concurrency, memory is learned"""
+    monkeypatch.setattr(analyze, 'run', fake_analyzer)
+    timings = TimingDatabase(directory=str(tmpdir))
+    memory = MemoryDatabase(directory=str(tmpdir))
+    scheduler = AnalyzerScheduler(4, timings=timings, memory=memory,
+                                  poll_interval=0.01)
+    elapsed = scheduler.run([{'source': "ok.c", 'command': "true"},
+                             {'source': "killed.c", 'command': "kill -9 $$"}])
+    assert list(elapsed) == ["ok.c"]
+    assert "ok.c" in timings and "killed.c" not in timings
+    assert memory["ok.c"] > 0
+
+
+def test_scheduler_deadline(tmpdir, monkeypatch):
+    """Runs exceeding the deadline are killed, later ones are skipped"""
+    monkeypatch.setattr(analyze, 'run', fake_analyzer)
+    scheduler = AnalyzerScheduler(
+        1, timings=TimingDatabase(directory=str(tmpdir)),
+        memory=MemoryDatabase(directory=str(tmpdir)), poll_interval=0.01,
+        deadline=time.monotonic() + 0.5)
+    scheduler.run([{'source': "slow.c", 'command': "sleep 10",
+                    'direct_args': []},
+                   {'source': "next.c", 'command': "true",
+                    'direct_args': []}])
+    status = scheduler.status
+    assert not status['complete']
+    assert status['timed_out'] == ["slow.c"]
+    assert status['skipped'] == ["next.c"]
+
+
+def test_scheduler_budget(tmpdir):
+    """TUs exceeding their budget are analyzed with less effort"""
+    timings = TimingDatabase(directory=str(tmpdir))
+    timings.record("slow.c", 100.0)
+    scheduler = AnalyzerScheduler(1, timings=timings, budget=10.0)
+    opts = scheduler._limit({'source': "slow.c", 'direct_args': []})  # pylint: disable=protected-access
+    assert '-analyzer-max-loop' in opts['direct_args']
+    assert opts['timeout'] == 10.0 * scheduling.BUDGET_TIMEOUT_FACTOR
+    assert scheduler.reduced_effort == ["slow.c"]
+
+
+def test_admission_reserves_memory(tmpdir, monkeypatch):
+    """Runs which did not reach their expected peak yet keep the rest of it
+    reserved"""
+    gigabyte = 1024 * 1024 * 1024
+    monkeypatch.setattr(scheduling, 'available_memory', lambda: 4 * gigabyte)
+    memory = MemoryDatabase(directory=str(tmpdir))
+    memory.record("a.c", 2 * gigabyte)
+    memory.record("b.c", 2 * gigabyte)
+    scheduler = AnalyzerScheduler(4, timings=TimingDatabase(
+        directory=str(tmpdir)), memory=memory)
+    running = [({'source': "a.c"}, None)]
+    assert not scheduler._admit({'source': "b.c"}, running)  # pylint: disable=protected-access
+
+    scheduler._groups["a.c"] = 42  # pylint: disable=protected-access
+    monkeypatch.setattr(scheduling, 'process_group_rss',
+                        lambda: {42: 2 * gigabyte})
+    assert scheduler.reserved(running) == 0
+    assert scheduler._admit({'source': "b.c"}, running)  # pylint: disable=protected-access
+
+
+def test_peak_is_kept():
+    """A later command does not replace the peak of the analyzer"""
+    scheduling._USAGE['peak_rss'] = 1 << 40  # pylint: disable=protected-access
+    scheduling.run_command(['true'])
+    assert scheduling._USAGE['peak_rss'] == 1 << 40  # pylint: disable=protected-access
+    assert scheduling.process_group_rss()[os.getpgid(0)] > 0
@@ -0,0 +1,90 @@
+"""Tests to test sharded ci-vulnscan runs"""
+import glob
+import json
+import os
+
+import pytest
+from libscanbuild.compilation import Compilation
+
+from analysis import interpret_plist_reports, merge_main
+from analysis.sharding import parse_shard, select_shard, split_shards
+from settings import (TEST_DIR, CI_REPORT_FILE, CI_REPORT_STATUS_FILE,
+                      LLVM_REPORT_FILE)
+
+SOURCES = glob.glob(os.path.join(os.path.abspath(TEST_DIR), "*.c"))
+REPORTS = sorted(glob.iglob(
+    os.path.join(TEST_DIR, "scan_build_report", "report-*.plist")))
+
+
+def compilations():
+    """Creates compilation entries for the test sources"""
+    return [Compilation('c', [], source, os.path.dirname(source))
+            for source in SOURCES]
+
+
+def test_parse_shard():
+    """Shards are given as i/N"""
+    assert parse_shard("1/4") == (1, 4)
+    with pytest.raises(Exception):
+        parse_shard("0/4")
+    with pytest.raises(Exception):
+        parse_shard("5/4")
+
+
+def test_shards_are_stable():
+    """Every entry ends up in exactly one shard, independent of the order"""
+    shards = split_shards(compilations(), 3)
+    sources = sorted(entry.source for shard in shards for entry in shard)
+    assert sources == sorted(SOURCES)
+    reversed_shards = split_shards(list(reversed(compilations())), 3)
+    assert [[e.source for e in s] for s in shards] == \
+        [[e.source for e in s] for s in reversed_shards]
+    assert select_shard(compilations(), (2, 3)) == shards[1]
+
+
+def test_merge(tmpdir):
+    """Shard reports are merged, deduplicated and validated"""
+    vulnerabilities = interpret_plist_reports(REPORTS[:2])
+    for index in (1, 2):
+        name = "ci-report-{}-of-2.json".format(index)
+        with open(str(tmpdir.join(name)), "w") as report:
+            json.dump(vulnerabilities, report)
+    with open(str(tmpdir.join("ci-report-status-1-of-2.json")), "w") as status:
+        json.dump({'complete': False, 'skipped': ["a.c"]}, status)
+
+    output = tmpdir.join("merged")
+    assert merge_main(args=[str(tmpdir), "-o", str(output)]) == 1
+    with open(str(output.join(CI_REPORT_FILE))) as report:
+        assert len(json.load(report)) == len(vulnerabilities)
+    with open(str(output.join(CI_REPORT_STATUS_FILE))) as status:
+        assert json.load(status)['skipped'] == ["a.c"]
+
+
+def test_merge_llvm(tmpdir):
+    """The reports of the LLVM passes of the shards are merged too"""
+    finding = {'type': "Format string", 'category': "Memory error",
+               'location': {'file': "main.c", 'line': 3, 'col': 1}}
+    for index in (1, 2):
+        with open(str(tmpdir.join("ci-report-{}-of-2.json".format(index))),
+                  "w") as report:
+            json.dump([], report)
+        with open(str(tmpdir.join("ci-llvm-report-{}-of-2.json".format(
+                index))), "w") as report:
+            json.dump([dict(finding, location=dict(finding['location'],
+                                                   line=index))], report)
+
+    output = tmpdir.join("merged")
+    assert merge_main(args=[str(tmpdir), "-o", str(output)]) == 0
+    with open(str(output.join(LLVM_REPORT_FILE))) as report:
+        assert [vulnerability['location']['line']
+                for vulnerability in json.load(report)] == [1, 2]
+    with open(str(output.join(CI_REPORT_STATUS_FILE))) as status:
+        assert json.load(status)['llvm'] == {'complete': True, 'shards': 2}
+
+
+def test_merge_without_shards(tmpdir):
+    """Merging fails if there are no shard reports"""
+    with pytest.raises(SystemExit) as exit_info:
+        merge_main(args=[str(tmpdir), "-o", str(tmpdir.join("merged"))])
+    assert exit_info.value.code != 0
+    assert not tmpdir.join("merged").check()
@@ -0,0 +1,104 @@
+"""Tests to test the results persisted between runs"""
+import hashlib
+import os
+
+import pytest
+
+from analysis import clang_analyzer
+from storage import JsonStore, atomic_write, file_digest
+
+
+def test_store_round_trip(tmpdir):
+    """A saved store is read by the next run"""
+    store = JsonStore("results", directory=str(tmpdir))
+    assert not store
+    store["a.c"] = {'seconds': 1.5, 'findings': ["core.NullDereference"]}
+    store.save()
+    assert JsonStore("results", directory=str(tmpdir)) == store
+
+    store["b.c"] = {}
+    store.reload()
+    assert list(store) == ["a.c"]
+
+
+def test_store_corrupted(tmpdir):
+    """A corrupted store is empty, saving it repairs it"""
+    tmpdir.join("results.json").write('{"a.c": ')
+    store = JsonStore("results", directory=str(tmpdir))
+    assert not store
+    store["a.c"] = 1
+    store.save()
+    assert JsonStore("results", directory=str(tmpdir)) == {"a.c": 1}
+
+
+def test_atomic_write(tmpdir):
+    """The file is replaced at once, a failed write keeps the old content"""
+    file = tmpdir.join("sub", "report.json")
+    atomic_write(str(file), "old")
+    atomic_write(str(file), "new")
+    assert file.read() == "new"
+
+    with pytest.raises(TypeError):
+        atomic_write(str(file), "text", mode="wb")
+    assert file.read() == "new"
+    assert os.listdir(str(tmpdir.join("sub"))) == ["report.json"]
+
+
+def test_file_digest(tmpdir):
+    """The digest covers the whole content, however it is read"""
+    file = tmpdir.join("data")
+    content = os.urandom(1000)
+    file.write_binary(content)
+    assert file_digest(str(file)) == hashlib.sha256(content).hexdigest()
+    assert file_digest(str(file), chunk_size=7) == file_digest(str(file))
+    assert file_digest(str(file), algorithm="sha1") == \
+        hashlib.sha1(content).hexdigest()
+
+
+@pytest.fixture(name="plugins")
+def fake_plugins(tmpdir, monkeypatch):
+    """Checker plugins whose checks are counted instead of run"""
+    directory = tmpdir.mkdir("checkers")
+    for name in ("a.so", "b.so"):
+        directory.join(name).write(name)
+    checked = []
+
+    def check_plugin(plugin):
+        checked.append(os.path.basename(plugin))
+        return "broken" if plugin.endswith("b.so") else ""
+
+    identity = ["clang:6.0:1"]
+    monkeypatch.setattr(clang_analyzer, 'CHECKER_PATH', str(directory))
+    monkeypatch.setattr(clang_analyzer, 'check_plugin', check_plugin)
+    monkeypatch.setattr(clang_analyzer, 'compatible_version', lambda: True)
+    monkeypatch.setattr(clang_analyzer, 'clang_identity',
+                        lambda: identity[0])
+    monkeypatch.setattr(clang_analyzer, 'JsonStore',
+                        lambda name: JsonStore(name, directory=str(tmpdir)))
+    return directory, checked, identity
+
+
+def test_compatibility_cached(plugins):
+    """Plugins are checked once per clang binary and plugin content"""
+    directory, checked, identity = plugins
+    assert clang_analyzer.report_compatibility() == ["broken"]
+    assert sorted(checked) == ["a.so", "b.so"]
+
+    del checked[:]
+    assert clang_analyzer.report_compatibility() == ["broken"]
+    assert not checked
+
+    directory.join("a.so").write("changed")
+    assert clang_analyzer.report_compatibility() == ["broken"]
+    assert checked == ["a.so"]
+
+    del checked[:]
+    assert clang_analyzer.report_compatibility(recheck=True) == ["broken"]
+    assert sorted(checked) == ["a.so", "b.so"]
+
+    # another clang invalidates the cached results of all plugins
+    del checked[:]
+    identity[0] = "clang:6.0:2"
+    assert clang_analyzer.report_compatibility() == ["broken"]
+    assert sorted(checked) == ["a.so", "b.so"]
+    assert list(clang_analyzer.JsonStore('compatibility')) == ["clang:6.0:2"]
@@ -0,0 +1,110 @@
+"""Tests to test the offline symbolization of findings"""
+import copy
+import struct
+
+from fuzzing.buckets import crash_signature
+from fuzzing.symbolize import Symbolizer, build_id, offline_environment
+from storage import JsonStore
+
+# llvm-symbolizer stand-in, logs its start and its queries
+FAKE_SYMBOLIZER = """#!/bin/sh
+echo start >> {log}
+while read module offset; do
+  echo "$offset" >> {log}
+  case "$offset" in
+    0x100) printf "memcpy\\n/llvm/compiler-rt/lib/asan/asan.cc:22:3\\n\\n" ;;
+    0x200) printf "next\\n/src/parser.h:5:3\\nparse\\n/src/parser.c:42:7\\n\\n" ;;
+    0x300) printf "LLVMFuzzerTestOneInput\\n/src/harness.cc:10:1\\n\\n" ;;
+    *) printf "??\\n??:0:0\\n\\n" ;;
+  esac
+done
+"""
+
+
+def elf_with_build_id(identity):
+    """Returns a minimal ELF64 file with a build-id note"""
+    note = struct.pack("<III", 4, len(identity), 3) + b"GNU\0" + identity
+    header = b"\x7fELF\x02\x01\x01" + b"\0" * 25 + struct.pack("<Q", 64) + \
+        b"\0" * 14 + struct.pack("<HH", 56, 1) + b"\0" * 6
+    segment = struct.pack("<IIQQQQQQ", 4, 0, 120, 0, 0, len(note), 0, 4)
+    return header + segment + note
+
+
+def event(module, offset, message=""):
+    """Returns a path event of an unsymbolized frame"""
+    return {'kind': "event", 'message': message,
+            'location': {'file': module, 'line': 0, 'col': offset}}
+
+
+def test_build_id(tmpdir):
+    """The build-id is read from the notes of an ELF file"""
+    module = tmpdir.join("module")
+    module.write_binary(elf_with_build_id(b"\xde\xad\xbe\xef"))
+    assert build_id(str(module)) == "deadbeef"
+    module.write_binary(b"#!/bin/sh\n")
+    assert build_id(str(module)) is None
+    assert build_id(str(tmpdir.join("missing"))) is None
+    assert offline_environment({'ASAN_OPTIONS': "a=1"})['ASAN_OPTIONS'] == \
+        "a=1:symbolize=0"
+
+
+def test_symbolize(tmpdir, script):
+    """Unique frames are resolved once by one process and cached"""
+    log = tmpdir.join("queries")
+    symbolizer_path = script("llvm-symbolizer", FAKE_SYMBOLIZER, log=log)
+    module = tmpdir.join("target")
+    module.write_binary(elf_with_build_id(b"\x01\x02"))
+    module = str(module)
+
+    vulnerability = {
+        'type': "Heap-buffer-overflow", 'issue_hash': "unsymbolized",
+        'location': {'file': module, 'line': 0, 'col': 0x100},
+        'path': [event(module, 0x300, "LLVMFuzzerTestOneInput"),
+                 event(module, 0xbad), event(module, 0x200),
+                 event(module, 0x100)]}
+    duplicate = copy.deepcopy(vulnerability)
+    cache = JsonStore("ci-symbol-cache", directory=str(tmpdir))
+    symbolizer = Symbolizer(symbolizer_path, cache=cache)
+    assert symbolizer.symbolize([vulnerability]) == 4
+    assert symbolizer.symbolize([duplicate]) == 4
+    symbolizer.close()
+
+    assert vulnerability == duplicate
+    # the inlined function is the innermost frame, as in symbolized runs
+    assert vulnerability['location'] == {'file': "/src/parser.h", 'line': 5,
+                                         'col': 3}
+    assert [step['message'] for step in vulnerability['path']] == [
+        "LLVMFuzzerTestOneInput", "", "parse", "next"]
+    assert vulnerability['path'][2]['location']['line'] == 42
+    assert vulnerability['path'][1]['location']['line'] == 0
+    assert vulnerability['issue_hash'] == crash_signature(vulnerability)
+    assert log.read().split() == ["start", "0x100", "0x200", "0x300",
+                                  "0xbad"]
+    assert symbolizer.statistics == {'frames': 10, 'cached': 4,
+                                     'resolved': 3}
+
+    cached = Symbolizer(symbolizer_path, cache=JsonStore(
+        "ci-symbol-cache", directory=str(tmpdir)))
+    assert [frame['line'] for frame in cached.resolve(
+        [(module, 0x200)])[module, 0x200]] == [5, 42]
+    assert "build-id:0102" in cached.cache
+    assert len(log.read().split()) == 5
+
+
+def test_symbolizer_failure(tmpdir, script):
+    """Frames stay unsymbolized if llvm-symbolizer is missing or dies"""
+    module = tmpdir.join("target")
+    module.write_binary(elf_with_build_id(b"\x03"))
+    vulnerability = {'type': "Heap-buffer-overflow", 'issue_hash': "hash",
+                     'location': {'file': str(module), 'line': 0,
+                                  'col': 0x100},
+                     'path': [event(str(module), 0x100)]}
+    original = copy.deepcopy(vulnerability)
+    dying = script("dying-symbolizer", "#!/bin/sh\nexit 1\n")
+    for executable in [tmpdir.join("missing"), dying]:
+        symbolizer = Symbolizer(str(executable), cache=JsonStore(
+            "ci-symbol-cache", directory=str(tmpdir)))
+        assert symbolizer.symbolize([vulnerability]) == 0
+        symbolizer.close()
+        assert vulnerability == original
+        assert not symbolizer.cache.get("build-id:03")
@@ -0,0 +1,70 @@
+"""Tests to test the tiered checker scheduling"""
+import argparse
+import os
+from collections import namedtuple
+
+from analysis import tiers
+from analysis.tiers import TieredScheduler, flagged_sources, split_checkers
+from compile import DependencyIndex
+from settings import TEST_DIR
+
+Compilation = namedtuple("Compilation", ["source"])
+REPORT = os.path.join(TEST_DIR, "test_clang_sa_output.plist")
+REPORTED_FILE = "/absolute/path/to/DateCalculation.m"
+
+
+def test_split_checkers():
+    """alpha and taint checkers are expensive"""
+    assert split_checkers(['core', 'alpha.core', 'alpha', 'alphabet',
+                           'ci.NetworkTaint', 'ci.StaticString']) == \
+        (['core', 'alphabet', 'ci.StaticString'],
+         ['alpha.core', 'alpha', 'ci.NetworkTaint'])
+
+
+def test_flagged_sources(tmpdir):
+    """Files with findings and the TUs including them are flagged"""
+    index = DependencyIndex(str(tmpdir.join("ci-deps.json")))
+    index.record("/absolute/path/to/main.m", [REPORTED_FILE])
+    assert flagged_sources([REPORT], index) == {REPORTED_FILE,
+                                                "/absolute/path/to/main.m"}
+
+
+class FakeScheduler(object):  # pylint: disable=too-few-public-methods
+    """Result of a fake analyzer run"""
+    complete = True
+    status = {'complete': True, 'skipped': [], 'timed_out': [],
+              'reduced_effort': []}
+
+
+def test_tiered_scheduler(tmpdir, monkeypatch):
+    """The expensive tier only runs against flagged and allowlisted TUs"""
+    runs = []
+
+    def fake_run(compilations, args, **kwargs):
+        """Records the TUs and checkers of a tier"""
+        runs.append(([entry.source for entry in compilations],
+                     args.enable_checker, kwargs))
+        with open(REPORT, 'rb') as report:
+            tmpdir.join("report-1.plist").write_binary(report.read())
+        return FakeScheduler()
+
+    monkeypatch.setattr(tiers, 'run_analyzer_parallel', fake_run)
+    args = argparse.Namespace(output=str(tmpdir),
+                              enable_checker=['alpha.core', 'ci.NetworkTaint',
+                                              'unix'])
+    index = DependencyIndex(str(tmpdir.join("ci-deps.json")))
+    compilations = [Compilation(name) for name in
+                    [REPORTED_FILE, "/src/vendor/a.c", "/src/b.c"]]
+    scheduler = TieredScheduler(args, allowlist=["/src/b*"], index=index,
+                                deadline=None)
+    scheduler.run(compilations)
+
+    assert len(runs) == 2
+    fast, expensive = runs[0], runs[1]
+    assert fast[0] == [entry.source for entry in compilations]
+    assert fast[1] == ['unix']
+    assert 'timings' in fast[2]
+    assert expensive[0] == [REPORTED_FILE, "/src/b.c"]
+    assert expensive[1] == args.enable_checker
+    assert scheduler.complete
+    assert scheduler.status['tiers']['expensive']['units'] == 2